@@ -5,9 +5,126 @@ anaUltraScurve
 ==============
 """
 
-def fill2DScurveSummaryPlots(scurveTree, vfatHistos, vfatChanLUT, vfatHistosPanPin2=None, lutType="vfatCH", chanMasks=None, calDAC2Q_m=None, calDAC2Q_b=None):
+#: Options of the channel mask decisions that can be varied with --cutSets
+maskCutNames = [
+        "ztrim",
+        "zscore",
+        "highNoiseCut",
+        "deadChanCutLow",
+        "deadChanCutHigh",
+        "maxEffPedPercent"
+        ]
+
+def computeMasks(threshold, noise, effPed, fitValid, Nev, ztrim=4.0, zscore=3.5, highNoiseCut=1.0, deadChanCutLow=4.14E-02, deadChanCutHigh=1.09E-01, maxEffPedPercent=0.05):
+    """
+    Determines the mask and maskReason of all channels at once, returns a tuple of numpy arrays
+    (masks, maskReasons) indexed as [vfat][chan]
+    threshold         - numpy array of the scurve mean of each channel, indexed as [vfat][chan]
+    noise             - as threshold but for the scurve sigma
+    effPed            - as threshold but for the effective pedestal, i.e. the fit function at 0
+    fitValid          - as threshold but True (False) if the scurve fit succeeded (failed)
+    Nev               - as threshold but for the number of pulses, negative if the channel has no data
+    ztrim             - p value of the trim, the MAD algorithm is applied to threshold - ztrim * noise
+    zscore            - Z-Score for outlier identification in the MAD algorithm
+    highNoiseCut      - HighNoise is set if noise > highNoiseCut
+    deadChanCutLow    - DeadChannel is set if deadChanCutLow < noise < deadChanCutHigh
+    deadChanCutHigh   - see deadChanCutLow
+    maxEffPedPercent  - HighEffPed is set if effPed > maxEffPedPercent * Nev
+    """
+    from gempython.gemplotting.utils.anaInfo import MaskReason
+    from gempython.gemplotting.utils.anautilities import isOutlierMADOneSided
+    import numpy as np
+
+    threshold = np.asarray(threshold, dtype=float)
+    noise = np.asarray(noise, dtype=float)
+    effPed = np.asarray(effPed, dtype=float)
+    Nev = np.asarray(Nev, dtype=float)
+
+    # Determine outliers, the MAD is computed for each VFAT
+    trimValue = threshold - ztrim * noise
+    hot = np.array([ isOutlierMADOneSided(trimValue[vfat], thresh=zscore, rejectHighTail=False) for vfat in range(0,len(trimValue)) ], dtype=bool)
+
+    # Create reason array
+    maskReasons = np.zeros(threshold.shape, dtype=int) # Not masked
+    maskReasons[hot] |= MaskReason.HotChannel
+    maskReasons[np.logical_not(fitValid)] |= MaskReason.FitFailed
+    maskReasons[(deadChanCutLow < noise) & (noise < deadChanCutHigh)] |= MaskReason.DeadChannel
+    maskReasons[noise > highNoiseCut] |= MaskReason.HighNoise
+    maskReasons[(Nev >= 0) & (effPed > maxEffPedPercent * Nev)] |= MaskReason.HighEffPed
+
+    # DeadChannel alone does not mask the channel
+    masks = (maskReasons != MaskReason.NotMasked) * (maskReasons != MaskReason.DeadChannel)
+
+    return (masks, maskReasons)
+
+def drawBadFits(args):
     """
-    Fills 2D Scurve summary plots from scurveTree TTree
+    Draws the scurve and fit overlays of some channels of one VFAT, either as one page per channel
+    of a multi-page PDF file or as one pad per channel of a single tiled image.  Meant to be run in a
+    multiprocessing.Pool, all inputs are arrays and the ROOT objects are rebuilt by a ScanDataFitter.
+    Returns a tuple of the VFAT number and the number of drawn channels.
+
+    args is a tuple of:
+    outFileName       - physical filename of the output file, a PDF file for outFormat "pdf"
+    outFormat         - "pdf" for a multi-page PDF file or "grid" for a tiled image
+    vfat              - the VFAT under consideration
+    channels          - list of the channels to draw
+    chargeBins        - charge bin edges of the scurves of this VFAT, see ScanDataFitter.scanHistosChargeBins
+    contents          - bin contents of the scurves, one row per entry of channels
+    errors            - as contents but for the bin errors
+    results           - fit results, one row per entry of channels, see ScanDataFitter.getChannelResults()
+    calDAC2Q_m        - list of slope values for "fC = m * cal_dac + b" equation, ordered by vfat position
+    calDAC2Q_b        - as calDAC2Q_m but for intercept b
+    isVFAT3           - True if the data was acquired with VFAT3
+    """
+    from gempython.gemplotting.fitting.fitScanData import ScanDataFitter
+    from math import ceil, sqrt
+    import ROOT as r
+
+    (outFileName, outFormat, vfat, channels, chargeBins, contents, errors, results, calDAC2Q_m, calDAC2Q_b, isVFAT3) = args
+
+    r.gROOT.SetBatch(True)
+    fitter = ScanDataFitter(calDAC2Q_m=calDAC2Q_m, calDAC2Q_b=calDAC2Q_b, isVFAT3=isVFAT3)
+    fitter.scanHistosChargeBins[vfat] = chargeBins
+    fitter.scanHistosContents[vfat][channels] = contents
+    fitter.scanHistosErrors[vfat][channels] = errors
+    fitter.setChannelResults(vfat, channels, results)
+    r.gStyle.SetOptStat(1111111)
+
+    if outFormat == "pdf":
+        canvas = r.TCanvas('canv_badFits_vfat%i'%vfat, 'Bad fits of VFAT%i'%vfat, 500, 500)
+        canvas.Print("%s["%(outFileName))
+        for chan in channels:
+            canvas.Clear()
+            fitter.getHisto(vfat,chan).Draw()
+            fitter.getFunc(vfat,chan).Draw('SAME')
+            canvas.Update()
+            canvas.Print(outFileName, "Title:VFAT%i vfatCH%i"%(vfat,chan))
+            pass
+        canvas.Print("%s]"%(outFileName))
+    else:
+        nCols = int(ceil(sqrt(len(channels))))
+        nRows = int(ceil(len(channels) / float(nCols)))
+        canvas = r.TCanvas('canv_badFits_vfat%i'%vfat, 'Bad fits of VFAT%i'%vfat, 300*nCols, 300*nRows)
+        canvas.Divide(nCols,nRows)
+        for idx,chan in enumerate(channels):
+            canvas.cd(idx+1)
+            fitter.getHisto(vfat,chan).Draw()
+            fitter.getFunc(vfat,chan).Draw('SAME')
+            pass
+        canvas.Update()
+        canvas.SaveAs(outFileName)
+        pass
+    canvas.Close()
+
+    return (vfat, len(channels))
+
+def fill2DScurveSummaryPlots(scurveData, vfatHistos, vfatChanLUT, vfatHistosPanPin2=None, lutType="vfatCH", chanMasks=None, calDAC2Q_m=None, calDAC2Q_b=None):
+    """
+    Fills 2D Scurve summary plots from the content of the scurveTree TTree
+    scurveData        - structured numpy array of the scurveTree TTree, as returned by
+                        root_numpy.tree2array, with at least the vfatN, vfatCH, vcal and Nhits
+                        branches, and the calSF and isCurrentPulse branches if available
     vfatHistos        - container of histograms for each vfat where len(vfatHistos) = Total number of VFATs
                         The n^th element is a 2D histogram of Hits vs. (Strip || Chan || PanPin)
     vfatChanLUT       - Nested dictionary specifying the VFAT channel to strip and PanPin mapping;
@@ -21,10 +138,13 @@ def fill2DScurveSummaryPlots(scurveTree, vfatHistos, vfatChanLUT, vfatHistosPanP
     calDAC2Q_m        - list of slope values for "fC = m * cal_dac + b" equation, ordered by vfat position
                         if argument is None a value of 1.0 is used for all VFATs
     calDAC2Q_b        - as calDAC2Q_m but for intercept b, but a value of 0 is used if argument is None
+
+    The histograms are expected to be empty, the content of each histogram is written at once
+    with root_numpy.array2hist
     """
     from gempython.gemplotting.utils.anaInfo import dict_calSF, mappingNames
-    from gempython.gemplotting.utils.anautilities import first_index_gt
-    from math import sqrt
+    import numpy as np
+    import root_numpy as rp
 
     # Check if lutType is expected
     if lutType not in mappingNames:
@@ -48,159 +168,387 @@ def fill2DScurveSummaryPlots(scurveTree, vfatHistos, vfatChanLUT, vfatHistosPanP
                 for binY in range(1,vfatHistos[vfat].GetNbinsY()+2) ] #Include overflow
         pass
 
-    # check current pulse?
-    checkCurrentPulse = False
-    listOfBranchNames = [branch.GetName() for branch in inF.scurveTree.GetListOfBranches() ]
-    if "isCurrentPulse" in listOfBranchNames:
-        checkCurrentPulse = True
+    # Columns of the input data
+    vfatN = np.asarray(scurveData['vfatN'], dtype=int)
+    vfatCH = np.asarray(scurveData['vfatCH'], dtype=int)
+    vcal = np.asarray(scurveData['vcal'], dtype=float)
+    Nhits = np.asarray(scurveData['Nhits'], dtype=float)
+
+    # Skip masked channels
+    if chanMasks is not None:
+        notMasked = np.logical_not(np.asarray(chanMasks, dtype=bool)[vfatN,vfatCH])
+        vfatN = vfatN[notMasked]
+        vfatCH = vfatCH[notMasked]
+        vcal = vcal[notMasked]
+        Nhits = Nhits[notMasked]
         pass
 
-    # Fill Histograms
-    for event in scurveTree:
+    # Determine charge
+    charge = np.asarray(calDAC2Q_m)[vfatN]*vcal+np.asarray(calDAC2Q_b)[vfatN]
+    if "isCurrentPulse" in scurveData.dtype.names: #Potentially v3 electronics
+        isCurrentPulse = np.asarray(scurveData['isCurrentPulse'], dtype=bool)
+        calSF = np.asarray(scurveData['calSF'], dtype=int)
         if chanMasks is not None:
-            if chanMasks[event.vfatN][event.vfatCH]:
-                continue
+            isCurrentPulse = isCurrentPulse[notMasked]
+            calSF = calSF[notMasked]
+            pass
+        calSFKeys, calSFIdx = np.unique(calSF[isCurrentPulse], return_inverse=True)
+        calSFValues = np.array([ dict_calSF[calSFKey] for calSFKey in calSFKeys ], dtype=float)[calSFIdx]
+        #Q = CAL_DUR * CAL_DAC * 10nA * CAL_FS
+        charge[isCurrentPulse] = (1./ 40079000) * vcal[isCurrentPulse] * (10 * 1e-9) * calSFValues * 1e15
+        pass
+
+    # Fill Histograms
+    fillPanPin = (lutType is mappingNames[1] and vfatHistosPanPin2 is not None)
+    for vfat in np.unique(vfatN):
+        vfat = int(vfat)
+        thisVFAT = (vfatN == vfat)
 
         # Get the channel, strip, or Pan Pin
-        stripPinOrChan = vfatChanLUT[event.vfatN][lutType][event.vfatCH]
-        
-        # Determine charge
-        charge = calDAC2Q_m[event.vfatN]*event.vcal+calDAC2Q_b[event.vfatN]
-        if checkCurrentPulse: #Potentially v3 electronics
-            if event.isCurrentPulse:
-                #Q = CAL_DUR * CAL_DAC * 10nA * CAL_FS
-                charge = (1./ 40079000) * event.vcal * (10 * 1e-9) * dict_calSF[event.calSF] * 1e15
-        
-        # Determine the binY that corresponds to this charge value
-        chargeBin = first_index_gt(listOfBinEdgesY[event.vfatN], charge)-1
-
-        # Fill Summary Histogram 
-        if lutType is mappingNames[1] and vfatHistosPanPin2 is not None:
-            if (stripPinOrChan < 64):
-                vfatHistos[event.vfatN].SetBinContent(63-(stripPinOrChan+1),chargeBin,event.Nhits)
-                vfatHistos[event.vfatN].SetBinError(63-(stripPinOrChan+1),chargeBin,sqrt(event.Nhits))
-                pass
-            else:
-                vfatHistosPanPin2[event.vfatN].SetBinContent(127-(stripPinOrChan+1),chargeBin,event.Nhits)
-                vfatHistosPanPin2[event.vfatN].SetBinError(127-(stripPinOrChan+1),chargeBin,sqrt(event.Nhits))
-                pass
+        stripPinOrChan = np.asarray(vfatChanLUT[vfat][lutType], dtype=int)[vfatCH[thisVFAT]]
+
+        # Determine the binY that corresponds to this charge value,
+        # i.e. first_index_gt(listOfBinEdgesY[vfat], charge)-1
+        binEdgesY = np.asarray(listOfBinEdgesY[vfat])
+        if np.all(np.diff(binEdgesY) > 0):
+            chargeBin = np.searchsorted(binEdgesY, charge[thisVFAT], side='right')-1
+        else:
+            isGreater = binEdgesY[np.newaxis,:] > charge[thisVFAT][:,np.newaxis]
+            chargeBin = np.where(np.any(isGreater, axis=1), np.argmax(isGreater, axis=1), len(binEdgesY))-1
             pass
+
+        # Histogram, binX and selected entries of each summary histogram
+        if fillPanPin:
+            list_fills = [
+                    (vfatHistos[vfat], 63-(stripPinOrChan+1), stripPinOrChan < 64),
+                    (vfatHistosPanPin2[vfat], 127-(stripPinOrChan+1), stripPinOrChan >= 64) ]
         else:
-            vfatHistos[event.vfatN].SetBinContent(stripPinOrChan+1,chargeBin,event.Nhits)
+            list_fills = [ (vfatHistos[vfat], stripPinOrChan+1, np.ones(len(stripPinOrChan), dtype=bool)) ]
+            pass
+
+        # Fill Summary Histogram
+        for histo, binX, selected in list_fills:
+            nFilled = np.count_nonzero(selected)
+            if nFilled == 0:
+                continue
+
+            # As SetBinContent, move out of range bins to the underflow and overflow
+            nBinsX = histo.GetNbinsX()
+            nBinsY = histo.GetNbinsY()
+            globalBin = np.clip(binX[selected], 0, nBinsX+1)*(nBinsY+2) + np.clip(chargeBin[selected], 0, nBinsY+1)
+
+            # As repeated SetBinContent calls, the last entry of a bin sets its content
+            filledBins, lastEntry = np.unique(globalBin[::-1], return_index=True)
+            lastEntry = nFilled - 1 - lastEntry
+            content = np.zeros((nBinsX+2)*(nBinsY+2))
+            content[filledBins] = Nhits[thisVFAT][selected][lastEntry]
+            errors = None
+            if fillPanPin:
+                errors = np.zeros((nBinsX+2)*(nBinsY+2))
+                errors[filledBins] = np.sqrt(content[filledBins])
+                errors = errors.reshape(nBinsX+2,nBinsY+2)
+                pass
+            rp.array2hist(content.reshape(nBinsX+2,nBinsY+2), histo, errors=errors)
+
+            # Each SetBinContent call counted as an entry
+            histo.SetEntries(nFilled)
             pass
+        pass
 
     return
 
-def plotAllSCurvesOnCanvas(vfatHistos, vfatHistosPanPin2=None, obsName="scurves"):
+def plotAllSCurvesOnCanvas(vfatHistos, vfatHistosPanPin2=None, obsName="scurves", drawOpt="L", lineColor=None, lineWidth=2):
     """
     Plots all scurves for a given vfat on a TCanvas for all vfats
     vfatHistos        - container of histograms for each vfat where len(vfatHistos) = Total number of VFATs
                         The n^th element is a 2D histogram of Hits vs. (Strip || Chan || PanPin)
     vfatHistosPanPin2 - As vfatHistos but for the other side of the readout board connector if lutType is "PanPin"
     obsName           - String to append the TCanvas created for each VFAT
+    drawOpt           - Draw option of the scurves, "A" is added when drawing the TMultiGraph
+    lineColor         - Line color of the scurves, kBlue+2 if None
+    lineWidth         - Line width of the scurves
+
+    The content of each 2D histogram is read once with root_numpy.hist2array, each non-empty
+    bin in X becomes a TGraph of a single TMultiGraph per VFAT.  The TMultiGraph, which owns the
+    graphs, is owned by the canvas.
     """
+    import numpy as np
+    import root_numpy as rp
     import ROOT as r
 
+    if lineColor is None:
+        lineColor = r.kBlue+2
+
     canv_dict = {}
 
     for vfat,histo in vfatHistos.iteritems():
         canv_dict[vfat] = r.TCanvas("canv_%s_vfat%i"%(obsName,vfat),"%s from VFAT%i"%(obsName,vfat),600,600)
         canv_dict[vfat].Draw()
         canv_dict[vfat].cd()
-        for binX in range(1,histo.GetNbinsX()+1):
-            h_scurve = histo.ProjectionY("h_%s_vfat%i_bin%i"%(obsName,vfat,binX),binX,binX,"")
-            h_scurve.SetLineColor(r.kBlue+2)
-            h_scurve.SetLineWidth(2)
-            h_scurve.SetFillStyle(0)
-
-            g_scurve = r.TGraph(h_scurve)
-            if binX == 1:
-                h_scurve.Draw()
-            else:
-                h_scurve.Draw("same")
+
+        mGraph = r.TMultiGraph("mg_%s_vfat%i"%(obsName,vfat),"%s;%s;"%(histo.GetTitle(),histo.GetYaxis().GetTitle()))
+        listOfHistos = [ histo ]
+        if vfatHistosPanPin2 is not None:
+            listOfHistos.append(vfatHistosPanPin2[vfat])
+            pass
+        for thisHisto in listOfHistos:
+            content, edges = rp.hist2array(thisHisto, return_edges=True)
+            binCentersY = np.ascontiguousarray(0.5*(edges[1][1:]+edges[1][:-1]), dtype=float)
+            for binX in np.flatnonzero(content.any(axis=1)):
+                g_scurve = r.TGraph(len(binCentersY), binCentersY, np.ascontiguousarray(content[binX], dtype=float))
+                g_scurve.SetLineColor(lineColor)
+                g_scurve.SetLineWidth(lineWidth)
+                g_scurve.SetFillStyle(0)
+                r.SetOwnership(g_scurve, False) # Owned by the TMultiGraph
+                mGraph.Add(g_scurve)
+                pass
+            pass
+        if mGraph.GetListOfGraphs():
+            r.SetOwnership(mGraph, False)
+            mGraph.SetBit(r.kCanDelete) # Owned by the canvas
+            mGraph.Draw("A%s"%(drawOpt))
+            pass
         canv_dict[vfat].Update()
-    if vfatHistosPanPin2 is not None:
-        for vfat,histo in vfatHistosPanPin2.iteritems():
-            canv_dict[vfat].cd()
-            for binX in range(1,histo.GetNbinsX()+1):
-                h_scurve = histo.ProjectionY("h_%s_vfat%i_bin%i"%(obsName,vfat,binX),binX,binX,"")
-                h_scurve.SetLineColor(r.kBlue+2)
-                h_scurve.SetLineWidth(2)
-                h_scurve.SetFillStyle(0)
-                h_scurve.Draw("same")
-
-                g_scurve = r.TGraph(h_scurve)
-            canv_dict[vfat].Update()
+        pass
 
     return canv_dict
 
-if __name__ == '__main__':
-    import os
+def countMaskReasons(maskReasons):
+    """
+    Returns a dictionary with the number of channels of each VFAT having each mask reason,
+    as numpy arrays indexed by the MaskReason attribute names
+    maskReasons       - numpy array of the maskReason of each channel, indexed as [vfat][chan]
+    """
+    from gempython.gemplotting.utils.anaInfo import MaskReason
     import numpy as np
+
+    maskReasons = np.asarray(maskReasons)
+    return dict((reason, np.sum((maskReasons & getattr(MaskReason, reason)) != 0, axis=1))
+            for reason in ["HotChannel", "FitFailed", "DeadChannel", "HighNoise", "HighEffPed"])
+
+def parseCutSets(cutSets, defaults):
+    """
+    Returns a list of dictionaries, one per cut set, holding the value of each of the maskCutNames
+    cutSets           - string of cut sets separated by ";", each cut set being a "," separated list
+                        of name=value pairs, e.g. "zscore=3.0;zscore=4.0,highNoiseCut=1.5"
+    defaults          - dictionary holding the value used for cuts not given in a cut set
+    """
+    listOfCutSets = []
+    for cutSet in cutSets.split(";"):
+        cutValues = dict((cutName, defaults[cutName]) for cutName in maskCutNames)
+        for cut in cutSet.split(","):
+            if not cut.strip():
+                continue
+            cutName, cutValue = cut.split("=")
+            if cutName.strip() not in maskCutNames:
+                print "parseCutSets() - cut '%s' not supported"%(cutName.strip())
+                print "parseCutSets() - I was expecting one of the following: ", maskCutNames
+                raise LookupError
+            cutValues[cutName.strip()] = float(cutValue)
+            pass
+        listOfCutSets.append(cutValues)
+        pass
+
+    return listOfCutSets
+
+def printMaskSummary(maskReasons):
+    """
+    Prints a table with the number of channels of each VFAT having each mask reason
+    maskReasons       - numpy array of the maskReason of each channel, indexed as [vfat][chan]
+    """
+    nReasons = countMaskReasons(maskReasons)
+
+    print "| vfatN | Dead Chan | Hot Chan | Failed Fits | High Noise | High Eff Ped |"
+    print "| :---: | :-------: | :------: | :---------: | :--------: | :----------: |"
+    for vfat in range(0,len(maskReasons)):
+        print '| %i | %i | %i | %i | %i | %i |'%(
+                vfat,
+                nReasons["DeadChannel"][vfat],
+                nReasons["HotChannel"][vfat],
+                nReasons["FitFailed"][vfat],
+                nReasons["HighNoise"][vfat],
+                nReasons["HighEffPed"][vfat])
+        pass
+
+    return
+
+def remaskFitData(fitFileName, scurveFileName, outDir, listOfCutSets, isVFAT3=False):
+    """
+    Recomputes the channel masks from the fit results of a previous analysis without fitting again.
+    With a single cut set the chConfig.txt file is rewritten and the per-VFAT summary is printed;
+    with several cut sets one chConfig_cutSet<N>.txt file per cut set and a maskSummary.txt table
+    are written. The SCurveFitData.root file itself is not modified.
+    fitFileName       - SCurveFitData.root file produced by anaUltraScurve.py
+    scurveFileName    - input file of the analysis, holding the scurveTree, used for the number of pulses
+    outDir            - directory where the output files are written
+    listOfCutSets     - list of dictionaries holding the value of each of the maskCutNames, see parseCutSets()
+    isVFAT3           - True if the data was acquired with VFAT3
+    """
+    from gempython.gemplotting.utils.anaInfo import MaskReason
+    import numpy as np
+    import root_numpy as rp
     import ROOT as r
-    
-    from array import array
-    from gempython.gemplotting.utils.anautilities import get2DMapOfDetector, getEmptyPerVFATList, getMapping, isOutlierMADOneSided, parseCalFile, saveSummary, saveSummaryByiEta
-    from gempython.gemplotting.utils.anaInfo import mappingNames, MaskReason
-    from gempython.gemplotting.fitting.fitScanData import ScanDataFitter
-    from gempython.utils.nesteddict import nesteddict as ndict
-    from gempython.utils.wrappers import envCheck
-    from gempython.gemplotting.mapping.chamberInfo import chamber_iEta2VFATPos, chamber_vfatPos2iEta
 
-    from gempython.gemplotting.utils.anaoptions import parser
-    parser.add_option("-b", "--drawbad", action="store_true", dest="drawbad",
-                      help="Draw fit overlays for Chi2 > 10000", metavar="drawbad")
-    parser.add_option("--calFile", type="string", dest="calFile", default=None,
-                      help="File specifying CAL_DAC/VCAL to fC equations per VFAT",
-                      metavar="calFile")
-    parser.add_option("--extChanMapping", type="string", dest="extChanMapping", default=None,
-                      help="Physical filename of a custom, non-default, channel mapping (optional)", metavar="extChanMapping")
-    parser.add_option("-f", "--fit", action="store_true", dest="performFit",
-                      help="Fit scurves and save fit information to output TFile", metavar="performFit")
-    parser.add_option("--isVFAT3", action="store_true", dest="isVFAT3", default=False,
-                      help="Provide this argument if input data was acquired from vfat3", metavar="isVFAT3")
-    parser.add_option("--IsTrimmed", action="store_true", dest="IsTrimmed",
-                      help="If the data is from a trimmed scan, plot the value it tried aligning to", metavar="IsTrimmed")
-    parser.add_option("--zscore", type="float", dest="zscore", default=3.5,
-                      help="Z-Score for Outlier Identification in MAD Algo", metavar="zscore")
+    # Read the fit results
+    list_bNames = ['vfatN','vfatCH','vfatID','threshold','noise','ped_eff','maskReason','trimDAC']
+    if isVFAT3:
+        list_bNames.append('trimPolarity')
+        pass
+    fitFile = r.TFile(fitFileName)
+    fitData = rp.tree2array(tree=fitFile.scurveFitTree, branches=list_bNames)
+    fitFile.Close()
 
-    from optparse import OptionGroup
-    chanMaskGroup = OptionGroup(
-            parser,
-            "Options for channel mask decisions"
-            "Parameters which specify how Dead, Noisy, and High Pedestal Channels are charaterized")
-    chanMaskGroup.add_option("--maxEffPedPercent", type="float", dest="maxEffPedPercent", default=0.05,
-                      help="Percentage, Threshold for setting the HighEffPed mask reason, if channel (effPed > maxEffPedPercent * nevts) then HighEffPed is set",
-                      metavar="maxEffPedPercent")
-    chanMaskGroup.add_option("--highNoiseCut", type="float", dest="highNoiseCut", default=1.0,
-                      help="Threshold for setting the HighNoise maskReason, if channel (scurve_sigma > highNoiseCut) then HighNoise is set",
-                      metavar="highNoiseCut")
-    chanMaskGroup.add_option("--deadChanCutLow", type="float", dest="deadChanCutLow", default=4.14E-02,
-                      help="If channel (deadChanCutLow < scurve_sigma < deadChanCutHigh) then DeadChannel is set",
-                      metavar="deadChanCutLow")
-    chanMaskGroup.add_option("--deadChanCutHigh", type="float", dest="deadChanCutHigh", default=1.09E-01,
-                      help="If channel (deadChanCutHigh < scurve_sigma < deadChanCutHigh) then DeadChannel is set",
-                      metavar="deadChanCutHigh")
-    parser.add_option_group(chanMaskGroup)
+    vfatN = fitData['vfatN'].astype(int)
+    vfatCH = fitData['vfatCH'].astype(int)
+    perChannel = {}
+    for bName in ['threshold','noise','ped_eff','trimDAC','trimPolarity']:
+        if bName not in list_bNames:
+            continue
+        perChannel[bName] = np.zeros((24,128))
+        perChannel[bName][vfatN,vfatCH] = fitData[bName]
+        pass
+    vfatIDs = np.zeros(24, dtype=int)
+    vfatIDs[vfatN] = fitData['vfatID']
 
-    parser.set_defaults(outfilename="SCurveFitData.root")
-    (options, args) = parser.parse_args()
+    # The fit status is kept in maskReason, it does not depend on the cuts
+    fitValid = np.ones((24,128), dtype=bool)
+    fitValid[vfatN,vfatCH] = (fitData['maskReason'] & MaskReason.FitFailed) == 0
+
+    # Get the number of pulses of each channel from the input file
+    Nev = -np.ones((24,128))
+    scurveFile = r.TFile(scurveFileName)
+    scurveData = rp.tree2array(tree=scurveFile.scurveTree, branches=['vfatN','vfatCH','Nev'])
+    scurveFile.Close()
+    Nev[scurveData['vfatN'].astype(int),scurveData['vfatCH'].astype(int)] = scurveData['Nev']
+
+    trimPolarities = None
+    if isVFAT3:
+        trimPolarities = perChannel['trimPolarity']
+        pass
+
+    if len(listOfCutSets) == 1:
+        masks, maskReasons = computeMasks(perChannel['threshold'], perChannel['noise'], perChannel['ped_eff'], fitValid, Nev, **listOfCutSets[0])
+        printMaskSummary(maskReasons)
+        writeChConfig(outDir+'/chConfig.txt', vfatIDs, perChannel['trimDAC'], masks, maskReasons, trimPolarities)
+        return
+
+    maskSummary = open(outDir+'/maskSummary.txt','w')
+    maskSummary.write('cutSet/I:%s:nMasked/I:nHot/I:nFitFailed/I:nDead/I:nHighNoise/I:nHighEffPed/I\n'%(
+        ":".join([ "%s/F"%(cutName) for cutName in maskCutNames ])))
+    print "| cutSet | %s | Masked | Hot Chan | Failed Fits | Dead Chan | High Noise | High Eff Ped |"%(" | ".join(maskCutNames))
+    print "| :----: | %s | :----: | :------: | :---------: | :-------: | :--------: | :----------: |"%(" | ".join([ ":---:" for cutName in maskCutNames ]))
+    for idx,cutValues in enumerate(listOfCutSets):
+        masks, maskReasons = computeMasks(perChannel['threshold'], perChannel['noise'], perChannel['ped_eff'], fitValid, Nev, **cutValues)
+        writeChConfig(outDir+'/chConfig_cutSet%i.txt'%(idx), vfatIDs, perChannel['trimDAC'], masks, maskReasons, trimPolarities)
+
+        nReasons = countMaskReasons(maskReasons)
+        counts = [
+                np.count_nonzero(masks),
+                np.sum(nReasons["HotChannel"]),
+                np.sum(nReasons["FitFailed"]),
+                np.sum(nReasons["DeadChannel"]),
+                np.sum(nReasons["HighNoise"]),
+                np.sum(nReasons["HighEffPed"]) ]
+        maskSummary.write('%i\t%s\t%s\n'%(
+            idx,
+            "\t".join([ "%f"%(cutValues[cutName]) for cutName in maskCutNames ]),
+            "\t".join([ "%i"%(count) for count in counts ])))
+        print "| %i | %s | %s |"%(
+                idx,
+                " | ".join([ "%g"%(cutValues[cutName]) for cutName in maskCutNames ]),
+                " | ".join([ "%i"%(count) for count in counts ]))
+        pass
+    maskSummary.close()
+
+    return
+
+def writeChConfig(confFileName, vfatIDs, trimDACs, masks, maskReasons, trimPolarities=None):
+    """
+    Writes the channel configuration file, chConfig.txt
+    confFileName      - physical filename of the output file
+    vfatIDs           - list of the chip ID of each VFAT
+    trimDACs          - trimDAC of each channel, indexed as [vfat][chan]
+    masks             - as trimDACs but for the mask
+    maskReasons       - as trimDACs but for the maskReason
+    trimPolarities    - as trimDACs but for the trimPolarity, if given the VFAT3 format is written
+    """
+    confF = open(confFileName,'w')
+    if trimPolarities is not None:
+        confF.write('vfatN/I:vfatID/I:vfatCH/I:trimDAC/I:trimPolarity/I:mask/I:maskReason/I\n')
+        for vfat in range(0,24):
+            for chan in range(0, 128):
+                confF.write('%i\t%i\t%i\t%i\t%i\t%i\t%i\n'%(
+                    vfat,
+                    vfatIDs[vfat],
+                    chan,
+                    trimDACs[vfat][chan],
+                    trimPolarities[vfat][chan],
+                    masks[vfat][chan],
+                    maskReasons[vfat][chan]))
+    else:
+        confF.write('vfatN/I:vfatID/I:vfatCH/I:trimDAC/I:mask/I:maskReason/I\n')
+        for vfat in range(0,24):
+            for chan in range (0, 128):
+                confF.write('%i\t%i\t%i\t%i\t%i\t%i\n'%(
+                    vfat,
+                    vfatIDs[vfat],
+                    chan,
+                    trimDACs[vfat][chan],
+                    masks[vfat][chan],
+                    maskReasons[vfat][chan]))
+    confF.close()
+
+    return
+
+def anaUltraScurve(options, scurveFilename, GEBtype="long", calInfo=None, dict_mappings=None, fitPool=None):
+    """
+    Analyzes one scurve file as described by the command line options of this tool.  When several
+    files are analyzed in the same process the calibration, channel mappings and fit worker pool
+    can be given so that they are only built once.
+
+    options           - the parsed command line options of this tool, options.filename and options.GEBtype are not used
+    scurveFilename    - physical filename of the input file, the outputs are written in a directory of the same name without the ".root"
+    GEBtype           - GEB type of the detector (long/short)
+    calInfo           - the tuple returned by parseCalFile(options.calFile), parsed from options.calFile if None
+    dict_mappings     - dictionary of the channel mappings returned by getMapping, keyed by mapping filename.
+                        Mappings which are not in it are read and added to it
+    fitPool           - multiprocessing.Pool in which the VFATs are fitted, instead of a pool of options.nFitWorkers processes
+    """
+    import os
+    import numpy as np
+    import ROOT as r
     
-    print("Analyzing: '%s'"%options.filename)
-    filename = options.filename[:-5]
+    from gempython.gemplotting.utils.anautilities import get2DMapOfDetector, getEmptyPerVFATList, getMapping, parseCalFile, saveSummary, saveSummaryByiEta
+    from gempython.gemplotting.utils.anaInfo import mappingNames
+    from gempython.gemplotting.fitting.fitScanData import getScurveFileName, ScanDataFitter
+    from gempython.utils.nesteddict import nesteddict as ndict
+    from gempython.gemplotting.mapping.chamberInfo import chamber_iEta2VFATPos
+
+    print("Analyzing: '%s'"%scurveFilename)
+    filename = scurveFilename[:-5]
     os.system("mkdir " + filename)
     
     outfilename = options.outfilename
-    GEBtype = options.GEBtype
+
+    # Only recompute the channel masks
+    if options.remaskOnly:
+        listOfCutSets = [ dict((cutName, getattr(options, cutName)) for cutName in maskCutNames) ]
+        if options.cutSets is not None:
+            listOfCutSets = parseCutSets(options.cutSets, listOfCutSets[0])
+            pass
+        remaskFitData(filename+'/'+outfilename, filename+'.root', filename, listOfCutSets, isVFAT3=options.isVFAT3)
+        return
    
     # Create the output File and TTree
     outF = r.TFile(filename+'/'+outfilename, 'recreate')
     if options.performFit:
         myT = r.TTree('scurveFitTree','Tree Holding FitData')
 
-    tuple_calInfo = parseCalFile(options.calFile)
-    calDAC2Q_Slope = tuple_calInfo[0]
-    calDAC2Q_Intercept = tuple_calInfo[1]
+    if calInfo is None:
+        calInfo = parseCalFile(options.calFile)
+        pass
+    calDAC2Q_Slope = calInfo[0]
+    calDAC2Q_Intercept = calInfo[1]
     
     # Create output plot containers
     vSummaryPlots = ndict()
@@ -268,14 +616,6 @@ if __name__ == '__main__':
                     yMax_Charge)
             vSummaryPlotsNoMaskedChanPanPin2[vfat].GetYaxis().SetTitleOffset(1.5)
             pass
-        for chan in range (0,128):
-            vthr_list[vfat].append(0)
-            trim_list[vfat].append(0)
-            if options.isVFAT3:
-                trimPolarity_list[vfat].append(0)
-            else:
-                trimRange_list[vfat].append(0)
-            pass
         pass
     
     # Determine chan, strip or panpin indep var
@@ -285,17 +625,28 @@ if __name__ == '__main__':
     elif options.PanPin:
         stripChanOrPinType = mappingNames[1]
 
-    # Build the channel to strip mapping from the text file
+    # Build the channel to strip mapping from the text file, unless already read for another input
     import pkg_resources
     MAPPING_PATH = pkg_resources.resource_filename('gempython.gemplotting', 'mapping/')
 
-    dict_vfatChanLUT = ndict()
+    mappingFileName = None
     if options.extChanMapping is not None:
-        dict_vfatChanLUT = getMapping(options.extChanMapping)
+        mappingFileName = options.extChanMapping
     elif GEBtype == 'long':
-        dict_vfatChanLUT = getMapping(MAPPING_PATH+'/longChannelMap.txt')
+        mappingFileName = MAPPING_PATH+'/longChannelMap.txt'
     if GEBtype == 'short':
-        dict_vfatChanLUT = getMapping(MAPPING_PATH+'/shortChannelMap.txt')
+        mappingFileName = MAPPING_PATH+'/shortChannelMap.txt'
+
+    dict_vfatChanLUT = ndict()
+    if mappingFileName is not None:
+        if dict_mappings is None:
+            dict_mappings = {}
+            pass
+        if mappingFileName not in dict_mappings:
+            dict_mappings[mappingFileName] = getMapping(mappingFileName)
+            pass
+        dict_vfatChanLUT = dict_mappings[mappingFileName]
+        pass
    
     # Open the input ROOT File
     inF = r.TFile(filename+'.root')
@@ -305,47 +656,88 @@ if __name__ == '__main__':
         fitter = ScanDataFitter(
                 calDAC2Q_m=calDAC2Q_Slope, 
                 calDAC2Q_b=calDAC2Q_Intercept,
-                isVFAT3=options.isVFAT3
+                isVFAT3=options.isVFAT3,
+                fitMode=options.fitMode,
+                probitMaxChi2NDF=options.probitMaxChi2NDF,
+                fitROI=options.fitROI,
+                roiMargin=options.roiMargin
                 )
         pass
 
+    # Read the needed branches of the input TTree in a single pass
+    import root_numpy as rp
+    listOfBranches = [ branch.GetName() for branch in inF.scurveTree.GetListOfBranches() ]
+    list_bNames = ['vfatN','vfatCH','vcal','Nhits','Nev','trimDAC']
+    if "vthr" in listOfBranches: #v3 electronics behavior
+        list_bNames.append('vthr')
+    else: #v2b electronics behavior
+        list_bNames.extend(['vth1','vth2'])
+        pass
+    if options.isVFAT3:
+        list_bNames.append('trimPolarity')
+    else:
+        list_bNames.append('trimRange')
+        pass
+    if 'vfatID' in listOfBranches:
+        list_bNames.append('vfatID')
+        pass
+    if "isCurrentPulse" in listOfBranches:
+        list_bNames.extend(['calSF','isCurrentPulse'])
+        pass
+    scurveData = rp.tree2array(tree=inF.scurveTree, branches=list_bNames)
+    scurveDataVFATN = scurveData['vfatN'].astype(int)
+    scurveDataChan = 128*scurveDataVFATN + scurveData['vfatCH'].astype(int)
+
     # Get some of the operational settings of the ASIC
-    # Refactor this using root_numpy???
-    dict_vfatID = dict((vfat, 0) for vfat in range(0,24))
-    listOfBranches = inF.scurveTree.GetListOfBranches()
+    # As when looping over the TTree, the last entry of a channel sets its value
+    if "vthr" in listOfBranches: #v3 electronics behavior
+        vthrData = scurveData['vthr']
+    else: #v2b electronics behavior
+        vthrData = np.abs(scurveData['vth2'].astype(int) - scurveData['vth1'].astype(int))
+        pass
+    list_settings = [ (vthr_list, vthrData), (trim_list, scurveData['trimDAC']) ]
+    if options.isVFAT3:
+        list_settings.append((trimPolarity_list, scurveData['trimPolarity']))
+    else:
+        list_settings.append((trimRange_list, scurveData['trimRange']))
+        pass
+    lastChan, lastEntry = np.unique(scurveDataChan[::-1], return_index=True)
+    lastEntry = len(scurveDataChan) - 1 - lastEntry
+    for settingList, settingData in list_settings:
+        allValues = np.zeros(3072, dtype=int)
+        allValues[lastChan] = settingData[lastEntry]
+        for vfat in range(0,24):
+            settingList[vfat] = allValues[(vfat*128):((vfat+1)*128)].tolist()
+            pass
+        pass
+
+    # store event count
     nPulses = -1
-    for event in inF.scurveTree:
-        if "vthr" in listOfBranches: #v3 electronics behavior
-            vthr_list[event.vfatN][event.vfatCH] = event.vthr
-        else: #v2b electronics behavior
-            vthr_list[event.vfatN][event.vfatCH] = abs(event.vth2 - event.vth1)
+    if len(scurveData) > 0:
+        nPulses = int(scurveData['Nev'][0])
+
+    # Store vfatID, the first non-zero value of each VFAT
+    dict_vfatID = dict((vfat, 0) for vfat in range(0,24))
+    if 'vfatID' in listOfBranches:
+        hasID = scurveData['vfatID'] > 0
+        vfatsWithID, firstEntry = np.unique(scurveDataVFATN[hasID], return_index=True)
+        for vfat, vfatID in zip(vfatsWithID, scurveData['vfatID'][hasID][firstEntry]):
+            dict_vfatID[int(vfat)] = int(vfatID)
             pass
-        trim_list[event.vfatN][event.vfatCH] = event.trimDAC
-        if options.isVFAT3:
-            #placegolder
-            trimPolarity_list[event.vfatN][event.vfatCH] = event.trimPolarity
-        else:
-            trimRange_list[event.vfatN][event.vfatCH] = event.trimRange
-        
-        # store event count
-        if nPulses < 0:
-            nPulses = event.Nev
-
-        # Store vfatID
-        if not (dict_vfatID[event.vfatN] > 0):
-            if 'vfatID' in listOfBranches:
-                dict_vfatID[event.vfatN] = event.vfatID
-            else:
-                dict_vfatID[event.vfatN] = 0
-        
-        # Load the event into the fitter
-        if options.performFit:
-            fitter.feed(event)
+        pass
+
+    # Load the data into the fitter
+    if options.performFit:
+        fitter.feedArrays(**dict((bName, scurveData[bName]) for bName in list_bNames
+            if bName in ['vfatN','vfatCH','vcal','Nhits','Nev','calSF','isCurrentPulse']))
+        if options.seedFromFitFile is not None:
+            nSeeded = fitter.readSeedFile(options.seedFromFitFile, vfatIDs=[ dict_vfatID[vfat] for vfat in range(0,24) ])
+            print("Seeding the fit of %i channels from %s"%(nSeeded, options.seedFromFitFile))
 
     # Loop over input data and fill histograms
     print("Filling Histograms")
     fill2DScurveSummaryPlots(
-            scurveTree=inF.scurveTree, 
+            scurveData=scurveData, 
             vfatHistos=vSummaryPlots, 
             vfatChanLUT=dict_vfatChanLUT, 
             vfatHistosPanPin2=vSummaryPlotsPanPin2, 
@@ -359,7 +751,16 @@ if __name__ == '__main__':
         print("Fitting Histograms")
         fitSummary = open(filename+'/fitSummary.txt','w')
         fitSummary.write('vfatN/I:vfatID/I:vfatCH/I:fitP0/F:fitP1/F:fitP2/F:fitP3/F\n')
-        scanFitResults = fitter.fit(debug=options.debug)
+        fitCache = None
+        if options.fitCache is not None:
+            from gempython.gemplotting.fitting.fitCache import FitCache
+            fitCache = FitCache(options.fitCache, options.fitCacheMaxSize)
+            pass
+        scanFitResults = fitter.fit(debug=options.debug, nWorkers=options.nFitWorkers, fitCache=fitCache, pool=fitPool)
+        if fitCache is not None:
+            fitCache.close()
+            pass
+        # Read the parameters directly, going through scanFuncs would build a TF1 per channel
         for vfat in range(0,24):
             for chan in range(0,128):
                 fitSummary.write(
@@ -367,77 +768,78 @@ if __name__ == '__main__':
                             vfat,
                             dict_vfatID[vfat],
                             chan,
-                            fitter.scanFuncs[vfat][chan].GetParameter(0),
-                            fitter.scanFuncs[vfat][chan].GetParameter(1),
-                            fitter.scanFuncs[vfat][chan].GetParameter(2),
-                            fitter.scanFuncs[vfat][chan].GetParameter(3)
+                            fitter.scanFuncsParams[vfat][chan][0],
+                            fitter.scanFuncsParams[vfat][chan][1],
+                            fitter.scanFuncsParams[vfat][chan][2],
+                            fitter.scanFuncsParams[vfat][chan][3]
                             )
                         )
         fitSummary.close()
+
+        # Summarize where the fit spent its time
+        print("Fit timing summary")
+        print("")
+        fitTimingSummary = open(filename+'/fitTimingSummary.txt','w')
+        fitTimingSummary.write('vfatN/I:vfatID/I:fitTime/F:nMinuitCalls/I:nRestarts/I:nStopChi2/I:slowestCH/I:slowestTime/F\n')
+        print "| vfatN | Fit Time (s) | Minuit Calls | Restarts | Stopped on Chi2 < 50 | Slowest Chan | Slowest Chan Time (s) |"
+        print "| :---: | :----------: | :----------: | :------: | :------------------: | :----------: | :-------------------: |"
+        for vfat in range(0,24):
+            slowestCH = np.argmax(fitter.fitTime[vfat])
+            fitTimingSummary.write(
+                    '%i\t%i\t%f\t%i\t%i\t%i\t%i\t%f\n'%(
+                        vfat,
+                        dict_vfatID[vfat],
+                        np.sum(fitter.fitTime[vfat]),
+                        np.sum(fitter.fitNCalls[vfat]),
+                        np.sum(fitter.fitNRestarts[vfat]),
+                        np.count_nonzero(fitter.fitStopChi2[vfat]),
+                        slowestCH,
+                        fitter.fitTime[vfat][slowestCH]
+                        )
+                    )
+            print '| %i | %.2f | %i | %i | %i | %i | %.3f |'%(
+                    vfat,
+                    np.sum(fitter.fitTime[vfat]),
+                    np.sum(fitter.fitNCalls[vfat]),
+                    np.sum(fitter.fitNRestarts[vfat]),
+                    np.count_nonzero(fitter.fitStopChi2[vfat]),
+                    slowestCH,
+                    fitter.fitTime[vfat][slowestCH])
+            pass
+        print("Total fit time: %.2f s"%(np.sum(fitter.fitTime)))
+        fitTimingSummary.close()
     
         # Determine hot channels
         print("Determining hot channels")
         print("")
-        masks = []
-        maskReasons = []
-        effectivePedestals = [ np.zeros(128) for vfat in range(0,24) ]
-        print "| vfatN | Dead Chan | Hot Chan | Failed Fits | High Noise | High Eff Ped |"
-        print "| :---: | :-------: | :------: | :---------: | :--------: | :----------: |"
+        # Effective pedestal: value of the fit function at 0, computed from the
+        # parameters as scanFuncs[vfat][chan].Eval(0.0) without building the TF1s
+        from scipy.special import erf
+        params = fitter.scanFuncsParams
+        with np.errstate(divide='ignore', invalid='ignore'):
+            effectivePedestals = params[:,:,3]*erf((np.maximum(params[:,:,2],0.)-params[:,:,0])/(np.sqrt(2)*params[:,:,1]))+params[:,:,3]
+        allNev = -np.ones((24,128))
         for vfat in range(0,24):
-            trimValue = np.zeros(128)
-            channelNoise = np.zeros(128)
-            fitFailed = np.zeros(128, dtype=bool)
             for chan in range(0, 128):
-                # Compute values for cuts
-                channelNoise[chan] = scanFitResults[1][vfat][chan]
-                effectivePedestals[vfat][chan] = fitter.scanFuncs[vfat][chan].Eval(0.0)
-                
-                # Compute the value to apply MAD on for each channel
-                trimValue[chan] = scanFitResults[0][vfat][chan] - options.ztrim * scanFitResults[1][vfat][chan]
-                pass
-            fitFailed = np.logical_not(fitter.fitValid[vfat])
-            
-            # Determine outliers
-            hot = isOutlierMADOneSided(trimValue, thresh=options.zscore,
-                                       rejectHighTail=False)
-            
-            # Create reason array
-            reason = np.zeros(128, dtype=int) # Not masked
-            reason[hot] |= MaskReason.HotChannel
-            reason[fitFailed] |= MaskReason.FitFailed
-            nDeadChan = 0
-            for chan in range(0,len(channelNoise)):
-                if (options.deadChanCutLow < channelNoise[chan] and channelNoise[chan] < options.deadChanCutHigh):
-                    reason[chan] |= MaskReason.DeadChannel
-                    nDeadChan+=1
+                if chan in fitter.Nev[vfat].keys():
+                    allNev[vfat][chan] = fitter.Nev[vfat][chan]
                     pass
                 pass
-            reason[channelNoise > options.highNoiseCut ] |= MaskReason.HighNoise
-            nHighEffPed = 0
-            for chan in range(0, len(effectivePedestals)):
-                if chan not in fitter.Nev[vfat].keys():
-                    continue
-                if (effectivePedestals[vfat][chan] > (options.maxEffPedPercent * fitter.Nev[vfat][chan]) ):
-                    reason[chan] |= MaskReason.HighEffPed
-                    nHighEffPed+=1
-                    pass
-                pass
-            maskReasons.append(reason)
-            #masks.append(reason != MaskReason.NotMasked)
-            masks.append((reason != MaskReason.NotMasked) * (reason != MaskReason.DeadChannel))
-            print '| %i | %i | %i | %i | %i | %i |'%(
-                    vfat,
-                    nDeadChan,
-                    np.count_nonzero(hot),
-                    np.count_nonzero(fitFailed),
-                    np.count_nonzero(channelNoise > options.highNoiseCut),
-                    nHighEffPed)
+            pass
+        masks, maskReasons = computeMasks(
+                np.array([ scanFitResults[0][vfat] for vfat in range(0,24) ]),
+                np.array([ scanFitResults[1][vfat] for vfat in range(0,24) ]),
+                effectivePedestals,
+                fitter.fitValid,
+                allNev,
+                **dict((cutName, getattr(options, cutName)) for cutName in maskCutNames))
+        printMaskSummary(maskReasons)
     
     # Make Distributions w/o Hot Channels
     if options.performFit:
         print("Removing Hot Channels from Output Histograms")
         fill2DScurveSummaryPlots(
-                scurveTree=inF.scurveTree, 
+                scurveData=scurveData, 
                 vfatHistos=vSummaryPlotsNoMaskedChan, 
                 vfatChanLUT=dict_vfatChanLUT, 
                 vfatHistosPanPin2=vSummaryPlotsNoMaskedChanPanPin2, 
@@ -451,52 +853,6 @@ if __name__ == '__main__':
         # Due to weird ROOT black magic this cannot be done here
         #myT = r.TTree('scurveFitTree','Tree Holding FitData')
 
-        chi2 = array( 'f', [ 0 ] )
-        myT.Branch( 'chi2', chi2, 'chi2/F')
-        mask = array( 'i', [ 0 ] )
-        myT.Branch( 'mask', mask, 'mask/I' )
-        maskReason = array( 'i', [ 0 ] )
-        myT.Branch( 'maskReason', maskReason, 'maskReason/I' )
-        ndf = array( 'i', [ 0 ] )
-        myT.Branch( 'ndf', ndf, 'ndf/I')
-        Nhigh = array( 'i', [ 0 ] )
-        myT.Branch( 'Nhigh', Nhigh, 'Nhigh/I')
-        noise = array( 'f', [ 0 ] )
-        myT.Branch( 'noise', noise, 'noise/F')
-        panPin = array( 'i', [ 0 ] )
-        myT.Branch( 'panPin', panPin, 'panPin/I' )
-        pedestal = array( 'f', [ 0 ] )
-        myT.Branch( 'pedestal', pedestal, 'pedestal/F')
-        ped_eff = array( 'f', [ 0 ] )
-        myT.Branch( 'ped_eff', ped_eff, 'ped_eff/F')
-        ROBstr = array( 'i', [ 0 ] )
-        myT.Branch( 'ROBstr', ROBstr, 'ROBstr/I' )
-        trimDAC = array( 'i', [ 0 ] )
-        myT.Branch( 'trimDAC', trimDAC, 'trimDAC/I' )
-        threshold = array( 'f', [ 0 ] )
-        myT.Branch( 'threshold', threshold, 'threshold/F')
-        if options.isVFAT3:
-            trimPolarity = array( 'i', [ 0 ] )
-            myT.Branch('trimPolarity', trimPolarity, 'trimPolarity/I' )
-        else:
-            trimRange = array( 'i', [ 0 ] )
-            myT.Branch( 'trimRange', trimRange, 'trimRange/I' )
-        vfatCH = array( 'i', [ 0 ] )
-        myT.Branch( 'vfatCH', vfatCH, 'vfatCH/I' )
-        vfatID = array( 'L', [0] )
-        myT.Branch( 'vfatID', vfatID, 'vfatID/i' ) #Hex Chip ID of VFAT
-        vfatN = array( 'i', [ 0 ] )
-        myT.Branch( 'vfatN', vfatN, 'vfatN/I' )
-        vthr = array( 'i', [ 0 ] )
-        myT.Branch( 'vthr', vthr, 'vthr/I' )
-        scurve_h = r.TH1F()
-        myT.Branch( 'scurve_h', scurve_h)
-        scurve_fit = r.TF1()
-        myT.Branch( 'scurve_fit', scurve_fit)
-        ztrim = array( 'f', [ 0 ] )
-        ztrim[0] = options.ztrim
-        myT.Branch( 'ztrim', ztrim, 'ztrim/F')
-    
         print("Storing Output Data")
         encSummaryPlots = {}
         encSummaryPlotsByiEta = {}
@@ -505,80 +861,98 @@ if __name__ == '__main__':
         effPedSummaryPlotsByiEta = {}
         threshSummaryPlots = {}
         threshSummaryPlotsByiEta = {}
-        allENC = np.zeros(3072)
+        badFits = dict((vfat, []) for vfat in range(0,24))
         h2DetENC_All = r.TH2F("ScurveSigma_All","ScurveSigma_All",24,-0.5,23.5,25,0,5)
 
-        allENCByiEta    = dict( (ieta,np.zeros(3*128)) for ieta in range(1,9) )
-        allEffPedByiEta = dict( (ieta,(-1.*np.ones(3*128))) for ieta in range(1,9) )
-        allThreshByiEta = dict( (ieta,np.zeros(3*128)) for ieta in range(1,9) )
-        ## Only in python 2.7 and up
-        # allENCByiEta    = { ieta:np.zeros(3*128) for ieta in range(1,9) }
-        # allEffPedByiEta = { ieta:(-1.*np.ones(3*128)) for ieta in range(1,9) }
-        # allThreshByiEta = { ieta:np.zeros(3*128) for ieta in range(1,9) }
+        # Fit results indexed as [vfat][chan]
+        threshArray = np.array([ scanFitResults[0][vfat] for vfat in range(0,24) ])
+        noiseArray = np.array([ scanFitResults[1][vfat] for vfat in range(0,24) ])
+        pedArray = np.array([ scanFitResults[2][vfat] for vfat in range(0,24) ])
+        chi2Array = np.array([ scanFitResults[3][vfat] for vfat in range(0,24) ])
+        NhighArray = np.array([ scanFitResults[4][vfat] for vfat in range(0,24) ])
+        ndfArray = np.array([ scanFitResults[5][vfat] for vfat in range(0,24) ])
+        effPedArray = np.array(effectivePedestals)
 
-        allEffPed = -1.*np.ones(3072)
-        allThresh = np.zeros(3072)
-        
-        for vfat in range(0,24):
-            stripPinOrChanArray = np.zeros(128)
-            for chan in range (0, 128):
-                # Store stripChanOrPinType to use as x-axis of fit summary plots
-                stripPinOrChan = dict_vfatChanLUT[vfat][stripChanOrPinType][chan]
-                
-                # Determine ieta
-                ieta = chamber_vfatPos2iEta[vfat]
-                iphi = chamber_iEta2VFATPos[ieta][vfat]
-
-                # Store Values for making fit summary plots
-                allENC[vfat*128 + chan] =  scanFitResults[1][vfat][chan]
-                allEffPed[vfat*128 + chan] = effectivePedestals[vfat][chan]
-                allThresh[vfat*128 + chan] = scanFitResults[0][vfat][chan]
-                stripPinOrChanArray[chan] = float(stripPinOrChan)
-                
-                allENCByiEta[ieta][(iphi-1)*chan + chan] = scanFitResults[1][vfat][chan]
-                allEffPedByiEta[ieta][(iphi-1)*chan + chan] = effectivePedestals[vfat][chan]
-                allThreshByiEta[ieta][(iphi-1)*chan + chan] = scanFitResults[0][vfat][chan]
-
-                # Set arrays linked to TBranches
-                chi2[0] = scanFitResults[3][vfat][chan]
-                mask[0] = masks[vfat][chan]
-                maskReason[0] = maskReasons[vfat][chan]
-                ndf[0] = int(scanFitResults[5][vfat][chan])
-                Nhigh[0] = int(scanFitResults[4][vfat][chan])
-                noise[0] = scanFitResults[1][vfat][chan]
-                panPin[0] = dict_vfatChanLUT[vfat]["PanPin"][chan]
-                ped_eff[0] = effectivePedestals[vfat][chan]
-                pedestal[0] = scanFitResults[2][vfat][chan]
-                ROBstr[0] = dict_vfatChanLUT[vfat]["Strip"][chan]
-                threshold[0] = scanFitResults[0][vfat][chan]
-                trimDAC[0] = trim_list[vfat][chan]
-                if options.isVFAT3:
-                    trimPolarity[0] = trimPolarity_list[vfat][chan]
-                else:
-                    trimRange[0] = trimRange_list[vfat][chan]
-                vfatCH[0] = chan
-                vfatID[0] = dict_vfatID[vfat]
-                vfatN[0] = vfat
-                vthr[0] = vthr_list[vfat][chan]
-                
-                # Set TObjects linked to TBranches
-                holder_curve = fitter.scanHistos[vfat][chan]
-                holder_curve.Copy(scurve_h)
-                scurve_fit = fitter.getFunc(vfat,chan).Clone('scurveFit_vfat%i_chan%i'%(vfat,chan))
-                
-                # Filling the arrays for plotting later
-                if options.drawbad:
-                    if (chi2[0] > 1000.0 or chi2[0] < 1.0):
-                        canvas = r.TCanvas('canvas', 'canvas', 500, 500)
-                        r.gStyle.SetOptStat(1111111)
-                        scurve_h.Draw()
-                        scurve_fit.Draw('SAME')
-                        canvas.Update()
-                        canvas.SaveAs('Fit_Overlay_vfat%i_vfatCH%i.png'%(VFAT, chan))
-                        pass
+        # Store Values for making fit summary plots, indexed as vfat*128 + chan
+        allENC = noiseArray.flatten()
+        allEffPed = effPedArray.flatten()
+        allThresh = threshArray.flatten()
+
+        # Same for each ieta, indexed as (iphi-1)*128 + chan
+        vfatsByiEta = dict( (ieta, [ vfat for vfat,iphi in sorted(chamber_iEta2VFATPos[ieta].items(), key=lambda vfatAndiPhi: vfatAndiPhi[1]) ]) for ieta in range(1,9) )
+        allENCByiEta    = dict( (ieta,noiseArray[vfatsByiEta[ieta]].flatten()) for ieta in range(1,9) )
+        allEffPedByiEta = dict( (ieta,effPedArray[vfatsByiEta[ieta]].flatten()) for ieta in range(1,9) )
+        allThreshByiEta = dict( (ieta,threshArray[vfatsByiEta[ieta]].flatten()) for ieta in range(1,9) )
+
+        # Fill the scalar branches of the TTree in one go
+        listOfFitBranches = [
+                ('chi2', 'f4', chi2Array),
+                ('fitNCalls', 'i4', fitter.fitNCalls),
+                ('fitNRestarts', 'i4', fitter.fitNRestarts),
+                ('fitStepN', 'i4', fitter.fitStepN),
+                ('fitStopChi2', 'i4', fitter.fitStopChi2),
+                ('fitTime', 'f4', fitter.fitTime),
+                ('mask', 'i4', masks),
+                ('maskReason', 'i4', maskReasons),
+                ('ndf', 'i4', ndfArray),
+                ('Nhigh', 'i4', NhighArray),
+                ('noise', 'f4', noiseArray),
+                ('panPin', 'i4', [ dict_vfatChanLUT[vfat]["PanPin"] for vfat in range(0,24) ]),
+                ('pedestal', 'f4', pedArray),
+                ('ped_eff', 'f4', effPedArray),
+                ('ROBstr', 'i4', [ dict_vfatChanLUT[vfat]["Strip"] for vfat in range(0,24) ]),
+                ('trimDAC', 'i4', trim_list),
+                ('threshold', 'f4', threshArray)
+                ]
+        if options.isVFAT3:
+            listOfFitBranches.append(('trimPolarity', 'i4', trimPolarity_list))
+        else:
+            listOfFitBranches.append(('trimRange', 'i4', trimRange_list))
+            pass
+        listOfFitBranches.extend([
+                ('vfatCH', 'i4', np.tile(np.arange(128), 24)),
+                ('vfatID', 'u4', np.repeat([ dict_vfatID[vfat] for vfat in range(0,24) ], 128)), #Hex Chip ID of VFAT
+                ('vfatN', 'i4', np.repeat(np.arange(24), 128)),
+                ('vthr', 'i4', vthr_list),
+                ('ztrim', 'f4', options.ztrim * np.ones(3072))
+                ])
+        fitData = np.zeros(3072, dtype=[ (bName, bType) for bName, bType, bValues in listOfFitBranches ])
+        for bName, bType, bValues in listOfFitBranches:
+            fitData[bName] = np.asarray(bValues).flatten()
+            pass
+        rp.array2tree(fitData, tree=myT)
+
+        # TObjects can't be stored by array2tree, fill their branches entry by entry
+        if not options.lightFitTree:
+            scurve_h = r.TH1F()
+            branch_scurve_h = myT.Branch( 'scurve_h', scurve_h)
+            scurve_fit = r.TF1()
+            branch_scurve_fit = myT.Branch( 'scurve_fit', scurve_fit)
+            for vfat in range(0,24):
+                for chan in range (0, 128):
+                    holder_curve = fitter.scanHistos[vfat][chan]
+                    holder_curve.Copy(scurve_h)
+                    scurve_fit = fitter.getFunc(vfat,chan).Clone('scurveFit_vfat%i_chan%i'%(vfat,chan))
+                    branch_scurve_h.Fill()
+                    branch_scurve_fit.Fill()
                     pass
-                myT.Fill()
+                if options.streamVFATs:
+                    fitter.releaseVFAT(vfat)
+                    pass
+                pass
+            myT.SetEntries(-1)
+            pass
+
+        # Collect the channels to draw later
+        if options.drawbad:
+            for vfat in range(0,24):
+                badFits[vfat] = np.flatnonzero((chi2Array[vfat] > 1000.0) | (chi2Array[vfat] < 1.0)).tolist()
                 pass
+            pass
+
+        for vfat in range(0,24):
+            # Store stripChanOrPinType to use as x-axis of fit summary plots
+            stripPinOrChanArray = np.array(dict_vfatChanLUT[vfat][stripChanOrPinType], dtype=float)
 
             # Make fit Summary plot
             fitSummaryPlots[vfat] = r.TGraphErrors(
@@ -607,11 +981,8 @@ if __name__ == '__main__':
                                 40, thisVFAT_ThreshMean - 5. * thisVFAT_ThreshStd, thisVFAT_ThreshMean + 5. * thisVFAT_ThreshStd )
             histThresh.Sumw2()
             if thisVFAT_ThreshStd != 0: # Don't fill if we still at initial values
-                for thresh in allThresh[(vfat*128):((vfat+1)*128)]:
-                    if thresh == 0: # Skip the case where it still equals the inital value
-                        continue
-                    histThresh.Fill(thresh)
-                    pass
+                thisVFAT_Thresh = allThresh[(vfat*128):((vfat+1)*128)]
+                rp.fill_hist(histThresh, thisVFAT_Thresh[thisVFAT_Thresh != 0]) # Skip the case where it still equals the inital value
                 pass
             gThresh = r.TGraphErrors(histThresh)
             gThresh.SetName("gScurveMeanDist_vfat%i"%vfat)
@@ -623,12 +994,8 @@ if __name__ == '__main__':
             histEffPed = r.TH1F("scurveEffPed_vfat%i"%vfat,"VFAT %i;S-Curve Effective Pedestal #left(N#right);N"%vfat,
                                 nPulses+1, -0.5, nPulses+0.5)
             histEffPed.Sumw2()
-            for effPed in allEffPed[(vfat*128):((vfat+1)*128)]:
-                if effPed < 0: # Skip the case where it still equals the inital value
-                    continue
-                histEffPed.Fill(effPed)
-                pass
-            pass
+            thisVFAT_EffPed = allEffPed[(vfat*128):((vfat+1)*128)]
+            rp.fill_hist(histEffPed, thisVFAT_EffPed[thisVFAT_EffPed >= 0]) # Skip the case where it still equals the inital value
             histEffPed.SetMarkerStyle(21)
             histEffPed.SetMarkerColor(r.kRed)
             histEffPed.SetLineColor(r.kRed)
@@ -646,12 +1013,10 @@ if __name__ == '__main__':
                                 40, thisVFAT_ENCMean - 5. * thisVFAT_ENCStd, thisVFAT_ENCMean + 5. * thisVFAT_ENCStd )
             histENC.Sumw2()
             if thisVFAT_ENCStd != 0: # Don't fill if we are still at initial values
-                for enc in allENC[(vfat*128):((vfat+1)*128)]:
-                    if enc == 0: # Skip the case where it still equals the inital value
-                        continue
-                    histENC.Fill(enc)
-                    h2DetENC_All.Fill(vfat,enc)
-                    pass
+                thisVFAT_ENC = allENC[(vfat*128):((vfat+1)*128)]
+                thisVFAT_ENC = thisVFAT_ENC[thisVFAT_ENC != 0] # Skip the case where it still equals the inital value
+                rp.fill_hist(histENC, thisVFAT_ENC)
+                rp.fill_hist(h2DetENC_All, np.column_stack((vfat * np.ones(len(thisVFAT_ENC)), thisVFAT_ENC)))
                 pass
             gENC = r.TGraphErrors(histENC)
             gENC.SetName("gScurveSigmaDist_vfat%i"%vfat)
@@ -660,14 +1025,47 @@ if __name__ == '__main__':
             encSummaryPlots[vfat] = gENC
             pass
   
+        # Draw the fit overlays of the bad channels in the background
+        if options.drawbad:
+            from gempython.gemplotting.utils.anascheduler import WorkerPool
+            listOfDrawTasks = []
+            for vfat in range(0,24):
+                if len(badFits[vfat]) == 0:
+                    continue
+                if len(badFits[vfat]) > options.drawbadMax:
+                    print("VFAT%i has %i bad fits, only the first %i are drawn"%(vfat, len(badFits[vfat]), options.drawbadMax))
+                    pass
+                channels = badFits[vfat][:options.drawbadMax]
+                if options.drawbadFormat == "pdf":
+                    drawFileName = '%s/Fit_Overlay_vfat%i.pdf'%(filename,vfat)
+                else:
+                    drawFileName = '%s/Fit_Overlay_vfat%i.png'%(filename,vfat)
+                    pass
+                listOfDrawTasks.append((
+                    drawFileName,
+                    options.drawbadFormat,
+                    vfat,
+                    channels,
+                    fitter.scanHistosChargeBins[vfat],
+                    fitter.scanHistosContents[vfat][channels],
+                    fitter.scanHistosErrors[vfat][channels],
+                    fitter.getChannelResults(vfat)[channels],
+                    calDAC2Q_Slope,
+                    calDAC2Q_Intercept,
+                    options.isVFAT3))
+                pass
+            drawPool = WorkerPool(options.nDrawWorkers)
+            for drawTask in listOfDrawTasks:
+                drawPool.submit(drawBadFits, drawTask[2], (drawTask,))
+                pass
+            pass
+
         # Make a Thresh Summary Dist For the entire Detector
         detThresh_Mean = np.mean(allThresh[allThresh != 0]) #Don't consider intial values
         detThresh_Std = np.std(allThresh[allThresh != 0]) #Don't consider intial values
         hDetThresh_All = r.TH1F("hScurveMeanDist_All","All VFATs;S-Curve Mean #left(fC#right);N",
                             100, detThresh_Mean - 5. * detThresh_Std, detThresh_Mean + 5. * detThresh_Std )
-        for thresh in allThresh[allThresh != 0]:
-            hDetThresh_All.Fill(thresh)
-            pass
+        rp.fill_hist(hDetThresh_All, allThresh[allThresh != 0])
         hDetThresh_All.GetXaxis().SetTitle("scurve mean pos #left(fC#right)")
         hDetThresh_All.GetYaxis().SetTitle("Entries / %f fC"%(detThresh_Std/10.))
         gDetThresh_All = r.TGraphErrors(hDetThresh_All)
@@ -682,9 +1080,7 @@ if __name__ == '__main__':
         # Make a EffPed Summary Dist For the entire Detector
         hDetEffPed_All = r.TH1F("hScurveEffPedDist_All","All VFATs;S-Curve Effective Pedestal #left(N#right);N",
                                 nPulses+1, -0.5, nPulses+0.5)
-        for effPed in allEffPed[allEffPed > -1]:
-            hDetEffPed_All.Fill(effPed)
-            pass
+        rp.fill_hist(hDetEffPed_All, allEffPed[allEffPed > -1])
         hDetEffPed_All.GetXaxis().SetTitle("scurve effective pedestal #left(N#right)")
         hDetEffPed_All.GetYaxis().SetTitle("Entries")
         hDetEffPed_All.SetMarkerStyle(21)
@@ -700,9 +1096,7 @@ if __name__ == '__main__':
         detENC_Std = np.std(allENC[allENC != 0]) #Don't consider intial values
         hDetENC_All = r.TH1F("hScurveSigmaDist_All","All VFATs;S-Curve Sigma #left(fC#right);N",
                             100, detENC_Mean - 5. * detENC_Std, detENC_Mean + 5. * detENC_Std )
-        for enc in allENC[allENC != 0]:
-            hDetENC_All.Fill(enc)
-            pass
+        rp.fill_hist(hDetENC_All, allENC[allENC != 0])
         hDetENC_All.GetXaxis().SetTitle("scurve sigma #left(fC#right)")
         hDetENC_All.GetYaxis().SetTitle("Entries / %f fC"%(detENC_Std/10.))
         gDetENC_All = r.TGraphErrors(hDetENC_All)
@@ -727,10 +1121,7 @@ if __name__ == '__main__':
                     80, 
                     ietaThresh_Mean - 5. * ietaThresh_Std, 
                     ietaThresh_Mean + 5. * ietaThresh_Std )
-            
-            for thresh in allThreshByiEta[ieta][allThreshByiEta[ieta] != 0]:
-                hThresh_iEta.Fill(thresh)
-                pass
+            rp.fill_hist(hThresh_iEta, allThreshByiEta[ieta][allThreshByiEta[ieta] != 0])
             gThresh_iEta = r.TGraphErrors(hThresh_iEta)
             gThresh_iEta.SetName("gScurveMeanDist_ieta%i"%(ieta))
             gThresh_iEta.GetXaxis().SetTitle("scurve mean pos #left(fC#right)")
@@ -742,10 +1133,7 @@ if __name__ == '__main__':
                     "hScurveEffPedDist_ieta%i"%(ieta),
                     "i#eta=%i;S-Curve Effective Pedestal #left(N#right);N"%(ieta),
                      nPulses+1, -0.5, nPulses+0.5)
-            
-            for effPed in allEffPedByiEta[ieta][allEffPedByiEta[ieta] > -1]:
-                hEffPed_iEta.Fill(effPed)
-                pass
+            rp.fill_hist(hEffPed_iEta, allEffPedByiEta[ieta][allEffPedByiEta[ieta] > -1])
             hEffPed_iEta.SetMarkerStyle(21)
             hEffPed_iEta.SetMarkerColor(r.kRed)
             hEffPed_iEta.SetLineColor(r.kRed)
@@ -766,10 +1154,7 @@ if __name__ == '__main__':
                     80, 
                     ietaENC_Mean - 5. * ietaENC_Std, 
                     ietaENC_Mean + 5. * ietaENC_Std )
-            
-            for enc in allENCByiEta[ieta][allENCByiEta[ieta] != 0]:
-                hENC_iEta.Fill(enc)
-                pass
+            rp.fill_hist(hENC_iEta, allENCByiEta[ieta][allENCByiEta[ieta] != 0])
             gENC_iEta = r.TGraphErrors(hENC_iEta)
             gENC_iEta.SetName("gScurveSigmaDist_ieta%i"%(ieta))
             gENC_iEta.GetXaxis().SetTitle("scurve sigma pos #left(fC#right)")
@@ -825,50 +1210,37 @@ if __name__ == '__main__':
         saveSummaryByiEta(effPedSummaryPlotsByiEta, '%s/ScurveEffPedSummaryByiEta.png'%filename, None, drawOpt="E1")
         saveSummaryByiEta(encSummaryPlotsByiEta, '%s/ScurveSigmaSummaryByiEta.png'%filename, None, drawOpt="AP")
 
-        confF = open(filename+'/chConfig.txt','w')
-        if options.isVFAT3:
-            confF.write('vfatN/I:vfatID/I:vfatCH/I:trimDAC/I:trimPolarity/I:mask/I:maskReason/I\n')
-            for vfat in range(0,24):
-                for chan in range(0, 128):
-                    confF.write('%i\t%i\t%i\t%i\t%i\t%i\t%i\n'%(
-                        vfat,
-                        dict_vfatID[vfat],
-                        chan,
-                        trim_list[vfat][chan],
-                        trimPolarity_list[vfat][chan],
-                        masks[vfat][chan],
-                        maskReasons[vfat][chan]))
-        else:
-            confF.write('vfatN/I:vfatID/I:vfatCH/I:trimDAC/I:mask/I:maskReason/I\n')
-            for vfat in range(0,24):
-                for chan in range (0, 128):
-                    confF.write('%i\t%i\t%i\t%i\t%i\t%i\n'%(
-                        vfat,
-                        dict_vfatID[vfat],
-                        chan,
-                        trim_list[vfat][chan],
-                        masks[vfat][chan],
-                        maskReasons[vfat][chan]))
-        confF.close()
-
-    # Make 1D Plot for each VFAT showing all scurves
-    # Don't use the ones stored in fitter since this may not exist (e.g. options.performFit = false)
-    canvOfScurveHistosNoMaskedChan = {}
-    if options.PanPin:
-        canvOfScurveHistos = plotAllSCurvesOnCanvas(vSummaryPlots,vSummaryPlotsPanPin2,"scurves")
-    else:
-        canvOfScurveHistos = plotAllSCurvesOnCanvas(vSummaryPlots,None,"scurves")
+        writeChConfig(
+                filename+'/chConfig.txt',
+                dict_vfatID,
+                trim_list,
+                masks,
+                maskReasons,
+                trimPolarity_list if options.isVFAT3 else None)
 
+    # Save TObjects
+    outF.cd()
     if options.performFit:
+        myT.Write()
+        if options.lightFitTree:
+            fitter.writeScurveFile(getScurveFileName(filename+'/'+outfilename))
+            pass
+    for vfat in range(0,24):
+        # Make 1D Plot for each VFAT showing all scurves
+        # Don't use the ones stored in fitter since this may not exist (e.g. options.performFit = false)
         if options.PanPin:
-            canvOfScurveHistosNoMaskedChan = plotAllSCurvesOnCanvas(vSummaryPlotsNoMaskedChan,vSummaryPlotsNoMaskedChanPanPin2,"scurvesNoMaskedChan")
+            canvOfScurveHistos = plotAllSCurvesOnCanvas({vfat:vSummaryPlots[vfat]},{vfat:vSummaryPlotsPanPin2[vfat]},"scurves")
         else:
-            canvOfScurveHistosNoMaskedChan = plotAllSCurvesOnCanvas(vSummaryPlotsNoMaskedChan,None,"scurvesNoMaskedChan")
-        
-        canvOfScurveFits = {}
-        for vfat in range(0,24):
-            canvOfScurveFits[vfat] = r.TCanvas("canv_scurveFits_vfat%i"%vfat,"Scurve Fits from VFAT%i"%vfat,600,600)
-            canvOfScurveFits[vfat].cd()
+            canvOfScurveHistos = plotAllSCurvesOnCanvas({vfat:vSummaryPlots[vfat]},None,"scurves")
+
+        if options.performFit:
+            if options.PanPin:
+                canvOfScurveHistosNoMaskedChan = plotAllSCurvesOnCanvas({vfat:vSummaryPlotsNoMaskedChan[vfat]},{vfat:vSummaryPlotsNoMaskedChanPanPin2[vfat]},"scurvesNoMaskedChan")
+            else:
+                canvOfScurveHistosNoMaskedChan = plotAllSCurvesOnCanvas({vfat:vSummaryPlotsNoMaskedChan[vfat]},None,"scurvesNoMaskedChan")
+
+            canvOfScurveFits = r.TCanvas("canv_scurveFits_vfat%i"%vfat,"Scurve Fits from VFAT%i"%vfat,600,600)
+            canvOfScurveFits.cd()
             for chan in range (0,128):
                 if masks[vfat][chan]: # Do not draw fit for masked channels
                     continue
@@ -877,13 +1249,8 @@ if __name__ == '__main__':
                     fitter.scanFuncs[vfat][chan].Draw()
                 else:
                     fitter.scanFuncs[vfat][chan].Draw("same")
-            canvOfScurveFits[vfat].Update()
+            canvOfScurveFits.Update()
 
-    # Save TObjects
-    outF.cd()
-    if options.performFit:
-        myT.Write()
-    for vfat in range(0,24):
         dirVFAT = outF.mkdir("VFAT%i"%vfat)
         dirVFAT.cd()
         vSummaryPlots[vfat].Write()
@@ -899,8 +1266,22 @@ if __name__ == '__main__':
             effPedSummaryPlots[vfat].Write()
             encSummaryPlots[vfat].Write()
             canvOfScurveHistosNoMaskedChan[vfat].Write()
-            canvOfScurveFits[vfat].Write()
+            canvOfScurveFits.Write()
             pass
+
+        # Release the canvases of this VFAT, and the objects drawn on them
+        if options.streamVFATs:
+            if options.performFit:
+                fitter.releaseVFAT(vfat)
+                canvOfScurveFits.Close()
+                canvOfScurveHistosNoMaskedChan[vfat].GetListOfPrimitives().Delete()
+                canvOfScurveHistosNoMaskedChan[vfat].Close()
+                pass
+            canvOfScurveHistos[vfat].GetListOfPrimitives().Delete()
+            canvOfScurveHistos[vfat].Close()
+            pass
+        outF.cd()
+        pass
     if options.performFit:
         dirSummary = outF.mkdir("Summary")
         dirSummary.cd()
@@ -925,3 +1306,170 @@ if __name__ == '__main__':
 
     # Close output root file
     outF.Close()
+
+    # Wait for the fit overlays, a crashed or failed drawing only loses its VFAT
+    if options.performFit and options.drawbad:
+        try:
+            for idx in range(len(listOfDrawTasks)):
+                vfat, drawResult, runtime, error = drawPool.get()
+                if error is None:
+                    print("Drew %i fit overlays of VFAT%i"%(drawResult[1], vfat))
+                else:
+                    print("Failed to draw the fit overlays of VFAT%i:\n%s"%(vfat, error))
+                    pass
+                pass
+            drawPool.close()
+        except:
+            drawPool.terminate()
+            raise
+        pass
+
+    return
+
+if __name__ == '__main__':
+    import os
+    
+    from gempython.gemplotting.utils.anautilities import parseCalFile
+    from gempython.gemplotting.fitting.fitScanData import fitModes
+    from gempython.utils.wrappers import envCheck
+
+    from gempython.gemplotting.utils.anaoptions import parser
+    parser.add_option("-b", "--drawbad", action="store_true", dest="drawbad",
+                      help="Draw fit overlays for Chi2 > 1000 or Chi2 < 1, in the background once all fits are stored", metavar="drawbad")
+    parser.add_option("--drawbadFormat", type="choice", dest="drawbadFormat", default="pdf", choices=["pdf","grid"],
+                      help="With --drawbad, draw the overlays of each VFAT as one multi-page PDF file (pdf) or as one tiled PNG image (grid)", metavar="drawbadFormat")
+    parser.add_option("--drawbadMax", type="int", dest="drawbadMax", default=64,
+                      help="With --drawbad, maximum number of overlays drawn per VFAT", metavar="drawbadMax")
+    parser.add_option("--nDrawWorkers", type="int", dest="nDrawWorkers", default=2,
+                      help="With --drawbad, number of worker processes drawing the overlays", metavar="nDrawWorkers")
+    parser.add_option("--calFile", type="string", dest="calFile", default=None,
+                      help="File specifying CAL_DAC/VCAL to fC equations per VFAT",
+                      metavar="calFile")
+    parser.add_option("--extChanMapping", type="string", dest="extChanMapping", default=None,
+                      help="Physical filename of a custom, non-default, channel mapping (optional)", metavar="extChanMapping")
+    parser.add_option("-f", "--fit", action="store_true", dest="performFit",
+                      help="Fit scurves and save fit information to output TFile", metavar="performFit")
+    parser.add_option("--fitCache", type="string", dest="fitCache", default=None,
+                      help="SQLite file caching the per-channel fit results, channels with unchanged data are not fitted again", metavar="fitCache")
+    parser.add_option("--fitCacheMaxSize", type="float", dest="fitCacheMaxSize", default=200.,
+                      help="Maximum size in MB of the results in --fitCache, the least recently used ones are removed beyond it", metavar="fitCacheMaxSize")
+    parser.add_option("--fitROI", action="store_true", dest="fitROI", default=False,
+                      help="Restrict the fit of each S-curve to its transition region, the plateau is constrained from the saturated bins", metavar="fitROI")
+    parser.add_option("--fitMode", type="string", dest="fitMode", default="root",
+                      help="Fitting backend used when --fit is given, from list: %s"%(str(fitModes)), metavar="fitMode")
+    parser.add_option("--seedFromFitFile", type="string", dest="seedFromFitFile", default=None,
+                      help="SCurveFitData.root file of a previous scan of the same detector, its fit results are used as initial values of the fit", metavar="seedFromFitFile")
+    parser.add_option("--probitMaxChi2NDF", type="float", dest="probitMaxChi2NDF", default=None,
+                      help="With --fitMode=probit, channels with a larger chi2/NDF are refitted with ROOT", metavar="probitMaxChi2NDF")
+    parser.add_option("--roiMargin", type="int", dest="roiMargin", default=5,
+                      help="Number of bins added on each side of the transition region when --fitROI is given", metavar="roiMargin")
+    parser.add_option("--nFitWorkers", type="int", dest="nFitWorkers", default=1,
+                      help="Number of worker processes used to fit the VFATs in parallel", metavar="nFitWorkers")
+    parser.add_option("--remaskOnly", action="store_true", dest="remaskOnly", default=False,
+                      help="Do not fit, recompute the channel masks from the SCurveFitData.root file of a previous analysis of the same input and rewrite chConfig.txt", metavar="remaskOnly")
+    parser.add_option("--streamVFATs", action="store_true", dest="streamVFATs", default=False,
+                      help="Bound the memory usage by building the histograms, fit functions and canvases of one VFAT at a time and releasing them once written", metavar="streamVFATs")
+    parser.add_option("--lightFitTree", action="store_true", dest="lightFitTree", default=False,
+                      help="Store only scalar branches in the scurveFitTree, the S-curves and fit parameters are written to a separate SCurveFitData_scurves.npz file", metavar="lightFitTree")
+    parser.add_option("--isVFAT3", action="store_true", dest="isVFAT3", default=False,
+                      help="Provide this argument if input data was acquired from vfat3", metavar="isVFAT3")
+    parser.add_option("--IsTrimmed", action="store_true", dest="IsTrimmed",
+                      help="If the data is from a trimmed scan, plot the value it tried aligning to", metavar="IsTrimmed")
+    parser.add_option("--scandateList", type="string", dest="scandateList", default=None,
+                      help="File listing chamber names and scandates to analyze in addition to the comma separated list of files given by --infilename, see parseListOfScanDatesFile", metavar="scandateList")
+    parser.add_option("--scandateListAnaType", type="choice", dest="scandateListAnaType", default="scurve", choices=["scurve","trim"],
+                      help="Analysis type of the scandates of --scandateList, SCurveData.root (scurve) or SCurveData_Trimmed.root (trim) files are analyzed", metavar="scandateListAnaType")
+    parser.add_option("--zscore", type="float", dest="zscore", default=3.5,
+                      help="Z-Score for Outlier Identification in MAD Algo", metavar="zscore")
+
+    from optparse import OptionGroup
+    chanMaskGroup = OptionGroup(
+            parser,
+            "Options for channel mask decisions"
+            "Parameters which specify how Dead, Noisy, and High Pedestal Channels are charaterized")
+    chanMaskGroup.add_option("--maxEffPedPercent", type="float", dest="maxEffPedPercent", default=0.05,
+                      help="Percentage, Threshold for setting the HighEffPed mask reason, if channel (effPed > maxEffPedPercent * nevts) then HighEffPed is set",
+                      metavar="maxEffPedPercent")
+    chanMaskGroup.add_option("--highNoiseCut", type="float", dest="highNoiseCut", default=1.0,
+                      help="Threshold for setting the HighNoise maskReason, if channel (scurve_sigma > highNoiseCut) then HighNoise is set",
+                      metavar="highNoiseCut")
+    chanMaskGroup.add_option("--deadChanCutLow", type="float", dest="deadChanCutLow", default=4.14E-02,
+                      help="If channel (deadChanCutLow < scurve_sigma < deadChanCutHigh) then DeadChannel is set",
+                      metavar="deadChanCutLow")
+    chanMaskGroup.add_option("--cutSets", type="string", dest="cutSets", default=None,
+                      help="With --remaskOnly, ';' separated list of cut sets, each a ',' separated list of name=value pairs from %s. Cuts not given take the value of the corresponding option. One chConfig_cutSet<N>.txt file per cut set and a maskSummary.txt table are written"%(str(maskCutNames)),
+                      metavar="cutSets")
+    chanMaskGroup.add_option("--deadChanCutHigh", type="float", dest="deadChanCutHigh", default=1.09E-01,
+                      help="If channel (deadChanCutHigh < scurve_sigma < deadChanCutHigh) then DeadChannel is set",
+                      metavar="deadChanCutHigh")
+    parser.add_option_group(chanMaskGroup)
+
+    parser.set_defaults(outfilename="SCurveFitData.root")
+    (options, args) = parser.parse_args()
+
+    # Build the list of inputs, each with its GEB type
+    listOfInputs = []
+    if options.filename is not None:
+        for inputFilename in options.filename.split(","):
+            listOfInputs.append((inputFilename, options.GEBtype))
+            pass
+        pass
+    if options.scandateList is not None:
+        from gempython.gemplotting.mapping.chamberInfo import chamber_config, GEBtype
+        from gempython.gemplotting.utils.anautilities import getDirByAnaType, parseListOfScanDatesFile
+        envCheck('DATA_PATH')
+
+        dict_chamberGEBtype = dict((chamber_config[link], GEBtype[link]) for link in chamber_config.keys())
+        dataFileName = "SCurveData.root"
+        if options.scandateListAnaType == "trim":
+            dataFileName = "SCurveData_Trimmed.root"
+            pass
+        parsedListOfScanDates = parseListOfScanDatesFile(options.scandateList, alphaLabels=True)[0]
+        for cName,scandate,indepVar in parsedListOfScanDates:
+            listOfInputs.append((
+                "%s/%s/%s"%(getDirByAnaType(options.scandateListAnaType, cName, options.ztrim), scandate, dataFileName),
+                dict_chamberGEBtype.get(cName, options.GEBtype)))
+            pass
+        pass
+    if len(listOfInputs) == 0:
+        print("No input given, please supply --infilename or --scandateList")
+        exit(os.EX_USAGE)
+
+    # Parse the calibration and create the fit workers once for all inputs
+    calInfo = parseCalFile(options.calFile)
+    dict_mappings = {}
+    fitPool = None
+    if options.performFit and not options.remaskOnly and options.nFitWorkers > 1 and len(listOfInputs) > 1:
+        from multiprocessing import Pool
+        fitPool = Pool(options.nFitWorkers)
+        pass
+
+    listOfFailedInputs = []
+    try:
+        for inputFilename,inputGEBtype in listOfInputs:
+            if not os.path.isfile(inputFilename):
+                print("No file to analyze. %s does not exist"%(inputFilename))
+                listOfFailedInputs.append(inputFilename)
+                continue
+            try:
+                anaUltraScurve(options, inputFilename, inputGEBtype, calInfo, dict_mappings, fitPool)
+            except Exception as e:
+                if len(listOfInputs) == 1:
+                    raise
+                print("Analysis of %s failed: %s"%(inputFilename, e))
+                listOfFailedInputs.append(inputFilename)
+                pass
+            pass
+    finally:
+        if fitPool is not None:
+            fitPool.close()
+            fitPool.join()
+            pass
+        pass
+
+    if len(listOfFailedInputs) > 0:
+        print("The following inputs were not analyzed:")
+        for inputFilename in listOfFailedInputs:
+            print("\t%s"%(inputFilename))
+            pass
+        exit(os.EX_SOFTWARE)
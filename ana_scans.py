@@ -8,37 +8,58 @@ ana\_scans
 .. moduleauthor:: Brian Dorney <brian.l.dorney@cern.ch>
 """
 
+def preloadAnaModules():
+  """
+  Imports the heavy modules of the in-process backend in the main process,
+  the worker processes forked from it then start with them loaded.  Each
+  job runs in a fresh worker (maxTasksPerChild=1), so the ROOT global state
+  of a job does not leak into the next one and a crash only fails its job.
+  """
+  import numpy
+  import root_numpy
+  import ROOT
+  ROOT.gROOT.SetBatch(True)
+
+  from gempython.gemplotting.utils import anautilities
+  from gempython.gemplotting.fitting import fitScanData
+  return
+
 def launchAna(args):
   return launchAnaArgs(*args)
 
-def launchAnaArgs(anaType, cName, cType, scandate,
+def getAnaCommand(anaType, cName, cType, scandate,
                   scandatetrim=None, ztrim=4.0, chConfigKnown=False,
                   channels=False, panasonic=False,
-                  latFit=False, latSigRange=None, latSigMaskRange=None):
+                  latFit=False, latSigRange=None, latSigMaskRange=None,
+                  fitCache=None, fitCacheMaxSize=None):
+  """
+  Builds the command analyzing one scan, the arguments are those of
+  launchAnaArgs.  Returns a tuple of:
+    [0] -> directory of the scandate
+    [1] -> list of the input files
+    [2] -> list of the output files of the command
+    [3] -> the command, as a list
+    [4] -> list of (source, destination) pairs of the files copied to the elog
+  """
   import os
-  import subprocess
-  from subprocess import CalledProcessError
 
   from gempython.gemplotting.utils.anaInfo import ana_config
   from gempython.gemplotting.utils.anautilities import getDirByAnaType
-  from gempython.utils.wrappers import runCommand
 
   #dataPath  = os.getenv('DATA_PATH')
   dirPath   = getDirByAnaType(anaType, cName, ztrim)
   elogPath  = "%s/%s"%(os.getenv('ELOG_PATH'),scandate)
 
-  print "Analysis Requested: %s"%(anaType)
-
   #Build Commands
   cmd = [ana_config[anaType]]
-  postCmds = []
-  postCmds.append(["mkdir","-p","%s"%(elogPath)])
+  inputs = []
+  outputs = []
+  postCopies = [] #(source, destination) pairs copied to the elog once the analysis succeeded
   if anaType == "latency":
     dirPath = "%s/%s/"%(dirPath,scandate)
     filename = dirPath + "LatencyScanData.root"
-    if not os.path.isfile(filename):
-      print "No file to analyze. %s does not exist"%(filename)
-      return os.EX_NOINPUT
+    inputs.append(filename)
+    outputs.append(dirPath + "LatencyScanData/latencyAna.root")
 
     cmd.append("--infilename=%s"%(filename))
     cmd.append("--outfilename=%s"%("latencyAna.root"))
@@ -48,23 +69,22 @@ def launchAnaArgs(anaType, cName, cType, scandate,
         cmd.append("--latSigMaskRange=%s"%(latSigMaskRange))
         cmd.append("--latSigRange=%s"%(latSigRange))
 
-    postCmds.append(["cp","%s/LatencyScanData/Summary.png"%(dirPath),
-                 "%s/LatencySumary_%s.png"%(elogPath,cName)])
-    postCmds.append(["cp","%s/LatencyScanData/MaxHitsPerLatByVFAT.png"%(dirPath),
-                 "%s/MaxHitsPerLatByVFAT_%s.png"%(elogPath,cName)])
+    postCopies.append(("%s/LatencyScanData/Summary.png"%(dirPath),
+                 "%s/LatencySumary_%s.png"%(elogPath,cName)))
+    postCopies.append(("%s/LatencyScanData/MaxHitsPerLatByVFAT.png"%(dirPath),
+                 "%s/MaxHitsPerLatByVFAT_%s.png"%(elogPath,cName)))
     if latFit:
-        postCmds.append(["cp","%s/LatencyScanData/SignalOverBkg.png"%(dirPath),
-                 "%s/SignalOverBkg_%s.png"%(elogPath,cName)])
-        postCmds.append(["cp","%s/LatencyScanData/SignalNoBkg.png"%(dirPath),
-                 "%s/SignalNoBkg_%s.png"%(elogPath,cName)])
+        postCopies.append(("%s/LatencyScanData/SignalOverBkg.png"%(dirPath),
+                 "%s/SignalOverBkg_%s.png"%(elogPath,cName)))
+        postCopies.append(("%s/LatencyScanData/SignalNoBkg.png"%(dirPath),
+                 "%s/SignalNoBkg_%s.png"%(elogPath,cName)))
 
     pass
   elif anaType == "scurve":
     dirPath = "%s/%s/"%(dirPath,scandate)
     filename = dirPath + "SCurveData.root"
-    if not os.path.isfile(filename):
-      print "No file to analyze. %s does not exist"%(filename)
-      return os.EX_NOINPUT
+    inputs.append(filename)
+    outputs.append(dirPath + "SCurveData/SCurveFitData.root")
 
     cmd.append("--infilename=%s"%(filename))
     cmd.append("--outfilename=%s"%("SCurveFitData.root"))
@@ -76,18 +96,23 @@ def launchAnaArgs(anaType, cName, cType, scandate,
     if panasonic:
         cmd.append("--panasonic")
         pass
+    if fitCache is not None:
+        cmd.append("--fitCache=%s"%(fitCache))
+        if fitCacheMaxSize is not None:
+            cmd.append("--fitCacheMaxSize=%f"%(fitCacheMaxSize))
+            pass
+        pass
 
-    postCmds.append(["cp","%s/SCurveData/Summary.png"%(dirPath),
-                 "%s/SCurveSummary_%s_ztrim%2.2f.png"%(elogPath,cName,ztrim)])
-    postCmds.append(["cp","%s/SCurveData/chConfig.txt"%(dirPath),
-                 "%s/chConfig_%s_ztrim%2.2f.txt"%(elogPath,cName,ztrim)])
+    postCopies.append(("%s/SCurveData/Summary.png"%(dirPath),
+                 "%s/SCurveSummary_%s_ztrim%2.2f.png"%(elogPath,cName,ztrim)))
+    postCopies.append(("%s/SCurveData/chConfig.txt"%(dirPath),
+                 "%s/chConfig_%s_ztrim%2.2f.txt"%(elogPath,cName,ztrim)))
     pass
   elif "threshold" in anaType:
     dirPath = "%s/%s/"%(dirPath,scandate)
     filename = dirPath + "ThresholdScanData.root"
-    if not os.path.isfile(filename):
-      print "No threshold file to analyze. %s does not exist"%(filename)
-      return os.EX_NOINPUT
+    inputs.append(filename)
+    outputs.append(dirPath + "ThresholdScanData/ThresholdPlots.root")
 
     cmd.append("--infilename=%s"%(filename))
     cmd.append("--outfilename=%s"%("ThresholdPlots.root"))
@@ -99,30 +124,27 @@ def launchAnaArgs(anaType, cName, cType, scandate,
       # dirPath_Trim = "%s/%s/trim/z%f/%s/SCurveData_Trimmed/"%(dataPath,cName,ztrim,scandatetrim)
       dirPath_Trim = "%s/%s/SCurveData_Trimmed/"%(getDirByAnaType("trim", cName, ztrim),scandatetrim)
       filename_Trim = dirPath_Trim + "SCurveFitData.root"
-      if not os.path.isfile(filename_Trim):
-        print "No scurve fit data file to analyze. %s does not exist"%(filename_Trim)
-        return os.EX_NOINPUT
+      inputs.append(filename_Trim)
 
       cmd.append("--fileScurveFitTree=%s"%(filename_Trim))
       pass
 
-    postCmds.append(["cp","%s/ThresholdScanData/ThreshSummary.png"%(dirPath),
-                   "%s/ThreshSummary_%s.png"%(elogPath,cName)])
-    postCmds.append(["cp","%s/ThresholdScanData/ThreshPrunedSummary.png"%(dirPath),
-                   "%s/ThreshPrunedSummary_%s.png"%(elogPath,cName)])
-    postCmds.append(["cp","%s/ThresholdScanData/vfatConfig.txt"%(dirPath),
-                   "%s/vfatConfig_%s.txt"%(elogPath,cName)])
+    postCopies.append(("%s/ThresholdScanData/ThreshSummary.png"%(dirPath),
+                   "%s/ThreshSummary_%s.png"%(elogPath,cName)))
+    postCopies.append(("%s/ThresholdScanData/ThreshPrunedSummary.png"%(dirPath),
+                   "%s/ThreshPrunedSummary_%s.png"%(elogPath,cName)))
+    postCopies.append(("%s/ThresholdScanData/vfatConfig.txt"%(dirPath),
+                   "%s/vfatConfig_%s.txt"%(elogPath,cName)))
     if chConfigKnown:
-      postCmds.append(["cp","%s/ThresholdScanData/chConfig_MasksUpdated.txt"%(dirPath),
-                     "%s/chConfig_MasksUpdated_%s.txt"%(elogPath,cName)])
+      postCopies.append(("%s/ThresholdScanData/chConfig_MasksUpdated.txt"%(dirPath),
+                     "%s/chConfig_MasksUpdated_%s.txt"%(elogPath,cName)))
       pass
     pass
   elif anaType == "trim":
     dirPath = "%s/%s/"%(dirPath,scandate)
     filename = dirPath + "SCurveData_Trimmed.root"
-    if not os.path.isfile(filename):
-      print "No file to analyze. %s does not exist"%(filename)
-      return os.EX_NOINPUT
+    inputs.append(filename)
+    outputs.append(dirPath + "SCurveData_Trimmed/SCurveFitData.root")
 
     cmd.append("--infilename=%s"%(filename))
     cmd.append("--outfilename=%s"%("SCurveFitData.root"))
@@ -134,47 +156,256 @@ def launchAnaArgs(anaType, cName, cType, scandate,
     if panasonic:
         cmd.append("--panasonic")
         pass
+    if fitCache is not None:
+        cmd.append("--fitCache=%s"%(fitCache))
+        if fitCacheMaxSize is not None:
+            cmd.append("--fitCacheMaxSize=%f"%(fitCacheMaxSize))
+            pass
+        pass
 
-    postCmds.append(["cp","%s/SCurveData_Trimmed/Summary.png"%(dirPath),
-                 "%s/SCurveSummaryTrimmed_%s_ztrim%2.2f.png"%(elogPath,cName,ztrim)])
-    postCmds.append(["cp","%s/SCurveData_Trimmed/chConfig.txt"%(dirPath),
-                 "%s/chConfigTrimmed_%s_ztrim%2.2f.txt"%(elogPath,cName,ztrim)])
+    postCopies.append(("%s/SCurveData_Trimmed/Summary.png"%(dirPath),
+                 "%s/SCurveSummaryTrimmed_%s_ztrim%2.2f.png"%(elogPath,cName,ztrim)))
+    postCopies.append(("%s/SCurveData_Trimmed/chConfig.txt"%(dirPath),
+                 "%s/chConfigTrimmed_%s_ztrim%2.2f.txt"%(elogPath,cName,ztrim)))
     pass
 
+  return (dirPath, inputs, outputs, cmd, postCopies)
+
+def launchAnaArgs(anaType, cName, cType, scandate,
+                  scandatetrim=None, ztrim=4.0, chConfigKnown=False,
+                  channels=False, panasonic=False,
+                  latFit=False, latSigRange=None, latSigMaskRange=None,
+                  fitCache=None, fitCacheMaxSize=None, inProcess=False):
+  import os
+  import shutil
+  from subprocess import CalledProcessError
+
+  from gempython.utils.wrappers import runCommand
+
+  print "Analysis Requested: %s"%(anaType)
+
+  dirPath, inputs, outputs, cmd, postCopies = getAnaCommand(anaType, cName, cType, scandate,
+                                                            scandatetrim, ztrim, chConfigKnown,
+                                                            channels, panasonic,
+                                                            latFit, latSigRange, latSigMaskRange,
+                                                            fitCache, fitCacheMaxSize)
+  for filename in inputs:
+    if not os.path.isfile(filename):
+      print "No file to analyze. %s does not exist"%(filename)
+      return os.EX_NOINPUT
+    pass
+  elogPath  = "%s/%s"%(os.getenv('ELOG_PATH'),scandate)
+
   #Execute Commands
   try:
     log = file("%s/anaLog.log"%(dirPath),"w")
 
-    returncode = runCommand(cmd,log)
+    if inProcess:
+      returncode = runAnaInProcess(cmd,log)
+    else:
+      returncode = runCommand(cmd,log)
     if returncode != 0:
       print "Error: command exited with non-zero code %d" % returncode
       return returncode
-    for item in postCmds:
-      returncode = runCommand(item)
-      if returncode != 0:
-        print "Error: command exited with non-zero code %d" % returncode
-        return returncode
+
+    # Several jobs may create the elog directory at the same time
+    try:
+      os.makedirs(elogPath)
+    except OSError:
+      if not os.path.isdir(elogPath):
+        raise
+    for source,destination in postCopies:
+      shutil.copy(source,destination)
       pass
   except CalledProcessError as e:
     print "Caught exception",e
     return -1
+  except (IOError, OSError) as e:
+    print "Caught exception",e
+    return os.EX_IOERR
     pass
   return 0
 
+def runAnaInProcess(cmd, log=None):
+  """
+  Runs the __main__ block of an analysis tool in the current process, as
+  runCommand would run it in a new one, and returns its exit code.  The tool
+  is found in the PATH, its output is written to log.
+
+  The pool workers running this are daemonic and can't start processes, the
+  options making the tool start its own (--drawbad, --nFitWorkers > 1) are
+  refused with EX_USAGE.
+  """
+  import os
+  import runpy
+  import sys
+  import traceback
+  from distutils.spawn import find_executable
+
+  from gempython.gemplotting.utils import anaoptions
+
+  for idx,arg in enumerate(cmd[1:]):
+    name, sep, value = arg.partition("=")
+    if name == "--nFitWorkers" and not sep:
+      value = cmd[idx+2] if idx+2 < len(cmd) else ""
+      pass
+    if name in ("-b", "--drawbad") or (name == "--nFitWorkers" and value.strip() != "1"):
+      print "Error: %s starts worker processes, it can't be used in-process"%(name)
+      return os.EX_USAGE
+    pass
+
+  toolPath = find_executable(cmd[0])
+  if toolPath is None:
+    print "Error: %s not found in PATH"%(cmd[0])
+    return os.EX_UNAVAILABLE
+
+  # The tools add their options to the parser of anaoptions, start from a new one
+  reload(anaoptions)
+
+  # Redirect the file descriptors, to also get the output of ROOT in the log
+  sys.stdout.flush()
+  sys.stderr.flush()
+  savedArgv = sys.argv
+  savedFDs = (os.dup(1), os.dup(2))
+  if log is not None:
+    os.dup2(log.fileno(),1)
+    os.dup2(log.fileno(),2)
+    pass
+  sys.argv = [toolPath] + list(cmd[1:])
+
+  returncode = 0
+  try:
+    runpy.run_path(toolPath, run_name="__main__")
+  except SystemExit as e:
+    if e.code is None:
+      returncode = 0
+    elif isinstance(e.code, int):
+      returncode = e.code
+    else:
+      print e.code
+      returncode = 1
+  except Exception:
+    traceback.print_exc()
+    returncode = 1
+  finally:
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os.dup2(savedFDs[0],1)
+    os.dup2(savedFDs[1],2)
+    os.close(savedFDs[0])
+    os.close(savedFDs[1])
+    sys.argv = savedArgv
+
+  return returncode
+
+def watchScans(listOfAnaTypes, listOfChambers, makeJobArgs, stateFileName,
+               pollInterval=300., settleTime=120., once=False, ztrim=4.0,
+               memPerJob=2000., maxWorkers=None, history=None, historyKey=None, maxTasksPerChild=None):
+  """
+  Watches the directories of each analysis type and chamber for new
+  scandates and analyzes them as soon as their raw data file is complete.
+  Each scandate is analyzed once, the analyzed ones are stored in the JSON
+  file stateFileName.  The S-curve fit results of the scurve and trim
+  analyses are appended to the timeSeries.npz file of the chamber, see
+  anahistory.appendScanToTimeSeries.  Returns the list of (key, code) of the
+  failed analyses.
+
+  listOfAnaTypes - analysis types to watch, keys of anaInfo.tree_names
+  listOfChambers - list of (chamber name, GEB type) to watch
+  makeJobArgs    - function of (anaType, cName, cType, scandate) returning
+                   the arguments of launchAnaArgs
+  stateFileName  - JSON file storing the status of the analyzed scandates
+  pollInterval   - time in seconds between two looks at the directories
+  settleTime     - time in seconds a raw data file must stay unmodified
+                   before it is analyzed
+  once           - look at the directories once, analyze the new scandates
+                   and return
+  ztrim          - ztrim of the trim directories
+  memPerJob, maxWorkers - as in anascheduler.getNWorkers
+  history, historyKey, maxTasksPerChild - as in anascheduler.runJobs
+  """
+  import time
+
+  from gempython.gemplotting.utils.anahistory import appendScanToTimeSeries
+  from gempython.gemplotting.utils.anaInfo import tree_names
+  from gempython.gemplotting.utils.anascheduler import getNWorkers, runJobs
+  from gempython.gemplotting.utils.anautilities import getDirByAnaType
+  from gempython.gemplotting.utils.anawatcher import ScanDateWatcher
+
+  watcher = ScanDateWatcher(stateFileName, settleTime)
+  listOfFailedJobs = []
+  while True:
+    # One job per new scandate, keyed by analysis type, chamber name and scandate
+    dict_jobArgs = {}
+    for anaType in listOfAnaTypes:
+      for cName,cType in listOfChambers:
+        prefix = "%s/%s"%(anaType, cName)
+        for scandate in watcher.findNewScanDates(prefix, getDirByAnaType(anaType, cName, ztrim), tree_names[anaType][0]):
+          dict_jobArgs["%s/%s"%(prefix, scandate)] = makeJobArgs(anaType, cName, cType, scandate)
+          pass
+        pass
+      pass
+
+    if len(dict_jobArgs) > 0:
+      nWorkers = getNWorkers(len(dict_jobArgs), memPerJob, maxWorkers)
+      print "%s: analyzing %i new scans (using %i workers)"%(time.strftime("%Y.%m.%d.%H.%M"), len(dict_jobArgs), nWorkers)
+      for key,returncode,runtime,error in runJobs(launchAnaArgs, dict_jobArgs.items(), nWorkers, history, None, historyKey, maxTasksPerChild):
+        if error is not None:
+          print "%s failed after %.1f s with exception:\n%s"%(key, runtime, error)
+          returncode = -1
+        elif returncode != 0:
+          print "%s failed after %.1f s with code %d"%(key, runtime, returncode)
+        else:
+          print "%s done in %.1f s"%(key, runtime)
+          anaType, cName, scandate = key.split("/")
+          if anaType in ("scurve", "trim"):
+            fitFileName = getAnaCommand(*dict_jobArgs[key][:-1])[2][0]
+            timeSeriesFileName = "%s/timeSeries.npz"%(getDirByAnaType(anaType, cName, ztrim))
+            try:
+              appendScanToTimeSeries(timeSeriesFileName, scandate, fitFileName)
+            except Exception as e:
+              print "Failed to add %s to %s: %s"%(key, timeSeriesFileName, e)
+              pass
+            pass
+          pass
+        if returncode != 0:
+          listOfFailedJobs.append((key, returncode))
+          pass
+        watcher.markProcessed(key, returncode)
+        pass
+      if history is not None:
+        history.save()
+        pass
+      pass
+
+    if once:
+      break
+    time.sleep(pollInterval)
+    pass
+
+  return listOfFailedJobs
+
 if __name__ == '__main__':
-  import sys,os,signal
-  import subprocess
+  import sys,os
   import itertools
-  from multiprocessing import Pool, freeze_support
+  import time
+  from multiprocessing import freeze_support
 
   from gempython.gemplotting.mapping.chamberInfo import chamber_config, GEBtype
-  from gempython.gemplotting.utils.anaInfo import ana_config
+  from gempython.gemplotting.utils.anaInfo import ana_config, tree_names
+  from gempython.gemplotting.utils.anascheduler import DAGNode, getNWorkers, runDAG, runJobs, RuntimeHistory
   from gempython.utils.wrappers import envCheck
 
   from gempython.gemplotting.utils.anaoptions import parser
 
   parser.add_option("--anaType", type="string", dest="anaType",
-                    help="Analysis type to be executed, from list: "+str(ana_config.keys()), metavar="anaType")
+                    help="Comma separated list of analysis types to be executed, from list: "+str(ana_config.keys()), metavar="anaType")
+  parser.add_option("--fitCache", type="string", dest="fitCache", default=None,
+                    help="SQLite file caching the S-curve fit results between analyses, for anaType scurve and trim", metavar="fitCache")
+  parser.add_option("--fitCacheMaxSize", type="float", dest="fitCacheMaxSize", default=None,
+                    help="Maximum size in MB of the results in --fitCache, by default that of anaUltraScurve.py", metavar="fitCacheMaxSize")
+  parser.add_option("--inProcess", action="store_true", dest="inProcess", default=False,
+                    help="Run the analysis tools inside worker processes forked from this one, which imported ROOT, instead of starting one interpreter per chamber", metavar="inProcess")
   parser.add_option("--latFit", action="store_true", dest="performLatFit",
                     help="Fit the latency distributions", metavar="performLatFit")
   parser.add_option("--latSigRange", type="string", dest="latSigRange", default=None,
@@ -182,98 +413,205 @@ if __name__ == '__main__':
   parser.add_option("--latSigMaskRange", type="string", dest="latSigMaskRange", default=None,
                     help="Comma separated pair of values defining the region to be masked when trying to fit the noise, e.g. lat #notepsilon [40,44] is noise (lat < 40 || lat > 44)",
                     metavar="latSigMaskRange")
+  parser.add_option("--make", action="store_true", dest="make", default=False,
+                    help="Skip the analyses whose outputs are newer than their inputs and which last succeeded with the same command, and run the analyses depending on the outputs of others after them", metavar="make")
+  parser.add_option("--makeState", type="string", dest="makeState", default=None,
+                    help="With --make, JSON file storing the command of the last successful run of each analysis. Default is $DATA_PATH/anaMakeState.json", metavar="makeState")
+  parser.add_option("--memPerJob", type="float", dest="memPerJob", default=2000.,
+                    help="Memory used by one analysis in MB, the number of workers is limited to the available memory divided by this value", metavar="memPerJob")
+  parser.add_option("--nWorkers", type="int", dest="nWorkers", default=None,
+                    help="Maximum number of worker processes, by default one per core within the limit set by --memPerJob", metavar="nWorkers")
+  parser.add_option("--pollInterval", type="float", dest="pollInterval", default=300.,
+                    help="With --watch, time in seconds between two looks for new scandates", metavar="pollInterval")
+  parser.add_option("--runtimeHistory", type="string", dest="runtimeHistory", default=None,
+                    help="JSON file storing the runtime of each analysis, used to start the longest ones first. Default is $DATA_PATH/anaRuntimes.json", metavar="runtimeHistory")
+  parser.add_option("--scandateList", type="string", dest="scandateList", default=None,
+                    help="File listing the chamber names and scandates to analyze instead of --scandate for all chambers, see parseListOfScanDatesFile", metavar="scandateList")
   parser.add_option("--series", action="store_true", dest="series",
                     help="Run tests in series (default is false)", metavar="series")
+  parser.add_option("--settleTime", type="float", dest="settleTime", default=120.,
+                    help="With --watch, time in seconds a raw data file must stay unmodified before it is analyzed", metavar="settleTime")
+  parser.add_option("--watch", action="store_true", dest="watch", default=False,
+                    help="Analyze the new scandates of all chambers as they appear in $DATA_PATH, instead of --scandate", metavar="watch")
+  parser.add_option("--watchState", type="string", dest="watchState", default=None,
+                    help="With --watch, JSON file storing the analyzed scandates. Default is $DATA_PATH/anaWatchState.json", metavar="watchState")
+  parser.add_option("--watchOnce", action="store_true", dest="watchOnce", default=False,
+                    help="With --watch, look for new scandates once and exit when they are analyzed, e.g. when run from cron", metavar="watchOnce")
 
   (options, args) = parser.parse_args()
 
   envCheck('DATA_PATH')
   envCheck('ELOG_PATH')
 
-  if options.anaType not in ana_config.keys():
-    print "Invalid analysis specificed, please select only from the list:"
-    print ana_config.keys()
-    exit(os.EX_USAGE)
+  listOfAnaTypes = str(options.anaType).split(",")
+  for anaType in listOfAnaTypes:
+    if anaType not in ana_config.keys():
+      print "Invalid analysis specificed, please select only from the list:"
+      print ana_config.keys()
+      exit(os.EX_USAGE)
+    if options.watch and anaType not in tree_names.keys():
+      print "Analysis type %s can't be watched, please select only from the list:"%(anaType)
+      print [ key for key in tree_names.keys() if key in ana_config.keys() ]
+      exit(os.EX_USAGE)
+    pass
 
-  if options.debug:
-    print list(itertools.izip([options.anaType for x in range(len(chamber_config))],
-                         chamber_config.values(),
-                         [GEBtype[x]        for x in chamber_config.keys()],
-                         [options.scandate  for x in range(len(chamber_config))],
-                         [options.scandatetrim  for x in range(len(chamber_config))],
-                         [options.ztrim   for x in range(len(chamber_config))],
-                         [options.chConfigKnown   for x in range(len(chamber_config))],
-                         [options.channels   for x in range(len(chamber_config))],
-                         [options.PanPin   for x in range(len(chamber_config))],
-                         [options.performLatFit for x in range(len(chamber_config))],
-                         [options.latSigRange for x in range(len(chamber_config))],
-                         [options.latSigMaskRange for x in range(len(chamber_config))]
-                         )
-              )
+  def makeJobArgs(anaType, cName, cType, scandate):
+    return (anaType,
+            cName,
+            cType,
+            scandate,
+            options.scandatetrim,
+            options.ztrim,
+            options.chConfigKnown,
+            options.channels,
+            options.PanPin,
+            options.performLatFit,
+            options.latSigRange,
+            options.latSigMaskRange,
+            options.fitCache,
+            options.fitCacheMaxSize,
+            options.inProcess)
 
-  if options.series:
-    print "Running jobs in serial mode"
+  # The (chamber, GEB type, scandate) to analyze
+  listOfScans = []
+  if options.scandateList is not None:
+    from gempython.gemplotting.utils.anautilities import parseListOfScanDatesFile
+    dict_chamberGEBtype = dict((chamber_config[link], GEBtype[link]) for link in chamber_config.keys())
+    parsedListOfScanDates = parseListOfScanDatesFile(options.scandateList, alphaLabels=True)[0]
+    for cName,scandate,indepVar in parsedListOfScanDates:
+      listOfScans.append((cName, dict_chamberGEBtype.get(cName, options.GEBtype), scandate))
+      pass
+  else:
     for link in chamber_config.keys():
-      chamber = chamber_config[link]
-      GEB = GEBtype[link]
-      launchAnaArgs(options.anaType,
-                chamber,
-                GEB,
-                options.scandate,
-                options.scandatetrim,
-                options.ztrim,
-                options.chConfigKnown,
-                options.channels,
-                options.PanPin,
-                options.performLatFit,
-                options.latSigRange,
-                options.latSigMaskRange
-               )
+      listOfScans.append((chamber_config[link], GEBtype[link], options.scandate))
       pass
     pass
-  else:
-    print "Running jobs in parallel mode (using Pool(12))"
+
+  # One job per analysis type and scan, keyed by analysis type, chamber name and scandate
+  listOfJobs = []
+  for anaType,(cName,cType,scandate) in itertools.product(listOfAnaTypes, listOfScans):
+    listOfJobs.append(("%s/%s/%s"%(anaType, cName, scandate), makeJobArgs(anaType, cName, cType, scandate)))
+    pass
+
+  if options.debug:
+    for key,jobArgs in listOfJobs:
+      print key, jobArgs
+      pass
+    pass
+
+  if options.runtimeHistory is None:
+    options.runtimeHistory = "%s/anaRuntimes.json"%(os.getenv('DATA_PATH'))
+    pass
+  history = RuntimeHistory(options.runtimeHistory)
+  # In-process, each job runs in a fresh worker forked from this process
+  maxTasksPerChild = None
+  if options.inProcess:
+    preloadAnaModules()
+    maxTasksPerChild = 1
+    pass
+  # The runtime of a chamber and analysis type is not expected to depend on the scandate
+  historyKey = lambda key: key.rsplit("/",1)[0]
+
+  if options.watch:
+    if options.watchState is None:
+      options.watchState = "%s/anaWatchState.json"%(os.getenv('DATA_PATH'))
+      pass
+    maxWorkers = options.nWorkers
+    if options.series:
+      maxWorkers = 1
+      pass
     freeze_support()
-    # from: https://stackoverflow.com/questions/11312525/catch-ctrlc-sigint-and-exit-multiprocesses-gracefully-in-python
-    original_sigint_handler = signal.signal(signal.SIGINT, signal.SIG_IGN)
-    pool = Pool(12)
-    signal.signal(signal.SIGINT, original_sigint_handler)
+    print "Watching %s for new scans of %s"%(os.getenv('DATA_PATH'), ", ".join(listOfAnaTypes))
     try:
-      res = pool.map_async(launchAna,
-                           itertools.izip([options.anaType for x in range(len(chamber_config))],
-                                          chamber_config.values(),
-                                          [GEBtype[x]        for x in chamber_config.keys()],
-                                          [options.scandate  for x in range(len(chamber_config))],
-                                          [options.scandatetrim  for x in range(len(chamber_config))],
-                                          [options.ztrim   for x in range(len(chamber_config))],
-                                          [options.chConfigKnown   for x in range(len(chamber_config))],
-                                          [options.channels   for x in range(len(chamber_config))],
-                                          [options.PanPin   for x in range(len(chamber_config))],
-                                          [options.performLatFit for x in range(len(chamber_config))],
-                                          [options.latSigRange for x in range(len(chamber_config))],
-                                          [options.latSigMaskRange for x in range(len(chamber_config))]
-                                          )
-                           )
-      # timeout must be properly set, otherwise tasks will crash
-      print res.get(999999999)
-      print("Normal termination")
-      pool.close()
-      pool.join()
-      print "Results:", res.get()
-      for returncode in res.get():
-        if returncode != 0:
-          sys.exit(returncode)
-        pass
+      listOfFailedJobs = watchScans(listOfAnaTypes,
+                                    [ (chamber_config[link], GEBtype[link]) for link in chamber_config.keys() ],
+                                    makeJobArgs, options.watchState,
+                                    options.pollInterval, options.settleTime, options.watchOnce, options.ztrim,
+                                    options.memPerJob, maxWorkers, history, historyKey, maxTasksPerChild)
     except KeyboardInterrupt:
-      print("Caught KeyboardInterrupt, terminating workers")
-      pool.terminate()
-      sys.exit(-1)
-    except Exception as e:
-      print("Caught Exception %s, terminating workers"%(str(e)))
-      pool.terminate()
-      sys.exit(-1)
-    except: # catch *all* exceptions
-      e = sys.exc_info()[0]
-      print("Caught non-Python Exception %s"%(e))
-      pool.terminate()
-      sys.exit(-1)
+      print("Caught KeyboardInterrupt, stopped watching")
+      history.save()
+      sys.exit(0)
+    if len(listOfFailedJobs) > 0:
+      sys.exit(listOfFailedJobs[0][1])
+    sys.exit(os.EX_OK)
+
+  if options.series:
+    print "Running jobs in serial mode"
+    nWorkers = 1
+  else:
+    nWorkers = getNWorkers(len(listOfJobs), options.memPerJob, options.nWorkers)
+    print "Running jobs in parallel mode (using %i workers)"%(nWorkers)
+    freeze_support()
+    pass
+
+  if options.make:
+    # The analyses reading the outputs of others, e.g. threshold with --chConfigKnown, run after them
+    if options.makeState is None:
+      options.makeState = "%s/anaMakeState.json"%(os.getenv('DATA_PATH'))
+      pass
+    listOfNodes = []
+    for key,jobArgs in listOfJobs:
+      dirPath, inputs, outputs, cmd, postCopies = getAnaCommand(*jobArgs[:-1])
+      listOfNodes.append(DAGNode(key, launchAnaArgs, jobArgs, inputs,
+                                 outputs + [ destination for source,destination in postCopies ],
+                                 fingerprint=" ".join(cmd)))
+      pass
+    jobResults = runDAG(listOfNodes, nWorkers, options.makeState, None, history, historyKey, maxTasksPerChild)
+  else:
+    jobResults = ( (key, None, returncode, runtime, error) for key,returncode,runtime,error in
+                   runJobs(launchAnaArgs, listOfJobs, nWorkers, history, None, historyKey, maxTasksPerChild) )
+    pass
+
+  # Report each job as soon as it finishes
+  listOfFailedJobs = []
+  dict_anaTypeStats = dict((anaType, [0, 0, 0, 0.]) for anaType in listOfAnaTypes) #number of jobs, number of skipped jobs, number of failed jobs, total runtime
+  startTime = time.time()
+  try:
+    for idx,(key,status,returncode,runtime,error) in enumerate(jobResults):
+      anaType = key.split("/")[0]
+      dict_anaTypeStats[anaType][0] += 1
+      dict_anaTypeStats[anaType][3] += runtime
+      progress = "[%i/%i]"%(idx+1, len(listOfJobs))
+      if status == "skipped":
+        print "%s %s is up to date"%(progress, key)
+        dict_anaTypeStats[anaType][1] += 1
+      elif status == "blocked":
+        print "%s %s not run, an analysis it depends on failed"%(progress, key)
+        listOfFailedJobs.append((key, os.EX_NOINPUT))
+        dict_anaTypeStats[anaType][2] += 1
+      elif error is not None:
+        print "%s %s failed after %.1f s with exception:\n%s"%(progress, key, runtime, error)
+        listOfFailedJobs.append((key, -1))
+        dict_anaTypeStats[anaType][2] += 1
+      elif returncode != 0:
+        print "%s %s failed after %.1f s with code %d"%(progress, key, runtime, returncode)
+        listOfFailedJobs.append((key, returncode))
+        dict_anaTypeStats[anaType][2] += 1
+      else:
+        print "%s %s done in %.1f s"%(progress, key, runtime)
+        pass
+      pass
+  except KeyboardInterrupt:
+    print("Caught KeyboardInterrupt, terminating workers")
+    sys.exit(-1)
+  finally:
+    history.save()
+
+  wallTime = time.time() - startTime
+  print ""
+  print "| anaType | Jobs | Up to Date | Failed | Total Runtime (s) | Mean Runtime (s) |"
+  print "| :-----: | :--: | :--------: | :----: | :---------------: | :--------------: |"
+  for anaType in listOfAnaTypes:
+    nJobs, nSkipped, nFailed, totalRuntime = dict_anaTypeStats[anaType]
+    print "| %s | %i | %i | %i | %.1f | %.1f |"%(anaType, nJobs, nSkipped, nFailed, totalRuntime, totalRuntime / max(nJobs - nSkipped, 1))
+    pass
+  print ""
+  print "%i of %i jobs succeeded in %.1f s on %i workers, %.1f jobs per hour"%(
+      len(listOfJobs) - len(listOfFailedJobs), len(listOfJobs), wallTime, nWorkers, 3600. * len(listOfJobs) / max(wallTime, 1e-3))
+  if len(listOfFailedJobs) > 0:
+    print "Failed jobs:"
+    for key,returncode in listOfFailedJobs:
+      print "\t%s (code %d)"%(key, returncode)
+      pass
+    sys.exit(listOfFailedJobs[0][1])
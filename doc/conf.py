@@ -242,6 +242,8 @@ man_pages = [
      authors, 1),
     ('man/anaDACScan', 'anaDACScan.py', u'Perform a DAC scan analysis',
      authors, 1),
+    ('man/benchmarkScurveFits', 'benchmarkScurveFits.py', u'Compare the speed of the S-curve fit backends',
+     authors, 1),
     ('man/clusterAnaScurve', 'clusterAnaScurve.py', u'Analyze S-curves using the LSF cluster',
      authors, 1),
     ('man/gemPlotter', 'gemPlotter.py', u'Plot time evolution of scan results',
@@ -0,0 +1,123 @@
+r"""
+``fitCache`` --- Persistent cache of S-curve fit results
+========================================================
+
+.. code-block:: python
+
+    import gempython.gemplotting.fitting.fitCache
+
+Documentation
+-------------
+"""
+
+import numpy as np
+import sqlite3
+import time
+
+class FitCache(object):
+    """
+    Stores per-channel fit results in an SQLite file so that unchanged
+    S-curves are not fitted again by later analyses.
+
+    Results are indexed by a key describing everything the fit depends on,
+    see :py:meth:`gempython.gemplotting.fitting.fitScanData.ScanDataFitter.getCacheKeys`.
+    When the results take more than :py:attr:`maxSizeMB` in the file, the
+    least recently used ones are removed. The space they used is reused by
+    the next results, so the file stays close to this size.
+
+    Example:
+        Typical usage:
+
+        .. code-block:: python
+
+            cache = FitCache("scurveFitCache.sqlite")
+            fitter.fit(fitCache=cache)
+            cache.close()
+
+    Attributes:
+        fileName (string): Path to the SQLite file
+        maxSizeMB (float): Maximum size of the stored results in MB
+    """
+
+    def __init__(self, fileName, maxSizeMB=200.):
+        self.fileName = fileName
+        self.maxSizeMB = maxSizeMB
+
+        # Several analyses may share the cache, wait for the others
+        self.conn = sqlite3.connect(fileName, timeout=60)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS fitResults (key TEXT PRIMARY KEY, result BLOB NOT NULL, lastUsed REAL NOT NULL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS fitResultsLastUsed ON fitResults (lastUsed)")
+        self.conn.commit()
+
+        return
+
+    def close(self):
+        """Closes the SQLite file"""
+        self.conn.close()
+        return
+
+    def evict(self):
+        """
+        Removes the least recently used results until they take at most
+        :py:attr:`maxSizeMB`. The size is converted to a number of results
+        with the average size of a result, from the pages used in the file.
+
+        Returns: The number of removed results
+        """
+        usedBytes = (self.conn.execute("PRAGMA page_count").fetchone()[0]
+                     - self.conn.execute("PRAGMA freelist_count").fetchone()[0]) * self.conn.execute("PRAGMA page_size").fetchone()[0]
+        maxBytes = self.maxSizeMB * 1024 * 1024
+        if usedBytes <= maxBytes:
+            return 0
+
+        nEntries = self.conn.execute("SELECT COUNT(*) FROM fitResults").fetchone()[0]
+        nEvicted = min(int(np.ceil(nEntries * (usedBytes - maxBytes) / float(usedBytes))), nEntries)
+        if nEvicted > 0:
+            self.conn.execute("DELETE FROM fitResults WHERE key IN (SELECT key FROM fitResults ORDER BY lastUsed ASC LIMIT ?)", (nEvicted,))
+            self.conn.commit()
+            pass
+
+        return nEvicted
+
+    def get(self, keys):
+        """
+        Looks up results in the cache.
+
+        Args:
+            keys (list): Keys of the results, as ``str``
+
+        Returns: A ``dict`` with the keys that were found and their results as
+            ``numpy.ndarray`` of ``float``
+        """
+        results = {}
+        now = time.time()
+
+        # SQLite limits the number of parameters of a statement
+        for first in range(0,len(keys),500):
+            chunk = list(keys[first:first+500])
+            placeholders = ",".join("?" * len(chunk))
+            for key,result in self.conn.execute("SELECT key, result FROM fitResults WHERE key IN (%s)"%(placeholders), chunk):
+                results[str(key)] = np.frombuffer(result, dtype=float).copy()
+                pass
+            self.conn.execute("UPDATE fitResults SET lastUsed = ? WHERE key IN (%s)"%(placeholders), [now] + chunk)
+            pass
+        self.conn.commit()
+
+        return results
+
+    def put(self, results):
+        """
+        Stores results in the cache, then applies :py:meth:`evict`.
+
+        Args:
+            results (dict): Results as ``numpy.ndarray`` of ``float``, indexed
+                by their key
+        """
+        now = time.time()
+        self.conn.executemany(
+                "INSERT OR REPLACE INTO fitResults (key, result, lastUsed) VALUES (?, ?, ?)",
+                [ (key, sqlite3.Binary(np.asarray(result, dtype=float).tobytes()), now) for key,result in results.items() ])
+        self.conn.commit()
+        self.evict()
+
+        return
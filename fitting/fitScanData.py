@@ -12,15 +12,67 @@ Documentation
 
 import numpy as np
 import ROOT as r
+import time
 from gempython.gemplotting.utils.anaInfo import dict_calSF
 
+#: Fitting backends understood by :py:class:`ScanDataFitter`:
+#:
+#: * ``root``: each channel is fitted with ``TH1::Fit`` and randomized restarts
+#: * ``numpy``: all channels of a VFAT are fitted at once by a bounded
+#:   Levenberg-Marquardt minimization, channels that fail to converge are
+#:   refitted with the ``root`` backend
+#: * ``probit``: the mean and width of all channels of a VFAT are estimated in
+#:   closed form by a weighted linear regression of the inverse error function
+#:   of the occupancy, channels where this fails (and optionally channels with
+#:   a poor :math:`\chi^2`) are refitted with the ``root`` backend
+#: * ``rootfitter``: as ``root``, but the S-curves are loaded into a
+#:   ``ROOT::Fit::BinData`` directly from the arrays and fitted by one
+#:   ``ROOT::Fit::Fitter`` reused for all channels of a VFAT
+fitModes = [
+        "root",
+        "numpy",
+        "probit",
+        "rootfitter"
+        ]
+
+#: Version of the fitting procedure, it is part of the keys of
+#: :py:class:`gempython.gemplotting.fitting.fitCache.FitCache` and must be
+#: increased whenever a change of the fit procedure changes its results
+fitterVersion = 1
+
+class _ChannelView(object):
+    """
+    Gives ``[vfat][channel]`` item access to objects that are built on demand.
+
+    Args:
+        getter (function): Called as ``getter(vfat, channel)`` to get an item
+        setter (function): Called as ``setter(vfat, channel, value)`` to set
+            an item
+        vfat (int): If not ``None``, the view only covers this VFAT
+    """
+    def __init__(self, getter, setter, vfat=None):
+        self.getter = getter
+        self.setter = setter
+        self.vfat = vfat
+
+    def __getitem__(self, key):
+        if self.vfat is None:
+            return _ChannelView(self.getter, self.setter, key)
+        return self.getter(self.vfat, key)
+
+    def __setitem__(self, key, value):
+        if self.vfat is None:
+            raise TypeError("items can only be set as [vfat][channel]")
+        self.setter(self.vfat, key, value)
+
 class DeadChannelFinder(object):
     r"""
     Finds channels that returned no data during an S-curve scan ("dead"
     channels).
 
     This class has only one function, :py:meth:`feed`, that takes an entry from
-    the S-curve tree and updates the results.
+    the S-curve tree and updates the results. :py:meth:`feedArrays` does the
+    same for whole columns of the S-curve tree at once.
 
     Example:
         Typical usage:
@@ -48,6 +100,22 @@ class DeadChannelFinder(object):
         """
         self.isDead[event.vfatN][event.vfatCH] = False
 
+    def feedArrays(self, vfatN, vfatCH, **kwargs):
+        """
+        Takes columns of the S-curve tree, e.g. from
+        ``root_numpy.tree2array``, and updates the results accordingly.
+
+        Args:
+            vfatN (numpy.ndarray): The ``vfatN`` column
+            vfatCH (numpy.ndarray): The ``vfatCH`` column
+        """
+        seen = np.bincount(128*np.asarray(vfatN, dtype=int)+np.asarray(vfatCH, dtype=int), minlength=24*128) > 0
+        for vfat in range(0,24):
+            self.isDead[vfat][seen[(vfat*128):((vfat+1)*128)]] = False
+            pass
+
+        return
+
 class ScanDataFitter(DeadChannelFinder):
     r"""
     Fits S-curves.
@@ -55,9 +123,13 @@ class ScanDataFitter(DeadChannelFinder):
     This class is used in two steps:
 
     #. The data to fit is passed to the object using :py:meth:`feedHisto`,
-       :py:meth:`readFile` or repeated calls to :py:meth:`feed`.
+       :py:meth:`readFile`, :py:meth:`feedArrays` or repeated calls to
+       :py:meth:`feed`.
     #. The fit is performed by calling :py:meth:`fit`.
 
+    The S-curves and fit results of an earlier analysis can also be loaded
+    back with :py:meth:`readScurveFile`.
+
     One cannot count on all attributes being present before calling
     :py:meth:`fit`.
 
@@ -68,10 +140,18 @@ class ScanDataFitter(DeadChannelFinder):
 
     See :program:`anaUltraScurve.py` for example usage.
 
+    The S-curves and the fit results are stored in ``numpy`` arrays. The
+    ``TH1D`` and ``TF1`` objects of a channel are only built when they are
+    accessed through :py:attr:`scanHistos`, :py:attr:`scanFuncs`,
+    :py:meth:`getHisto` or :py:meth:`getFunc`.
+
     Attributes:
         Nev (ndict): 2D array of ``int``, indexed as ``[vfat][channel]``.
 
-        scanFuncs (ndict): 2D array of ``TF1``, indexed as ``[vfat][channel]``.
+        nBins (int): Number of charge bins of the S-curves
+
+        scanFuncs: 2D array of ``TF1``, indexed as ``[vfat][channel]``, see
+            :py:meth:`getFunc`.
             After fitting, each entry contains the fit function for the
             corresponding channel. The functions are color-coded:
 
@@ -84,14 +164,34 @@ class ScanDataFitter(DeadChannelFinder):
             Orange  Fit result is empty
             ======= =====================================
 
-        scanHistos (ndict): 2D array of ``TH1``, indexed as
-            ``[vfat][channel]``, that contain the S-curve results (number of
-            events vs charge)
+        scanFuncsParams (numpy.ndarray): Parameters of the fit functions,
+            indexed as ``[vfat][channel][parameter]``
+
+        scanFuncsColors (numpy.ndarray): Line colors of the fit functions,
+            indexed as ``[vfat][channel]``
+
+        scanHistos: 2D array of ``TH1``, indexed as ``[vfat][channel]``, that
+            contain the S-curve results (number of events vs charge), see
+            :py:meth:`getHisto`
+
+        scanHistosChargeBins (numpy.ndarray): Charge bin edges of the
+            S-curves, ``nBins+1`` entries per VFAT, indexed as ``[vfat][bin]``
+
+        scanHistosContents (numpy.ndarray): Bin contents of the S-curves,
+            including underflow and overflow, indexed as
+            ``[vfat][channel][bin]`` with the ``ROOT`` bin numbering
+
+        scanHistosErrors (numpy.ndarray): Bin errors of the S-curves, same
+            layout as :py:attr:`scanHistosContents`
 
         scanCount (ndict): 2D array of ``int``, indexed as ``[vfat][channel]``.
             Each entry contains the total number of events for the corresponding
             channel.
 
+        seedParams (numpy.ndarray): Parameters 0 to 2 of previous fits used as
+            initial guesses, indexed as ``[vfat][channel][parameter]``. ``NaN``
+            if the channel has no previous fit, see :py:meth:`readSeedFile`.
+
         scanFitResults (ndict): 3D array of ``float``, indexed as
             ``[idx][vfat][channel]``, that contain the fit results. ``idx`` has
             the following meaning:
@@ -127,23 +227,63 @@ class ScanDataFitter(DeadChannelFinder):
             If no value was given at construction time, this is an arrays of
             zeros.
 
+        fitNCalls (numpy.ndarray): Number of ``TH1::Fit`` (Minuit) calls made
+            for each channel, indexed as ``[vfat][channel]``
+
+        fitNRestarts (numpy.ndarray): Number of randomized restarts tried for
+            each channel, indexed as ``[vfat][channel]``
+
+        fitStepN (numpy.ndarray): Final value of the restart counter
+            ``stepN`` for each channel, indexed as ``[vfat][channel]``
+
+        fitStopChi2 (numpy.ndarray): Whether the fit of each channel stopped
+            because it reached a :math:`\chi^2` below 50, indexed as
+            ``[vfat][channel]``
+
+        fitTime (numpy.ndarray): Wall time in seconds spent fitting each
+            channel, indexed as ``[vfat][channel]``. Channels fitted by
+            :py:meth:`fitBatch` share the time of the batch fit equally.
+
         isVFAT3 (bool): Whether the detector under consideration uses VFAT3
+
+        fitMode (str): Fitting backend used by :py:meth:`fit`, one of
+            :py:data:`fitModes`
+
+        fitROI (bool): Whether the fits are restricted to the transition
+            region of each S-curve, see :py:meth:`getROI`
+
+        roiMargin (int): Number of bins added on each side of the transition
+            region when :py:attr:`fitROI` is set
+
+        probitMaxChi2NDF (float): With the ``probit`` backend, channels whose
+            :math:`\chi^2/NDF` exceeds this value are refitted with the
+            ``root`` backend. If ``None``, no channel is refitted because of
+            its :math:`\chi^2`.
     """
 
-    def __init__(self, calDAC2Q_m=None, calDAC2Q_b=None, isVFAT3=False):
+    def __init__(self, calDAC2Q_m=None, calDAC2Q_b=None, isVFAT3=False, fitMode="root", probitMaxChi2NDF=None,
+                 fitROI=False, roiMargin=5):
         super(ScanDataFitter, self).__init__()
 
+        if fitMode not in fitModes:
+            print "ScanDataFitter() - fitMode '%s' not supported"%(fitMode)
+            print "ScanDataFitter() - I was expecting one of the following: ", fitModes
+            raise LookupError
+
         from gempython.utils.nesteddict import nesteddict as ndict
         r.gStyle.SetOptStat(0)
 
         self.Nev = ndict()
-        self.scanFuncs  = ndict()
-        self.scanHistos = ndict()
-        self.scanHistosChargeBins = ndict()
+        self.scanFuncs  = _ChannelView(self.getFunc, self.setFunc)
+        self.scanHistos = _ChannelView(self.getHisto, self.setHisto)
         self.scanCount  = ndict()
         self.scanFitResults   = ndict()
 
         self.isVFAT3    = isVFAT3
+        self.fitMode    = fitMode
+        self.probitMaxChi2NDF = probitMaxChi2NDF
+        self.fitROI     = fitROI
+        self.roiMargin  = roiMargin
 
         self.calDAC2Q_m = np.ones(24)
         if calDAC2Q_m is not None:
@@ -153,6 +293,15 @@ class ScanDataFitter(DeadChannelFinder):
         if calDAC2Q_b is not None:
             self.calDAC2Q_b = calDAC2Q_b
 
+        # Same binning as TH1D(name, title, nBins, low, high), the edges are
+        # computed as TAxis::GetBinLowEdge() does
+        self.nBins = 254
+        self.scanHistosChargeBins = np.zeros((24,self.nBins+1))
+        self.scanHistosContents = np.zeros((24,128,self.nBins+2))
+        self.scanHistosErrors = np.zeros((24,128,self.nBins+2))
+        self.scanFuncsParams = np.zeros((24,128,4))
+        self.scanFuncsColors = np.full((24,128), r.kBlack, dtype=int)
+        self.seedParams = np.full((24,128,3), np.nan)
         for vfat in range(0,24):
             self.scanFitResults[0][vfat] = np.zeros(128)
             self.scanFitResults[1][vfat] = np.zeros(128)
@@ -163,23 +312,30 @@ class ScanDataFitter(DeadChannelFinder):
             self.scanFitResults[6][vfat] = np.zeros(128, dtype=bool)
             for ch in range(0,128):
                 self.scanCount[vfat][ch] = 0
-                if self.isVFAT3:
-                    self.scanFuncs[vfat][ch] = r.TF1('scurveFit_vfat%i_chan%i'%(vfat,ch),'[3]*TMath::Erf((TMath::Max([2],x)-[0])/(TMath::Sqrt(2)*[1]))+[3]',
-                            self.calDAC2Q_m[vfat]*253+self.calDAC2Q_b[vfat],self.calDAC2Q_m[vfat]*1+self.calDAC2Q_b[vfat])
-                    self.scanHistos[vfat][ch] = r.TH1D('scurve_vfat%i_chan%i_h'%(vfat,ch),'scurve_vfat%i_chan%i_h'%(vfat,ch),
-                            254,self.calDAC2Q_m[vfat]*254.5+self.calDAC2Q_b[vfat],self.calDAC2Q_m[vfat]*0.5+self.calDAC2Q_b[vfat])
-                else:
-                    self.scanFuncs[vfat][ch] = r.TF1('scurveFit_vfat%i_chan%i'%(vfat,ch),'[3]*TMath::Erf((TMath::Max([2],x)-[0])/(TMath::Sqrt(2)*[1]))+[3]',
-                            self.calDAC2Q_m[vfat]*1+self.calDAC2Q_b[vfat],self.calDAC2Q_m[vfat]*253+self.calDAC2Q_b[vfat])
-                    self.scanHistos[vfat][ch] = r.TH1D('scurve_vfat%i_chan%i_h'%(vfat,ch),'scurve_vfat%i_chan%i_h'%(vfat,ch),
-                            254,self.calDAC2Q_m[vfat]*0.5+self.calDAC2Q_b[vfat],self.calDAC2Q_m[vfat]*254.5+self.calDAC2Q_b[vfat])
-                    pass
-                self.scanHistosChargeBins[vfat][ch] = [self.scanHistos[vfat][ch].GetXaxis().GetBinLowEdge(binX) for binX in range(1,self.scanHistos[vfat][ch].GetNbinsX()+2) ] #Include overflow
                 pass
+            if self.isVFAT3:
+                low = self.calDAC2Q_m[vfat]*254.5+self.calDAC2Q_b[vfat]
+                high = self.calDAC2Q_m[vfat]*0.5+self.calDAC2Q_b[vfat]
+            else:
+                low = self.calDAC2Q_m[vfat]*0.5+self.calDAC2Q_b[vfat]
+                high = self.calDAC2Q_m[vfat]*254.5+self.calDAC2Q_b[vfat]
+                pass
+            self.scanHistosChargeBins[vfat] = low + np.arange(self.nBins+1) * ((high - low) / float(self.nBins))
             pass
 
         self.fitValid = [ np.zeros(128, dtype=bool) for vfat in range(24) ]
 
+        # Fit instrumentation
+        self.fitNCalls = np.zeros((24,128), dtype=int)
+        self.fitNRestarts = np.zeros((24,128), dtype=int)
+        self.fitStepN = np.zeros((24,128), dtype=int)
+        self.fitStopChi2 = np.zeros((24,128), dtype=bool)
+        self.fitTime = np.zeros((24,128))
+
+        # ROOT objects built on demand by getHisto() and getFunc()
+        self.histoCache = {}
+        self.funcCache = {}
+
         return
 
     def feed(self, event):
@@ -205,13 +361,84 @@ class ScanDataFitter(DeadChannelFinder):
 
         from gempython.gemplotting.utils.anautilities import first_index_gt
         from math import sqrt
-        chargeBin = first_index_gt(self.scanHistosChargeBins[event.vfatN][event.vfatCH], charge)-1
-        self.scanHistos[event.vfatN][event.vfatCH].SetBinContent(chargeBin,event.Nhits)
-        self.scanHistos[event.vfatN][event.vfatCH].SetBinError(chargeBin,sqrt(event.Nhits))
+        chargeBin = first_index_gt(self.scanHistosChargeBins[event.vfatN], charge)-1
+        if chargeBin >= 0:
+            self.scanHistosContents[event.vfatN][event.vfatCH][chargeBin] = event.Nhits
+            self.scanHistosErrors[event.vfatN][event.vfatCH][chargeBin] = sqrt(event.Nhits)
+            pass
         self.Nev[event.vfatN][event.vfatCH] = event.Nev
 
         return
 
+    def feedArrays(self, vfatN, vfatCH, vcal, Nhits, Nev, calSF=None, isCurrentPulse=None):
+        """
+        Feed the fitter with whole columns of the S-curve tree at once, e.g.
+        as returned by ``root_numpy.tree2array``. This is equivalent to
+        calling :py:meth:`feed` for each entry, but the charge, the bin
+        indices and the histogram contents are computed in a vectorized way.
+
+        Args:
+            vfatN (numpy.ndarray): The ``vfatN`` column
+            vfatCH (numpy.ndarray): The ``vfatCH`` column
+            vcal (numpy.ndarray): The ``vcal`` column
+            Nhits (numpy.ndarray): The ``Nhits`` column
+            Nev (numpy.ndarray): The ``Nev`` column
+            calSF (numpy.ndarray): The ``calSF`` column, only used for VFAT3
+                entries taken in current pulse mode
+            isCurrentPulse (numpy.ndarray): The ``isCurrentPulse`` column, if
+                ``None`` voltage pulse mode is assumed
+        """
+        super(ScanDataFitter, self).feedArrays(vfatN, vfatCH)
+
+        vfatN = np.asarray(vfatN, dtype=int)
+        vfatCH = np.asarray(vfatCH, dtype=int)
+        vcal = np.asarray(vcal, dtype=float)
+        Nhits = np.asarray(Nhits, dtype=float)
+        Nev = np.asarray(Nev)
+
+        charge = self.calDAC2Q_m[vfatN]*vcal+self.calDAC2Q_b[vfatN]
+        if self.isVFAT3: #v3 electronics
+            countHits = (256-vcal) > 254
+            if isCurrentPulse is not None:
+                isCurrentPulse = np.asarray(isCurrentPulse, dtype=bool)
+                calSFArray = np.array([ dict_calSF[calSFVal] for calSFVal in range(0,len(dict_calSF)) ])
+                #Q = CAL_DUR * CAL_DAC * 10nA * CAL_FS
+                charge[isCurrentPulse] = ((1./ 40079000) * vcal * (10 * 1e-9) * calSFArray[np.asarray(calSF, dtype=int)] * 1e15)[isCurrentPulse]
+                countHits[isCurrentPulse] = (vcal > 254)[isCurrentPulse]
+                pass
+        else:
+            countHits = vcal > 250
+            pass
+
+        chanIdx = 128*vfatN+vfatCH
+        sumHits = np.bincount(chanIdx[countHits], weights=Nhits[countHits], minlength=24*128)
+
+        # Last entry wins, as with repeated calls to feed()
+        lastNev = np.zeros(24*128, dtype=Nev.dtype)
+        lastNev[chanIdx] = Nev
+
+        for vfat in np.unique(vfatN).tolist():
+            thisVFAT = (vfatN == vfat)
+
+            # Same convention as first_index_gt() in feed()
+            chargeBin = np.searchsorted(self.scanHistosChargeBins[vfat], charge[thisVFAT], side='right')-1
+            inRange = chargeBin >= 0
+            chargeBin = np.minimum(chargeBin[inRange], self.nBins+1)
+            thisCH = vfatCH[thisVFAT][inRange]
+            thisNhits = Nhits[thisVFAT][inRange]
+
+            # Last entry wins for repeated bins, as with feed()
+            self.scanHistosContents[vfat][thisCH,chargeBin] = thisNhits
+            self.scanHistosErrors[vfat][thisCH,chargeBin] = np.sqrt(thisNhits)
+
+            for ch in np.unique(vfatCH[thisVFAT]).tolist():
+                self.scanCount[vfat][ch] += int(sumHits[128*vfat+ch])
+                self.Nev[vfat][ch] = lastNev[128*vfat+ch]
+                pass
+            pass
+
+        return
+
     def feedHisto(self, vfatN, vfatCH, histo, nEvts=None):
         """
         Feed the fitter with data stored in an histogram.
@@ -219,64 +446,182 @@ class ScanDataFitter(DeadChannelFinder):
         Args:
             vfatN (int): The VFAT under consideration
             vfatCH (int): The channel under consideration
-            histo (int): The data for the channel under consideration
+            histo (int): The data for the channel under consideration, see
+                :py:meth:`setHisto`
             nEvts (int): Override :py:attr`Nev` for the channel under
                 consideration (else the maximum value in the histogram is used)
         """
-        self.scanHistos[vfatN][vfatCH] = histo
+        self.setHisto(vfatN, vfatCH, histo)
         self.isDead[vfatN][vfatCH] = False
         if nEvts is None:
-            maxBin = self.scanHistos[vfatN][vfatCH].GetMaximumBin()
-            self.Nev[vfatN][vfatCH] = self.scanHistos[vfatN][vfatCH].GetBinContent(maxBin)
+            maxBin = histo.GetMaximumBin()
+            self.Nev[vfatN][vfatCH] = histo.GetBinContent(maxBin)
         else:
             self.Nev[vfatN][vfatCH] = nEvts
 
         return
 
-    def fit(self, debug=False):
+    def fit(self, debug=False, nWorkers=1, fitCache=None, pool=None):
         """
         Iteratively fits all scurves, and populates the relevant class
         attributes.
 
+        Args:
+            debug (bool): Print extra debugging information
+            nWorkers (int): Number of worker processes, if larger than one
+                the VFATs are fitted in parallel, see :py:meth:`fitParallel`
+            fitCache (FitCache): If given, channels whose result is found in
+                this :py:class:`gempython.gemplotting.fitting.fitCache.FitCache`
+                are not fitted, and the results of the fitted channels are
+                stored in it
+            pool (multiprocessing.Pool): If given, the VFATs are fitted in
+                parallel in this pool whatever ``nWorkers`` is, see
+                :py:meth:`fitParallel`
+
         Returns: The filled :py:attr:`scanFitResults`
         """
 
         r.gROOT.SetBatch(True)
         r.gStyle.SetOptStat(0)
 
+        channels = [ np.ones(128, dtype=bool) for vfat in range(0,24) ]
+        if fitCache is not None:
+            cacheKeys = [ self.getCacheKeys(vfat) for vfat in range(0,24) ]
+            cachedResults = fitCache.get([ key for vfatKeys in cacheKeys for key in vfatKeys ])
+            for vfat in range(0,24):
+                for ch,key in enumerate(cacheKeys[vfat]):
+                    if key in cachedResults:
+                        self.setChannelResults(vfat, [ch], cachedResults[key][np.newaxis,:])
+                        channels[vfat][ch] = False
+                        pass
+                    pass
+                pass
+            print 'found %i of %i channels in the fit cache'%(len(cachedResults), 24*128)
+
+        if nWorkers > 1 or pool is not None:
+            self.fitParallel(nWorkers, debug, channels, pool)
+        else:
+            for vfat in range(0,24):
+                if channels[vfat].any():
+                    self.fitVFAT(vfat, debug, channels[vfat])
+                pass
+
+        if fitCache is not None:
+            newResults = {}
+            for vfat in range(0,24):
+                results = self.getChannelResults(vfat)
+                for ch in np.flatnonzero(channels[vfat]):
+                    newResults[cacheKeys[vfat][ch]] = results[ch]
+                    pass
+                pass
+            fitCache.put(newResults)
+
+        return self.scanFitResults
+
+    def fitVFAT(self, vfat, debug=False, channels=None):
+        r"""
+        Iteratively fits all scurves of one VFAT, and populates the relevant
+        class attributes.
+
+        Each channel is first fitted starting from the initial guess of
+        :py:meth:`getInitialGuess`, i.e. from the results of a previous fit if
+        :py:meth:`readSeedFile` was called. Only if this fit does not reach a
+        :math:`\chi^2` below 50 are up to 30 randomized restarts tried. The
+        random generator is seeded from the VFAT and channel numbers, so
+        results are reproducible.
+
+        Args:
+            vfat (int): The VFAT under consideration
+            debug (bool): Print extra debugging information
+            channels (numpy.ndarray): 128 ``bool``, only the channels set to
+                ``True`` are fitted (default: all channels)
+        """
+        import root_numpy as rp
+
+        if self.isVFAT3:
+            fitTF1 = r.TF1('myERF','[3]*TMath::Erf((TMath::Max([2],x)-[0])/(TMath::Sqrt(2)*[1]))+[3]',
+                        self.calDAC2Q_m[vfat]*253+self.calDAC2Q_b[vfat],self.calDAC2Q_m[vfat]*1+self.calDAC2Q_b[vfat])
+        else:
+            fitTF1 = r.TF1('myERF','[3]*TMath::Erf((TMath::Max([2],x)-[0])/(TMath::Sqrt(2)*[1]))+[3]',
+                        self.calDAC2Q_m[vfat]*1+self.calDAC2Q_b[vfat],self.calDAC2Q_m[vfat]*253+self.calDAC2Q_b[vfat])
+        fitTF1.SetLineColor(r.kBlack)
+
+        # The channels are fitted one after the other in the same histogram
+        edges = self.scanHistosChargeBins[vfat]
+        fitHisto = r.TH1D('scurveFit_vfat%i_h'%(vfat),'scurveFit_vfat%i_h'%(vfat),self.nBins,edges[0],edges[-1])
+        fitHisto.SetDirectory(0)
+
+        # With the rootfitter backend the histogram is replaced by BinData
+        if self.fitMode == "rootfitter":
+            rootFitter = r.Fit.Fitter()
+            rootFitter.SetFunction(r.Math.WrappedMultiTF1(fitTF1, 1), False)
+            pass
+
         random = r.TRandom3()
-        random.SetSeed(0)
-        for vfat in range(0,24):
-            if self.isVFAT3:
-                fitTF1 = r.TF1('myERF','[3]*TMath::Erf((TMath::Max([2],x)-[0])/(TMath::Sqrt(2)*[1]))+[3]',
-                            self.calDAC2Q_m[vfat]*253+self.calDAC2Q_b[vfat],self.calDAC2Q_m[vfat]*1+self.calDAC2Q_b[vfat])
+        init_guess = self.getInitialGuess(vfat)
+        fitErrors = self.getFitErrors(vfat)
+        plateauLimits = None
+        if self.fitROI:
+            plateauLimits = self.getROI(vfat)[2]
+        
+        if not debug:
+            print 'fitting vfat %i'%(vfat)
+
+        # Channels left to the ROOT fit, with the numpy and probit backends
+        # only the channels they could not handle remain
+        if channels is None:
+            channels = np.ones(128, dtype=bool)
+        needsROOTFit = np.array(channels, dtype=bool)
+        if self.fitMode in ["numpy","probit"]:
+            batchStart = time.time()
+            if self.fitMode == "numpy":
+                needsROOTFit = self.fitBatch(vfat, channels)
             else:
-                fitTF1 = r.TF1('myERF','[3]*TMath::Erf((TMath::Max([2],x)-[0])/(TMath::Sqrt(2)*[1]))+[3]',
-                            self.calDAC2Q_m[vfat]*1+self.calDAC2Q_b[vfat],self.calDAC2Q_m[vfat]*253+self.calDAC2Q_b[vfat])
-            fitTF1.SetLineColor(r.kBlack)
+                needsROOTFit = self.fitProbit(vfat, channels)
+            batchFitted = np.array(channels, dtype=bool) & np.logical_not(needsROOTFit)
+            if batchFitted.any():
+                self.fitTime[vfat][batchFitted] = (time.time() - batchStart) / np.count_nonzero(batchFitted)
+            if debug:
+                print 'vfat %i: %i channels converged in the batch fit'%(vfat, np.count_nonzero(~needsROOTFit))
+
+        for ch in range(0,128):
+            if not needsROOTFit[ch]:
+                continue
+
+            if debug:
+                print 'fitting vfat %i chan %i'%(vfat,ch)
+
+            if self.isDead[vfat][ch]:
+                fitTF1.SetLineColor(r.kGray)
+                continue # Don't try to fit dead channels
+            elif not (self.scanHistosContents[vfat][ch][1:-1].sum() > 0):
+                fitTF1.SetLineColor(r.kGray)
+                continue # Don't try to fit with 0 entries
+
+            chanStart = time.time()
+            if self.fitMode == "rootfitter":
+                binData = self.getBinData(vfat, ch, fitErrors[ch])
+            else:
+                rp.array2hist(self.scanHistosContents[vfat][ch], fitHisto, errors=fitErrors[ch])
             
-            if not debug:
-                print 'fitting vfat %i'%(vfat)
-
-            for ch in range(0,128):
-                if debug:
-                    print 'fitting vfat %i chan %i'%(vfat,ch)
-                
-                if self.isDead[vfat][ch]:
-                    fitTF1.SetLineColor(r.kGray)
-                    continue # Don't try to fit dead channels
-                elif not (self.scanHistos[vfat][ch].Integral() > 0):
-                    fitTF1.SetLineColor(r.kGray)
-                    continue # Don't try to fit with 0 entries
-                
-                fitChi2 = 0
-                MinChi2Temp = 99999999
-                stepN = 0
-                
-                if debug:
-                    print "| stepN | vfatN | vfatCH | isVFAT3 | p0_low | p0 | p0_high | p1_low | p1 | p1_high | p2_low | p2 | p2_high |"
-                    print "| ----- | ----- | ------ | ------- | ------ | -- | ------- | ------ | -- | ------- | ------ | -- | ------- |"
-                while(stepN < 30):
+            fitChi2 = 0
+            MinChi2Temp = 99999999
+            stepN = 0
+            nCalls = 0
+            nRestarts = 0
+            seeded = True # First fit starts from the analytic initial guess
+            random.SetSeed(128*vfat+ch+1)
+            
+            if debug:
+                print "| stepN | vfatN | vfatCH | isVFAT3 | p0_low | p0 | p0_high | p1_low | p1 | p1_high | p2_low | p2 | p2_high |"
+                print "| ----- | ----- | ------ | ------- | ------ | -- | ------- | ------ | -- | ------- | ------ | -- | ------- |"
+            while(stepN < 30):
+                restart = not seeded
+                if seeded:
+                    # Provide the analytic initial guess
+                    init_guess_p0, init_guess_p1, init_guess_p2, init_guess_p3 = init_guess[ch]
+                    seeded = False
+                else:
                     #rand = max(0.0, random.Gaus(10, 5)) # do not accept negative numbers
                     rand = abs(random.Gaus(10, 5)) # take positive definite numbers
 
@@ -292,122 +637,1144 @@ class ScanDataFitter(DeadChannelFinder):
                     init_guess_p1 = abs(self.calDAC2Q_m[vfat]*rand) #self.calDAC2Q_m[vfat] might be negative (e.g. VFAT3 case)
                     init_guess_p2 = 0.
                     init_guess_p3 = self.Nev[vfat][ch]/2.
+                    if self.fitROI: # The plateau is known from the saturated bins
+                        init_guess_p3 = init_guess[ch][3]
+                    pass
 
-                    fitTF1.SetParameter(0, init_guess_p0)
-                    fitTF1.SetParameter(1, init_guess_p1)
-                    fitTF1.SetParameter(2, init_guess_p2)
-                    fitTF1.SetParameter(3, init_guess_p3)
+                fitTF1.SetParameter(0, init_guess_p0)
+                fitTF1.SetParameter(1, init_guess_p1)
+                fitTF1.SetParameter(2, init_guess_p2)
+                fitTF1.SetParameter(3, init_guess_p3)
 
-                    # Set Parameter Limits
+                # Set Parameter Limits
+                if self.isVFAT3:
+                    fitTF1.SetParLimits(0, self.calDAC2Q_m[vfat]*(256)+self.calDAC2Q_b[vfat], self.calDAC2Q_m[vfat]*(1)+self.calDAC2Q_b[vfat])
+                    fitTF1.SetParLimits(1, 0.0, self.calDAC2Q_m[vfat]*(128)+self.calDAC2Q_b[vfat])
+                    fitTF1.SetParLimits(2, -0.01, self.Nev[vfat][ch])
+                else:
+                    fitTF1.SetParLimits(0, -0.01, self.calDAC2Q_m[vfat]*(256)+self.calDAC2Q_b[vfat])
+                    fitTF1.SetParLimits(1, 0.0,  self.calDAC2Q_m[vfat]*(128)+self.calDAC2Q_b[vfat])
+                    fitTF1.SetParLimits(2, -0.01, self.Nev[vfat][ch])
+                    pass
+
+                if self.fitROI:
+                    fitTF1.SetParLimits(3, plateauLimits[ch][0], plateauLimits[ch][1])
+                else:
+                    fitTF1.SetParLimits(3, 0.75*init_guess_p3, 1.25*init_guess_p3)
+                
+                if debug:
                     if self.isVFAT3:
-                        fitTF1.SetParLimits(0, self.calDAC2Q_m[vfat]*(256)+self.calDAC2Q_b[vfat], self.calDAC2Q_m[vfat]*(1)+self.calDAC2Q_b[vfat])
-                        fitTF1.SetParLimits(1, 0.0, self.calDAC2Q_m[vfat]*(128)+self.calDAC2Q_b[vfat])
-                        fitTF1.SetParLimits(2, -0.01, self.Nev[vfat][ch])
+                        print "| %i | %i | %i | %i | %f | %f | %f | %f | %f | %f | %f | %f | %f |"%(
+                                    stepN,
+                                    vfat,
+                                    ch,
+                                    self.isVFAT3,
+                                    self.calDAC2Q_m[vfat]*(256)+self.calDAC2Q_b[vfat],
+                                    init_guess_p0,
+                                    self.calDAC2Q_m[vfat]*(1)+self.calDAC2Q_b[vfat],
+                                    self.calDAC2Q_m[vfat]*(256)+self.calDAC2Q_b[vfat],
+                                    init_guess_p1,
+                                    self.calDAC2Q_m[vfat]*(128)+self.calDAC2Q_b[vfat],
+                                    -0.01,
+                                    init_guess_p2,
+                                    self.Nev[vfat][ch]
+                                )
                     else:
-                        fitTF1.SetParLimits(0, -0.01, self.calDAC2Q_m[vfat]*(256)+self.calDAC2Q_b[vfat])
-                        fitTF1.SetParLimits(1, 0.0,  self.calDAC2Q_m[vfat]*(128)+self.calDAC2Q_b[vfat])
-                        fitTF1.SetParLimits(2, -0.01, self.Nev[vfat][ch])
-                        pass
+                        print "| %i | %i | %i | %i | %f | %f | %f | %f | %f | %f | %f | %f | %f |"%(
+                                    stepN,
+                                    vfat,
+                                    ch,
+                                    self.isVFAT3,
+                                    -0.01,
+                                    init_guess_p0,
+                                    self.calDAC2Q_m[vfat]*(256)+self.calDAC2Q_b[vfat],
+                                    0.0,
+                                    init_guess_p1,
+                                    self.calDAC2Q_m[vfat]*(128)+self.calDAC2Q_b[vfat],
+                                    -0.01,
+                                    init_guess_p2,
+                                    self.Nev[vfat][ch]
+                                )
+
+                # Fit
+                if self.fitMode == "rootfitter":
+                    fitResult = self.fitBinData(rootFitter, binData, fitTF1, vfat, ch,
+                                                [init_guess_p0, init_guess_p1, init_guess_p2, init_guess_p3],
+                                                plateauLimits[ch] if self.fitROI else None)
+                else:
+                    fitResult = fitHisto.Fit('myERF','SQ')
+                nCalls += 1
+                if restart:
+                    nRestarts += 1
+                fitEmpty = fitResult.IsEmpty()
+                if fitEmpty:
+                    fitTF1.SetLineColor(r.kOrange-2)
+                    # Don't try to fit empty data again
+                    break
+                fitValid = fitResult.IsValid()
+                if not fitValid:
+                    continue
+                fitChi2 = fitTF1.GetChisquare()
+                fitNDF = fitTF1.GetNDF()
+                if restart:
+                    stepN +=1
+                if (fitChi2 < MinChi2Temp and fitChi2 > 0.0):
+                    self.scanFuncsParams[vfat][ch] = [ fitTF1.GetParameter(par) for par in range(0,4) ]
+                    self.scanFuncsColors[vfat][ch] = r.kBlue-2
+                    self.scanFitResults[0][vfat][ch] = fitTF1.GetParameter(0)
+                    self.scanFitResults[1][vfat][ch] = fitTF1.GetParameter(1)
+                    self.scanFitResults[2][vfat][ch] = fitTF1.GetParameter(2)
+                    self.scanFitResults[3][vfat][ch] = fitChi2
+                    self.scanFitResults[4][vfat][ch] = self.scanCount[vfat][ch]
+                    self.scanFitResults[5][vfat][ch] = fitNDF
+                    self.scanFitResults[6][vfat][ch] = fitValid
+                    self.fitValid[vfat][ch] = True
+                    MinChi2Temp = fitChi2
+                    pass
+                if (MinChi2Temp < 50): break
+                pass
+            self.fitNCalls[vfat][ch] = nCalls
+            self.fitNRestarts[vfat][ch] = nRestarts
+            self.fitStepN[vfat][ch] = stepN
+            self.fitStopChi2[vfat][ch] = (MinChi2Temp < 50)
+            self.fitTime[vfat][ch] = time.time() - chanStart
+            if debug:
+                print("Converged fit results:")
+                print "| stepN | vfatN | vfatCH | isVFAT3 | p0 | p1 | p2 | Chi2 | NDF | NormChi2"
+                print "| ----- | ----- | ------ | ------- | -- | -- | -- | Chi2 | NDF | NormChi2"
+                print "| %i | %i | %i | %i | %f | %f | %f | %f | %i | %f |"%(
+                        stepN,
+                        vfat,
+                        ch,
+                        self.isVFAT3,
+                        self.scanFitResults[0][vfat][ch],
+                        self.scanFitResults[1][vfat][ch],
+                        self.scanFitResults[2][vfat][ch],
+                        self.scanFitResults[3][vfat][ch],
+                        self.scanFitResults[5][vfat][ch],
+                        self.scanFitResults[3][vfat][ch] / self.scanFitResults[5][vfat][ch])
+                pass
+            pass
+        return
 
-                    fitTF1.SetParLimits(3, 0.75*init_guess_p3, 1.25*init_guess_p3)
-                    
-                    if debug:
-                        if self.isVFAT3:
-                            print "| %i | %i | %i | %i | %f | %f | %f | %f | %f | %f | %f | %f | %f |"%(
-                                        stepN,
-                                        vfat,
-                                        ch,
-                                        self.isVFAT3,
-                                        self.calDAC2Q_m[vfat]*(256)+self.calDAC2Q_b[vfat],
-                                        init_guess_p0,
-                                        self.calDAC2Q_m[vfat]*(1)+self.calDAC2Q_b[vfat],
-                                        self.calDAC2Q_m[vfat]*(256)+self.calDAC2Q_b[vfat],
-                                        init_guess_p1,
-                                        self.calDAC2Q_m[vfat]*(128)+self.calDAC2Q_b[vfat],
-                                        -0.01,
-                                        init_guess_p2,
-                                        self.Nev[vfat][ch]
-                                    )
-                        else:
-                            print "| %i | %i | %i | %i | %f | %f | %f | %f | %f | %f | %f | %f | %f |"%(
-                                        stepN,
-                                        vfat,
-                                        ch,
-                                        self.isVFAT3,
-                                        -0.01,
-                                        init_guess_p0,
-                                        self.calDAC2Q_m[vfat]*(256)+self.calDAC2Q_b[vfat],
-                                        0.0,
-                                        init_guess_p1,
-                                        self.calDAC2Q_m[vfat]*(128)+self.calDAC2Q_b[vfat],
-                                        -0.01,
-                                        init_guess_p2,
-                                        self.Nev[vfat][ch]
-                                    )
-
-                    # Fit
-                    fitResult = self.scanHistos[vfat][ch].Fit('myERF','SQ')
-                    fitEmpty = fitResult.IsEmpty()
-                    if fitEmpty:
-                        fitTF1.SetLineColor(kOrange-2)
-                        # Don't try to fit empty data again
+    def fitBinData(self, rootFitter, binData, fitTF1, vfat, ch, init_guess, p3Limits=None):
+        r"""
+        Fits one channel with a ``ROOT::Fit::Fitter``, with the same initial
+        values and parameter limits as ``TH1::Fit`` would use, see
+        :py:meth:`getParLimits`. The fitted parameters, :math:`\chi^2` and
+        NDF are copied to ``fitTF1``.
+
+        Args:
+            rootFitter (ROOT.Fit.Fitter): The fitter, its function must wrap
+                ``fitTF1``
+            binData (ROOT.Fit.BinData): The S-curve, see :py:meth:`getBinData`
+            fitTF1 (TF1): The fit function
+            vfat (int): The VFAT under consideration
+            ch (int): The channel under consideration
+            init_guess (list): The initial values of the four parameters
+            p3Limits (list): Limits of parameter 3, see :py:meth:`getParLimits`
+
+        Returns: The ``ROOT::Fit::FitResult``
+        """
+        lower, upper = self.getParLimits(vfat, self.Nev[vfat][ch], init_guess, p3Limits)
+        for par in range(0,4):
+            parSettings = rootFitter.Config().ParSettings(par)
+            parSettings.Release()
+            parSettings.RemoveLimits()
+            parSettings.SetValue(init_guess[par])
+            parSettings.SetStepSize(0.3 * abs(init_guess[par]) if init_guess[par] != 0 else 0.1)
+            if lower[par] == upper[par]:
+                parSettings.Fix()
+            elif np.isfinite(lower[par]) and np.isfinite(upper[par]):
+                parSettings.SetLimits(lower[par], upper[par])
+                pass
+            pass
+
+        rootFitter.Fit(binData)
+        fitResult = rootFitter.Result()
+        if not fitResult.IsEmpty():
+            fitTF1.SetParameters(fitResult.GetParams())
+            fitTF1.SetChisquare(fitResult.Chi2())
+            fitTF1.SetNDF(fitResult.Ndf())
+            pass
+
+        return fitResult
+
+    def fitBatch(self, vfat, channels=None):
+        r"""
+        Fits all channels of one VFAT at once with a bounded
+        Levenberg-Marquardt minimization of the same :math:`\chi^2` that
+        ``TH1::Fit`` minimizes, and populates the relevant class attributes
+        for the channels that converged.
+
+        The S-curves of the VFAT and their bin errors are taken as
+        ``[128,nBins]`` arrays from :py:attr:`scanHistosContents` and
+        :py:meth:`getFitErrors`.
+
+        Args:
+            vfat (int): The VFAT under consideration
+            channels (numpy.ndarray): 128 ``bool``, only the channels set to
+                ``True`` are fitted (default: all channels)
+
+        Returns: A ``numpy.ndarray`` of 128 ``bool``, ``True`` for the
+            channels that still need to be fitted by ROOT (dead, empty, not
+            converged or with a :math:`\chi^2` not below 50)
+        """
+        if channels is None:
+            channels = np.ones(128, dtype=bool)
+        needsROOTFit = np.array(channels, dtype=bool)
+
+        edges, scurves = self.getScurveArrays(vfat)
+        charge = 0.5 * (edges[:-1] + edges[1:])
+
+        toFit = needsROOTFit & np.logical_not(self.isDead[vfat]) & (scurves.sum(axis=1) > 0)
+        if not toFit.any():
+            return needsROOTFit
+
+        nEvts = np.array([ self.Nev[vfat][ch] if ch in self.Nev[vfat].keys() else scurves[ch].max() for ch in range(0,128) ], dtype=float)
+        init_guess = self.getInitialGuess(vfat)
+        plateauLimits = [ None for ch in range(0,128) ]
+        if self.fitROI:
+            plateauLimits = self.getROI(vfat)[2]
+
+        lowerLimits = np.zeros((128,4))
+        upperLimits = np.zeros((128,4))
+        for ch in range(0,128):
+            lowerLimits[ch], upperLimits[ch] = self.getParLimits(vfat, nEvts[ch], init_guess[ch], plateauLimits[ch])
+            pass
+
+        # p1 enters as a denominator, keep it strictly positive
+        lowerLimits[:,1] = np.maximum(lowerLimits[:,1], 1e-6 * abs(self.calDAC2Q_m[vfat]))
+
+        params, chi2, ndf, converged = _fitErfBatch(
+                charge,
+                scurves[toFit],
+                self.getFitErrors(vfat)[toFit,1:-1],
+                init_guess[toFit],
+                lowerLimits[toFit],
+                upperLimits[toFit])
+
+        for idx,ch in enumerate(np.flatnonzero(toFit)):
+            # Same acceptance as the ROOT fit, which restarts until chi2 < 50,
+            # a fit stuck in a bad local minimum is left to the ROOT fit
+            if not converged[idx] or not (chi2[idx] > 0.0 and chi2[idx] < 50):
+                continue
+
+            self.scanFuncsParams[vfat][ch] = params[idx]
+            self.scanFuncsColors[vfat][ch] = r.kBlue-2
+            self.scanFitResults[0][vfat][ch] = params[idx][0]
+            self.scanFitResults[1][vfat][ch] = params[idx][1]
+            self.scanFitResults[2][vfat][ch] = params[idx][2]
+            self.scanFitResults[3][vfat][ch] = chi2[idx]
+            self.scanFitResults[4][vfat][ch] = self.scanCount[vfat][ch]
+            self.scanFitResults[5][vfat][ch] = ndf[idx]
+            self.scanFitResults[6][vfat][ch] = True
+            self.fitValid[vfat][ch] = True
+            self.fitStopChi2[vfat][ch] = True
+            needsROOTFit[ch] = False
+            pass
+
+        return needsROOTFit
+
+    def fitProbit(self, vfat, channels=None):
+        r"""
+        Estimates the parameters of all channels of one VFAT at once without
+        iterations, and populates the relevant class attributes for the
+        channels where the estimate succeeded.
+
+        The plateau :math:`2p_3` is taken from :py:meth:`getInitialGuess` and
+        the pedestal :math:`p_2` is set to zero. In the transition region
+        (occupancy :math:`q` between 2% and 98% of the plateau) the model
+        gives
+
+        .. math::
+
+            \sqrt{2}\,\mathrm{erf}^{-1}(2q-1) = \frac{x-p_0}{p_1}
+
+        so :math:`p_0` and :math:`p_1` follow from a weighted linear
+        regression, see :py:func:`_probitEstimate`. The :math:`\chi^2` and NDF
+        are then computed against the original S-curve as ``TH1::Fit`` would.
+
+        Args:
+            vfat (int): The VFAT under consideration
+            channels (numpy.ndarray): 128 ``bool``, only the channels set to
+                ``True`` are fitted (default: all channels)
+
+        Returns: A ``numpy.ndarray`` of 128 ``bool``, ``True`` for the
+            channels that still need to be fitted by ROOT (dead, empty, failed
+            estimate or :math:`\chi^2/NDF` above :py:attr:`probitMaxChi2NDF`)
+        """
+        from scipy.special import erf
+
+        if channels is None:
+            channels = np.ones(128, dtype=bool)
+        needsROOTFit = np.array(channels, dtype=bool)
+
+        edges, scurves = self.getScurveArrays(vfat)
+        charge = 0.5 * (edges[:-1] + edges[1:])
+        errors = self.getFitErrors(vfat)[:,1:-1]
+
+        toFit = needsROOTFit & np.logical_not(self.isDead[vfat]) & (scurves.sum(axis=1) > 0)
+        if not toFit.any():
+            return needsROOTFit
+
+        params = self.getInitialGuess(vfat)[toFit]
+        params[:,2] = 0.
+        params[:,0], params[:,1], estimated = _probitEstimate(charge, scurves[toFit], errors[toFit], 2. * params[:,3])
+
+        # Same chi2 and NDF as TH1::Fit, empty bins are ignored
+        weights = np.zeros(errors[toFit].shape)
+        weights[errors[toFit] > 0] = 1. / errors[toFit][errors[toFit] > 0]**2
+        with np.errstate(divide='ignore', invalid='ignore'):
+            model = params[:,3,np.newaxis] * (erf((np.maximum(params[:,2,np.newaxis], charge[np.newaxis,:]) - params[:,0,np.newaxis]) / (np.sqrt(2) * params[:,1,np.newaxis])) + 1.)
+        chi2 = (weights * (scurves[toFit] - model)**2).sum(axis=1)
+        ndf = (weights > 0).sum(axis=1) - 4
+
+        good = estimated & np.isfinite(chi2) & (chi2 > 0.0) & (ndf > 0)
+        if self.probitMaxChi2NDF is not None:
+            good &= chi2 <= self.probitMaxChi2NDF * np.maximum(ndf, 1)
+
+        fitted = np.flatnonzero(toFit)[good]
+        results = np.column_stack((
+            params[good],
+            (r.kBlue-2) * np.ones(len(fitted)),
+            chi2[good],
+            ndf[good],
+            np.ones(len(fitted))))
+        self.setChannelResults(vfat, fitted, results)
+        needsROOTFit[fitted] = False
+
+        return needsROOTFit
+
+    def fitParallel(self, nWorkers, debug=False, channels=None, pool=None):
+        r"""
+        Fits the VFATs in a pool of worker processes, and merges the fit
+        parameters, :math:`\chi^2`, NDF and validity of each channel back
+        into the relevant class attributes.
+
+        The S-curves are shipped to the workers as arrays (see
+        :py:attr:`scanHistosContents`), each worker fits its VFAT with
+        :py:meth:`fitVFAT` using the same fitting backend as this object and
+        sends back the results of :py:meth:`getChannelResults` and
+        :py:meth:`getFitStats`.
+
+        Args:
+            nWorkers (int): Number of worker processes
+            debug (bool): Print extra debugging information
+            channels (list): For each VFAT, 128 ``bool``, only the channels
+                set to ``True`` are fitted (default: all channels)
+            pool (multiprocessing.Pool): Pool shared with other fits, e.g.
+                of other detectors, used instead of creating one with
+                ``nWorkers`` processes. It is left open.
+        """
+        from multiprocessing import Pool, TimeoutError
+
+        if channels is None:
+            channels = [ np.ones(128, dtype=bool) for vfat in range(0,24) ]
+
+        listOfTasks = []
+        for vfat in range(0,24):
+            if not channels[vfat].any():
+                continue
+            nEvts = np.array([ self.Nev[vfat][ch] if ch in self.Nev[vfat].keys() else 0 for ch in range(0,128) ], dtype=float)
+            listOfTasks.append((vfat, self.calDAC2Q_m, self.calDAC2Q_b, self.isVFAT3, self.fitMode, self.probitMaxChi2NDF,
+                                self.fitROI, self.roiMargin,
+                                self.scanHistosContents[vfat], self.scanHistosErrors[vfat], nEvts, self.isDead[vfat],
+                                self.seedParams[vfat], channels[vfat], debug))
+            pass
+
+        sharedPool = pool is not None
+        if not sharedPool:
+            pool = Pool(nWorkers)
+        try:
+            vfatResults = pool.imap_unordered(_fitVFATWorker, listOfTasks)
+            for idx in range(len(listOfTasks)):
+                # Wait for a VFAT to be fitted, a timeout keeps KeyboardInterrupt working
+                while True:
+                    try:
+                        vfat,results,stats = vfatResults.next(timeout=1)
                         break
-                    fitValid = fitResult.IsValid()
-                    if not fitValid:
-                        continue
-                    fitChi2 = fitTF1.GetChisquare()
-                    fitNDF = fitTF1.GetNDF()
-                    stepN +=1
-                    if (fitChi2 < MinChi2Temp and fitChi2 > 0.0):
-                        self.scanFuncs[vfat][ch] = fitTF1.Clone('scurveFit_vfat%i_chan%i_h'%(vfat,ch))
-                        self.scanFuncs[vfat][ch].SetLineColor(r.kBlue-2)
-                        self.scanFitResults[0][vfat][ch] = fitTF1.GetParameter(0)
-                        self.scanFitResults[1][vfat][ch] = fitTF1.GetParameter(1)
-                        self.scanFitResults[2][vfat][ch] = fitTF1.GetParameter(2)
-                        self.scanFitResults[3][vfat][ch] = fitChi2
-                        self.scanFitResults[4][vfat][ch] = self.scanCount[vfat][ch]
-                        self.scanFitResults[5][vfat][ch] = fitNDF
-                        self.scanFitResults[6][vfat][ch] = fitValid
-                        self.fitValid[vfat][ch] = True
-                        MinChi2Temp = fitChi2
+                    except TimeoutError:
                         pass
-                    if (MinChi2Temp < 50): break
-                    pass
-                if debug:
-                    print("Converged fit results:")
-                    print "| stepN | vfatN | vfatCH | isVFAT3 | p0 | p1 | p2 | Chi2 | NDF | NormChi2"
-                    print "| ----- | ----- | ------ | ------- | -- | -- | -- | Chi2 | NDF | NormChi2"
-                    print "| %i | %i | %i | %i | %f | %f | %f | %f | %i | %f |"%(
-                            stepN,
-                            vfat,
-                            ch,
-                            self.isVFAT3,
-                            self.scanFitResults[0][vfat][ch],
-                            self.scanFitResults[1][vfat][ch],
-                            self.scanFitResults[2][vfat][ch],
-                            self.scanFitResults[3][vfat][ch],
-                            self.scanFitResults[5][vfat][ch],
-                            self.scanFitResults[3][vfat][ch] / self.scanFitResults[5][vfat][ch])
                     pass
+                fitted = np.flatnonzero(channels[vfat])
+                self.setChannelResults(vfat, fitted, results[fitted])
+                self.fitNCalls[vfat][fitted] = stats[fitted,0]
+                self.fitNRestarts[vfat][fitted] = stats[fitted,1]
+                self.fitStepN[vfat][fitted] = stats[fitted,2]
+                self.fitStopChi2[vfat][fitted] = stats[fitted,3]
+                self.fitTime[vfat][fitted] = stats[fitted,4]
                 pass
+        except:
+            if not sharedPool:
+                pool.terminate()
+                pool.join()
+            raise
+
+        if not sharedPool:
+            pool.close()
+            pool.join()
+
+        return
+
+    def getBinData(self, vfat, ch, errors=None):
+        """
+        Returns the S-curve of one channel as a ``ROOT::Fit::BinData``. As
+        with ``TH1::Fit``, the bins with zero error in :py:meth:`getFitErrors`
+        are left out.
+
+        Args:
+            vfat (int): The VFAT under consideration
+            ch (int): The channel under consideration
+            errors (numpy.ndarray): The bin errors of the channel, including
+                underflow and overflow, if already computed
+        """
+        edges = self.scanHistosChargeBins[vfat]
+        charge = 0.5 * (edges[:-1] + edges[1:])
+        contents = self.scanHistosContents[vfat][ch][1:-1]
+        if errors is None:
+            errors = self.getFitErrors(vfat)[ch]
+        errors = errors[1:-1]
+        nonEmpty = np.flatnonzero(errors > 0)
+
+        binData = r.Fit.BinData(len(nonEmpty), 1)
+        for binX in nonEmpty:
+            binData.Add(float(charge[binX]), float(contents[binX]), float(errors[binX]))
             pass
-        return self.scanFitResults
-    
+
+        return binData
+
+    def getCacheKeys(self, vfat):
+        """
+        Computes, for each channel of one VFAT, a key identifying the fit in a
+        :py:class:`gempython.gemplotting.fitting.fitCache.FitCache`. The key
+        is a hash of everything the fit result depends on: the position of
+        the channel (it seeds the random restarts), the S-curve bin contents
+        and errors, the number of events, the initial guess from
+        :py:attr:`seedParams`, whether the channel is dead, the calibration of
+        the VFAT, the fitting backend and its options and
+        :py:data:`fitterVersion`.
+
+        Args:
+            vfat (int): The VFAT under consideration
+
+        Returns: A list of 128 ``str``
+        """
+        import hashlib
+
+        common = "%i %s %r %r %r %r %r %r"%(fitterVersion, self.fitMode, self.probitMaxChi2NDF, bool(self.fitROI), self.roiMargin,
+                                           bool(self.isVFAT3), float(self.calDAC2Q_m[vfat]), float(self.calDAC2Q_b[vfat]))
+        keys = []
+        for ch in range(0,128):
+            nEvts = self.Nev[vfat][ch] if ch in self.Nev[vfat].keys() else 0
+            chanHash = hashlib.sha1(common)
+            chanHash.update(" %i %i %r %r "%(vfat, ch, float(nEvts), bool(self.isDead[vfat][ch])))
+            chanHash.update(np.ascontiguousarray(self.scanHistosContents[vfat][ch], dtype=float).tobytes())
+            chanHash.update(np.ascontiguousarray(self.scanHistosErrors[vfat][ch], dtype=float).tobytes())
+            chanHash.update(np.ascontiguousarray(self.seedParams[vfat][ch], dtype=float).tobytes())
+            keys.append(chanHash.hexdigest())
+            pass
+
+        return keys
+
+    def getFitStats(self, vfat):
+        """
+        Returns the fit instrumentation of all channels of one VFAT packed in
+        one array.
+
+        Args:
+            vfat (int): The VFAT under consideration
+
+        Returns: A ``numpy.ndarray`` of ``float`` indexed as
+            ``[channel][idx]``, where ``idx`` 0 to 4 are
+            :py:attr:`fitNCalls`, :py:attr:`fitNRestarts`,
+            :py:attr:`fitStepN`, :py:attr:`fitStopChi2` and
+            :py:attr:`fitTime`
+        """
+        return np.column_stack((
+            self.fitNCalls[vfat],
+            self.fitNRestarts[vfat],
+            self.fitStepN[vfat],
+            self.fitStopChi2[vfat],
+            self.fitTime[vfat]))
+
+    def getChannelResults(self, vfat):
+        r"""
+        Returns the fit results of all channels of one VFAT packed in one
+        array, the inverse of :py:meth:`setChannelResults`.
+
+        Args:
+            vfat (int): The VFAT under consideration
+
+        Returns: A ``numpy.ndarray`` of ``float`` indexed as
+            ``[channel][idx]``, where ``idx`` 0 to 3 are the parameters of the
+            fit function, 4 its line color, 5 the :math:`\chi^2`, 6 the NDF
+            and 7 whether the fit is valid
+        """
+        return np.column_stack((
+            self.scanFuncsParams[vfat],
+            self.scanFuncsColors[vfat],
+            self.scanFitResults[3][vfat],
+            self.scanFitResults[5][vfat],
+            self.fitValid[vfat]))
+
+    def releaseVFAT(self, vfat):
+        """
+        Deletes the ``TH1D`` and ``TF1`` objects built by :py:meth:`getHisto`
+        and :py:meth:`getFunc` for all channels of one VFAT. The S-curves and
+        fit results are kept, the objects are built again if they are
+        accessed later.
+
+        Args:
+            vfat (int): The VFAT under consideration
+        """
+        for ch in range(0,128):
+            self.histoCache.pop((vfat,ch), None)
+            self.funcCache.pop((vfat,ch), None)
+            pass
+
+        return
+
+    def setChannelResults(self, vfat, channels, results):
+        """
+        Stores fit results packed as by :py:meth:`getChannelResults` and
+        populates the relevant class attributes.
+
+        Args:
+            vfat (int): The VFAT under consideration
+            channels (list): The channels under consideration
+            results (numpy.ndarray): The packed results, one row per entry of
+                ``channels``
+        """
+        for ch,result in zip(channels, results):
+            self.scanFuncsParams[vfat][ch] = result[0:4]
+            self.scanFuncsColors[vfat][ch] = int(result[4])
+            if not result[7]:
+                continue
+            self.scanFitResults[0][vfat][ch] = result[0]
+            self.scanFitResults[1][vfat][ch] = result[1]
+            self.scanFitResults[2][vfat][ch] = result[2]
+            self.scanFitResults[3][vfat][ch] = result[5]
+            self.scanFitResults[4][vfat][ch] = self.scanCount[vfat][ch]
+            self.scanFitResults[5][vfat][ch] = result[6]
+            self.scanFitResults[6][vfat][ch] = True
+            self.fitValid[vfat][ch] = True
+            pass
+
+        return
+
+    def getScurveArrays(self, vfat):
+        """
+        Returns the S-curves of one VFAT stacked as an array.
+
+        Args:
+            vfat (int): The VFAT under consideration
+
+        Returns: A tuple of ``numpy.ndarray`` where ``[0]`` are the charge bin
+            edges (``nBins+1`` entries) and ``[1]`` the bin contents of all
+            channels without underflow and overflow, indexed as
+            ``[channel][bin]``
+        """
+        return (self.scanHistosChargeBins[vfat], self.scanHistosContents[vfat][:,1:-1])
+
+    def getFitErrors(self, vfat):
+        """
+        Returns the bin errors used in the fits of one VFAT. They are the
+        errors of :py:attr:`scanHistosErrors`, except that when
+        :py:attr:`fitROI` is set the errors of the bins outside the region of
+        interest of :py:meth:`getROI` are set to zero, so that the fits ignore
+        these bins as they ignore empty bins.
+
+        Args:
+            vfat (int): The VFAT under consideration
+
+        Returns: A ``numpy.ndarray`` with the same layout as
+            :py:attr:`scanHistosErrors`, indexed as ``[channel][bin]``
+        """
+        errors = self.scanHistosErrors[vfat]
+        if not self.fitROI:
+            return errors
+
+        firstBin, lastBin = self.getROI(vfat)[0:2]
+        scurveBin = np.arange(self.nBins+2) - 1 # Remove the underflow
+        inROI = (scurveBin[np.newaxis,:] >= firstBin[:,np.newaxis]) & (scurveBin[np.newaxis,:] <= lastBin[:,np.newaxis])
+
+        return np.where(inROI, errors, 0.)
+
+    def getROI(self, vfat):
+        """
+        Finds the region of interest of the S-curves of one VFAT, see
+        :py:func:`_scurveROI`, with a margin of :py:attr:`roiMargin` bins.
+
+        Args:
+            vfat (int): The VFAT under consideration
+
+        Returns: A tuple of ``numpy.ndarray`` with, for each channel, the first
+            and last bin of the region (counted from zero, without underflow)
+            and the lower and upper limits of parameter 3 deduced from the
+            saturated bins
+        """
+        scurves = self.getScurveArrays(vfat)[1]
+
+        return _scurveROI(scurves, self.scanHistosErrors[vfat][:,1:-1], self.roiMargin)
+
+    def getInitialGuess(self, vfat):
+        """
+        Computes initial guesses of the fit parameters for all channels of one
+        VFAT directly from the S-curves, see :py:func:`_scurveInitialGuess`.
+        For channels with a previous fit in :py:attr:`seedParams`, the
+        threshold, noise and pedestal of that fit are used instead.
+
+        Args:
+            vfat (int): The VFAT under consideration
+
+        Returns: A ``numpy.ndarray`` of the four initial parameters, indexed as
+            ``[channel][parameter]``
+        """
+        edges, scurves = self.getScurveArrays(vfat)
+        init_guess = _scurveInitialGuess(0.5 * (edges[:-1] + edges[1:]), scurves)
+
+        seeded = np.isfinite(self.seedParams[vfat]).all(axis=1)
+        init_guess[seeded,0:3] = self.seedParams[vfat][seeded]
+
+        return init_guess
+
+    def getParLimits(self, vfat, nEvts, init_guess, p3Limits=None):
+        """
+        Returns the parameter limits of the fit function as seen by Minuit.
+
+        ``TH1::Fit`` treats a parameter whose limits satisfy ``low < high`` as
+        bounded, one whose limits satisfy ``low >= high`` (both non-zero) as
+        fixed, and otherwise leaves it free.  The limits used by the ROOT
+        backend are translated accordingly, a free parameter has infinite
+        limits and a fixed one has its limits set to its initial value.
+
+        Args:
+            vfat (int): The VFAT under consideration
+            nEvts (float): The number of events of the channel under
+                consideration
+            init_guess (list): The initial values of the four parameters
+            p3Limits (list): Lower and upper limits of parameter 3, by default
+                75% and 125% of its initial value
+
+        Returns: A tuple of two ``numpy.ndarray`` containing the lower and the
+            upper limits of the four parameters
+        """
+        if self.isVFAT3:
+            limits = [
+                    (self.calDAC2Q_m[vfat]*(256)+self.calDAC2Q_b[vfat], self.calDAC2Q_m[vfat]*(1)+self.calDAC2Q_b[vfat]),
+                    (0.0, self.calDAC2Q_m[vfat]*(128)+self.calDAC2Q_b[vfat]),
+                    (-0.01, nEvts) ]
+        else:
+            limits = [
+                    (-0.01, self.calDAC2Q_m[vfat]*(256)+self.calDAC2Q_b[vfat]),
+                    (0.0,  self.calDAC2Q_m[vfat]*(128)+self.calDAC2Q_b[vfat]),
+                    (-0.01, nEvts) ]
+            pass
+        if p3Limits is None:
+            limits.append((0.75*init_guess[3], 1.25*init_guess[3]))
+        else:
+            limits.append((p3Limits[0], p3Limits[1]))
+
+        lower = -np.inf * np.ones(4)
+        upper = np.inf * np.ones(4)
+        for par,(low,high) in enumerate(limits):
+            if low < high:
+                lower[par] = low
+                upper[par] = high
+            elif low * high != 0:
+                lower[par] = upper[par] = init_guess[par]
+                pass
+            pass
+
+        return (lower, upper)
+
     def getFunc(self, vfat, ch):
-        """Returns the fit function for the given VFAT and channel"""
-        return self.scanFuncs[vfat][ch]
+        """
+        Returns the fit function for the given VFAT and channel.
+
+        The ``TF1`` is built on first access and updated from
+        :py:attr:`scanFuncsParams`, :py:attr:`scanFuncsColors` and
+        :py:attr:`scanFitResults` on every access.
+        """
+        if (vfat,ch) not in self.funcCache:
+            if self.isVFAT3:
+                func = r.TF1('scurveFit_vfat%i_chan%i'%(vfat,ch),'[3]*TMath::Erf((TMath::Max([2],x)-[0])/(TMath::Sqrt(2)*[1]))+[3]',
+                        self.calDAC2Q_m[vfat]*253+self.calDAC2Q_b[vfat],self.calDAC2Q_m[vfat]*1+self.calDAC2Q_b[vfat])
+            else:
+                func = r.TF1('scurveFit_vfat%i_chan%i'%(vfat,ch),'[3]*TMath::Erf((TMath::Max([2],x)-[0])/(TMath::Sqrt(2)*[1]))+[3]',
+                        self.calDAC2Q_m[vfat]*1+self.calDAC2Q_b[vfat],self.calDAC2Q_m[vfat]*253+self.calDAC2Q_b[vfat])
+                pass
+            self.funcCache[(vfat,ch)] = func
+            pass
+
+        func = self.funcCache[(vfat,ch)]
+        func.SetParameters(*self.scanFuncsParams[vfat][ch])
+        func.SetLineColor(int(self.scanFuncsColors[vfat][ch]))
+        if self.fitValid[vfat][ch]:
+            func.SetChisquare(self.scanFitResults[3][vfat][ch])
+            func.SetNDF(int(self.scanFitResults[5][vfat][ch]))
+            pass
+
+        return func
+
+    def getHisto(self, vfat, ch):
+        """
+        Returns the S-curve histogram for the given VFAT and channel.
+
+        The ``TH1D`` is built on first access and filled from
+        :py:attr:`scanHistosContents` and :py:attr:`scanHistosErrors` on every
+        access. If the channel has a valid fit, the fit function is attached
+        to the histogram as ``TH1::Fit`` would do.
+        """
+        import root_numpy as rp
+
+        if (vfat,ch) not in self.histoCache:
+            edges = self.scanHistosChargeBins[vfat]
+            histo = r.TH1D('scurve_vfat%i_chan%i_h'%(vfat,ch),'scurve_vfat%i_chan%i_h'%(vfat,ch),
+                    self.nBins,edges[0],edges[-1])
+            histo.SetDirectory(0)
+            self.histoCache[(vfat,ch)] = histo
+            pass
+
+        histo = self.histoCache[(vfat,ch)]
+        rp.array2hist(self.scanHistosContents[vfat][ch], histo, errors=self.scanHistosErrors[vfat][ch])
+        histo.GetListOfFunctions().Delete()
+        if self.fitValid[vfat][ch]:
+            func = self.getFunc(vfat,ch).Clone('scurveFit_vfat%i_chan%i_h'%(vfat,ch))
+            r.SetOwnership(func, False) # Owned by the histogram
+            histo.GetListOfFunctions().Add(func)
+            pass
+
+        return histo
+
+    def setFunc(self, vfat, ch, func):
+        """
+        Stores the parameters and the line color of a fit function for the
+        given VFAT and channel.
+
+        Args:
+            vfat (int): The VFAT under consideration
+            ch (int): The channel under consideration
+            func (TF1): The fit function, with the same four parameters as
+                the S-curve model
+        """
+        self.scanFuncsParams[vfat][ch] = [ func.GetParameter(par) for par in range(0,4) ]
+        self.scanFuncsColors[vfat][ch] = func.GetLineColor()
+
+        return
+
+    def setHisto(self, vfat, ch, histo):
+        """
+        Stores the bin contents and errors of an S-curve histogram for the
+        given VFAT and channel. All channels of a VFAT share the same charge
+        binning, which is taken from ``histo``.
+
+        Args:
+            vfat (int): The VFAT under consideration
+            ch (int): The channel under consideration
+            histo (TH1): The S-curve, it must have :py:attr:`nBins` bins
+        """
+        import root_numpy as rp
+
+        if histo.GetNbinsX() != self.nBins:
+            print "ScanDataFitter.setHisto() - histogram '%s' has %i bins"%(histo.GetName(), histo.GetNbinsX())
+            print "ScanDataFitter.setHisto() - I was expecting %i bins"%(self.nBins)
+            raise LookupError
+
+        self.scanHistosChargeBins[vfat] = rp.hist2array(histo, return_edges=True)[1][0]
+        self.scanHistosContents[vfat][ch] = rp.hist2array(histo, include_overflow=True)
+        self.scanHistosErrors[vfat][ch] = [ histo.GetBinError(binX) for binX in range(0,self.nBins+2) ]
+
+        return
+
+    def readSeedFile(self, fitFileName, vfatIDs=None):
+        """
+        Reads the results of a previous fit, e.g. of an earlier scandate of
+        the same detector, and stores the threshold, noise and pedestal of
+        each channel in :py:attr:`seedParams`. Channels are matched by
+        ``vfatN`` and ``vfatCH``, channels without a fit (zero noise) are not
+        used.
+
+        Args:
+            fitFileName (string): Path to an ``SCurveFitData.root`` file
+                produced by :program:`anaUltraScurve.py`
+            vfatIDs (list): Chip ID of each VFAT position in the data to fit.
+                If given, a VFAT whose chip ID differs from the one found in
+                ``fitFileName`` is not seeded. An ID of zero is treated as
+                unknown and always matches.
+
+        Returns: The number of seeded channels
+        """
+        import root_numpy as rp
+
+        inF = r.TFile(fitFileName)
+        list_bNames = ['vfatN','vfatCH','vfatID','threshold','noise','pedestal']
+        fitData = rp.tree2array(tree=inF.scurveFitTree, branches=list_bNames)
+        inF.Close()
+
+        fitData = fitData[fitData['noise'] > 0]
+        if vfatIDs is not None:
+            vfatIDs = np.asarray(vfatIDs)
+            sameChip = (vfatIDs[fitData['vfatN']] == fitData['vfatID']) | (vfatIDs[fitData['vfatN']] == 0) | (fitData['vfatID'] == 0)
+            for vfat in np.unique(fitData['vfatN'][~sameChip]).tolist():
+                print "ScanDataFitter.readSeedFile() - VFAT%i has a different chip ID in %s, it will not be seeded"%(vfat, fitFileName)
+                pass
+            fitData = fitData[sameChip]
+            pass
+
+        for par,bName in enumerate(['threshold','noise','pedestal']):
+            self.seedParams[fitData['vfatN'],fitData['vfatCH'],par] = fitData[bName]
+            pass
+
+        return len(fitData)
 
     def readFile(self, treeFileName):
         """
         Reads data from an ``scurveData.root`` file produced by
         ``ultraScurve.py``.
         """
+        import root_numpy as rp
+
         inF = r.TFile(treeFileName)
-        for event in inF.scurveTree :
-            self.feed(event)
+        listOfBranches = [ branch.GetName() for branch in inF.scurveTree.GetListOfBranches() ]
+        list_bNames = ['vfatN','vfatCH','vcal','Nhits','Nev']
+        if self.isVFAT3 and "isCurrentPulse" in listOfBranches:
+            list_bNames.extend(['calSF','isCurrentPulse'])
+            pass
+        scurveData = rp.tree2array(tree=inF.scurveTree, branches=list_bNames)
+        inF.Close()
+
+        self.feedArrays(**dict((bName, scurveData[bName]) for bName in list_bNames))
+        return
+
+    def readScurveFile(self, scurveFileName):
+        """
+        Reads the S-curves and fit results stored by :py:meth:`writeScurveFile`.
+        The calibration and :py:attr:`isVFAT3` are taken from the file. No
+        ``ROOT`` object is built, :py:meth:`getHisto` and :py:meth:`getFunc`
+        rebuild the ``TH1D`` and ``TF1`` of a channel when it is accessed.
+
+        Args:
+            scurveFileName (string): Path to the file, see
+                :py:func:`getScurveFileName`
+        """
+        scurveFile = np.load(scurveFileName)
+
+        self.isVFAT3 = bool(scurveFile['isVFAT3'])
+        self.calDAC2Q_m = scurveFile['calDAC2Q_m']
+        self.calDAC2Q_b = scurveFile['calDAC2Q_b']
+        self.scanHistosChargeBins = scurveFile['chargeBins']
+        self.nBins = self.scanHistosChargeBins.shape[1]-1
+        self.scanHistosContents = scurveFile['contents'].reshape(24,128,self.nBins+2)
+        self.scanHistosErrors = scurveFile['errors'].reshape(24,128,self.nBins+2)
+        scanCount = scurveFile['scanCount'].reshape(24,128)
+        results = scurveFile['results'].reshape(24,128,-1)
+        scurveFile.close()
+
+        self.histoCache = {}
+        self.funcCache = {}
+        for vfat in range(0,24):
+            for ch in range(0,128):
+                self.scanCount[vfat][ch] = int(scanCount[vfat][ch])
+                pass
+            self.setChannelResults(vfat, range(0,128), results[vfat])
+            pass
+
+        return
+
+    def writeScurveFile(self, scurveFileName):
+        """
+        Writes the S-curves and the fit results of all channels to a ``numpy``
+        ``.npz`` file, as fixed-size arrays indexed by ``128*vfat+channel``.
+        This is the compact alternative to storing a ``TH1`` and a ``TF1``
+        per channel in the ``scurveFitTree``, see :py:meth:`readScurveFile`.
+
+        Args:
+            scurveFileName (string): Path to the file, see
+                :py:func:`getScurveFileName`
+        """
+        np.savez(
+                scurveFileName,
+                isVFAT3=self.isVFAT3,
+                calDAC2Q_m=np.asarray(self.calDAC2Q_m, dtype=float),
+                calDAC2Q_b=np.asarray(self.calDAC2Q_b, dtype=float),
+                chargeBins=self.scanHistosChargeBins,
+                contents=self.scanHistosContents.reshape(24*128,self.nBins+2),
+                errors=self.scanHistosErrors.reshape(24*128,self.nBins+2),
+                scanCount=np.array([ [ self.scanCount[vfat][ch] for ch in range(0,128) ] for vfat in range(0,24) ]).reshape(24*128),
+                results=np.concatenate([ self.getChannelResults(vfat) for vfat in range(0,24) ]))
+
         return
 
-def fitScanData(treeFileName, isVFAT3=False, calFileName=None):
+def getScurveFileName(fitFileName):
+    """
+    Returns the path of the file written by
+    :py:meth:`ScanDataFitter.writeScurveFile` next to an ``SCurveFitData.root``
+    file, e.g. ``SCurveFitData_scurves.npz``.
+
+    Args:
+        fitFileName (string): Path to the ``SCurveFitData.root`` file
+    """
+    import os
+    return "%s_scurves.npz"%(os.path.splitext(fitFileName)[0])
+
+def _fitVFATWorker(args):
+    r"""
+    Fits one VFAT in a worker process of :py:meth:`ScanDataFitter.fitParallel`.
+
+    A fresh :py:class:`ScanDataFitter` is loaded with the S-curves of the
+    VFAT, given as arrays, and fitted with :py:meth:`ScanDataFitter.fitVFAT`.
+    No ``ROOT`` object is built besides the ones used by the fit itself.
+
+    Returns: A tuple with the VFAT number, the fit results of
+        :py:meth:`ScanDataFitter.getChannelResults` and the instrumentation
+        of :py:meth:`ScanDataFitter.getFitStats`
+    """
+    (vfat, calDAC2Q_m, calDAC2Q_b, isVFAT3, fitMode, probitMaxChi2NDF, fitROI, roiMargin, contents, errors, nEvts, isDead, seedParams, channels, debug) = args
+
+    r.gROOT.SetBatch(True)
+    fitter = ScanDataFitter(calDAC2Q_m=calDAC2Q_m, calDAC2Q_b=calDAC2Q_b, isVFAT3=isVFAT3, fitMode=fitMode, probitMaxChi2NDF=probitMaxChi2NDF,
+                            fitROI=fitROI, roiMargin=roiMargin)
+    fitter.isDead[vfat] = np.array(isDead, dtype=bool)
+    fitter.scanHistosContents[vfat] = contents
+    fitter.scanHistosErrors[vfat] = errors
+    fitter.seedParams[vfat] = seedParams
+    for ch in range(0,128):
+        if not fitter.isDead[vfat][ch]:
+            fitter.Nev[vfat][ch] = nEvts[ch]
+        pass
+
+    fitter.fitVFAT(vfat, debug, channels)
+
+    return (vfat, fitter.getChannelResults(vfat), fitter.getFitStats(vfat))
+
+def _scurveInitialGuess(charge, scurves):
+    """
+    Computes analytic initial guesses of the S-curve fit parameters.
+
+    The plateau is the average content of the bins within 2% of the maximum.
+    The running maximum of each S-curve, normalized to the plateau, is then
+    interpolated to find the 16%, 50% and 84% crossings: the mean is the 50%
+    crossing and the width is half the distance between the 16% and 84%
+    crossings (at least half a bin).
+
+    Args:
+        charge (numpy.ndarray): Bin centers, shape ``[nBins]``
+        scurves (numpy.ndarray): Bin contents, shape ``[nCurves,nBins]``
+
+    Returns: A ``numpy.ndarray`` of the four initial parameters, indexed as
+        ``[curve][parameter]``
+    """
+    nCurves = len(scurves)
+    rows = np.arange(nCurves)
+
+    saturated = scurves >= 0.98 * scurves.max(axis=1)[:,np.newaxis]
+    plateau = (scurves * saturated).sum(axis=1) / np.maximum(saturated.sum(axis=1), 1)
+
+    cumulative = np.maximum.accumulate(scurves, axis=1) / np.where(plateau > 0, plateau, 1.)[:,np.newaxis]
+
+    def crossing(fraction):
+        high = np.argmax(cumulative >= fraction, axis=1)
+        low = np.maximum(high - 1, 0)
+        fLow = cumulative[rows,low]
+        fHigh = cumulative[rows,high]
+        step = np.where(fHigh > fLow, (fraction - fLow) / np.where(fHigh > fLow, fHigh - fLow, 1.), 0.)
+        return charge[low] + np.clip(step, 0., 1.) * (charge[high] - charge[low])
+
+    init_guess = np.zeros((nCurves,4))
+    init_guess[:,0] = crossing(0.50)
+    init_guess[:,1] = np.maximum(0.5 * (crossing(0.84) - crossing(0.16)), 0.5 * abs(charge[1] - charge[0]))
+    init_guess[:,3] = plateau / 2.
+
+    return init_guess
+
+def _scurveROI(scurves, errors, margin, low=0.02, high=0.98):
+    """
+    Finds the region of interest of many S-curves, i.e. the bins where the
+    running maximum of the S-curve goes from ``low`` to ``high`` times the
+    plateau, extended by ``margin`` bins on each side.
+
+    The plateau is the average content of the bins within 2% of the maximum,
+    as in :py:func:`_scurveInitialGuess`. Parameter 3 of the model is half
+    the plateau, it is limited to three standard errors of this average (at
+    least 0.5%).
+
+    Args:
+        scurves (numpy.ndarray): Bin contents, shape ``[nCurves,nBins]``
+        errors (numpy.ndarray): Bin errors, shape ``[nCurves,nBins]``
+        margin (int): Number of bins added on each side
+        low (float): Fraction of the plateau where the region starts
+        high (float): Fraction of the plateau where the region ends
+
+    Returns: A tuple of ``numpy.ndarray`` holding, for each curve, the first
+        and last bin of the region and the limits of parameter 3, shape
+        ``[nCurves,2]``
+    """
+    nBins = scurves.shape[1]
+
+    saturated = scurves >= 0.98 * scurves.max(axis=1)[:,np.newaxis]
+    nSaturated = np.maximum(saturated.sum(axis=1), 1)
+    plateau = (scurves * saturated).sum(axis=1) / nSaturated
+    plateauError = np.sqrt((errors**2 * saturated).sum(axis=1)) / nSaturated
+
+    cumulative = np.maximum.accumulate(scurves, axis=1) / np.where(plateau > 0, plateau, 1.)[:,np.newaxis]
+    firstBin = np.maximum(np.argmax(cumulative >= low, axis=1) - margin, 0)
+    lastBin = np.minimum(np.argmax(cumulative >= high, axis=1) + margin, nBins - 1)
+
+    halfWidth = np.maximum(3. * plateauError, 0.005 * plateau) / 2.
+    p3Limits = np.column_stack((plateau / 2. - halfWidth, plateau / 2. + halfWidth))
+
+    return (firstBin, lastBin, p3Limits)
+
+def _probitEstimate(x, y, sigma, plateau, low=0.02, high=0.98):
+    r"""
+    Estimates the mean and width of many S-curves sampled at the same points
+    by linearizing the model. With :math:`q = y / \mathrm{plateau}` the
+    normalized occupancy, the points with ``low < q < high`` are transformed
+    to :math:`z = \sqrt{2}\,\mathrm{erf}^{-1}(2q-1)` and
+    :math:`z = (x - p_0) / p_1` is fitted by a weighted linear regression. The
+    weight of a point is the inverse of the variance of :math:`z` propagated
+    from ``sigma``.
+
+    Args:
+        x (numpy.ndarray): Sampling points, shape ``[nBins]``
+        y (numpy.ndarray): Measured values, shape ``[nCurves,nBins]``
+        sigma (numpy.ndarray): Uncertainties on ``y``
+        plateau (numpy.ndarray): Plateau of each curve, shape ``[nCurves]``
+        low (float): Lowest normalized occupancy used
+        high (float): Highest normalized occupancy used
+
+    Returns: A tuple of ``numpy.ndarray`` holding the mean, the width and
+        whether the estimate succeeded (at least two points in the transition
+        region and a rising S-curve)
+    """
+    from scipy.special import erfinv
+
+    safePlateau = np.where(plateau > 0, plateau, 1.)[:,np.newaxis]
+    q = y / safePlateau
+    used = (q > low) & (q < high) & (sigma > 0) & (plateau[:,np.newaxis] > 0)
+
+    z = np.sqrt(2) * erfinv(2. * np.clip(q, low, high) - 1.)
+
+    # dz/dq = sqrt(2 pi) exp(z^2/2)
+    sigmaZ = np.sqrt(2. * np.pi) * np.exp(0.5 * z**2) * sigma / safePlateau
+    weights = np.zeros(y.shape)
+    weights[used] = 1. / sigmaZ[used]**2
+
+    sumW = weights.sum(axis=1)
+    sumX = (weights * x[np.newaxis,:]).sum(axis=1)
+    sumZ = (weights * z).sum(axis=1)
+    sumXX = (weights * x[np.newaxis,:]**2).sum(axis=1)
+    sumXZ = (weights * x[np.newaxis,:] * z).sum(axis=1)
+
+    denom = sumW * sumXX - sumX**2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = (sumW * sumXZ - sumX * sumZ) / denom
+        intercept = (sumZ - slope * sumX) / sumW
+        mean = -intercept / slope
+        width = 1. / slope
+
+    estimated = (used.sum(axis=1) >= 2) & (denom > 0) & (slope > 0) & np.isfinite(mean) & np.isfinite(width)
+    mean = np.where(estimated, mean, 0.)
+    width = np.where(estimated, width, 0.)
+
+    return (mean, width, estimated)
+
+def _fitErfBatch(x, y, sigma, params, lower, upper, maxIter=100, tolerance=1e-6):
+    r"""
+    Fits many S-curves sampled at the same points with the model
+
+    .. math::
+
+        f(x) = p_3 \left( \mathrm{erf}\left(\frac{\max(p_2,x)-p_0}{\sqrt{2}p_1}\right) + 1 \right)
+
+    using a Levenberg-Marquardt minimization of the :math:`\chi^2` of all
+    curves simultaneously.  Parameters are kept within their limits by
+    projecting each step onto the allowed box.  Points with ``sigma == 0`` are
+    ignored, as ``TH1::Fit`` ignores empty bins.
+
+    Args:
+        x (numpy.ndarray): Sampling points, shape ``[nBins]``
+        y (numpy.ndarray): Measured values, shape ``[nCurves,nBins]``
+        sigma (numpy.ndarray): Uncertainties on ``y``
+        params (numpy.ndarray): Initial parameters, shape ``[nCurves,4]``
+        lower (numpy.ndarray): Lower parameter limits, shape ``[nCurves,4]``
+        upper (numpy.ndarray): Upper parameter limits, shape ``[nCurves,4]``
+        maxIter (int): Maximum number of iterations
+        tolerance (float): Relative :math:`\chi^2` decrease below which a
+            curve is considered converged
+
+    Returns: A tuple of ``numpy.ndarray`` holding the fitted parameters, the
+        :math:`\chi^2`, the NDF and whether each curve converged
+    """
+    from scipy.special import erf
+
+    weights = np.zeros(y.shape)
+    weights[sigma > 0] = 1. / sigma[sigma > 0]**2
+    ndf = (weights > 0).sum(axis=1) - params.shape[1]
+
+    def evaluate(par):
+        u = (np.maximum(par[:,2,np.newaxis], x[np.newaxis,:]) - par[:,0,np.newaxis]) / (np.sqrt(2) * par[:,1,np.newaxis])
+        return u, par[:,3,np.newaxis] * (erf(u) + 1.)
+
+    params = np.clip(params, lower, upper)
+    u, f = evaluate(params)
+    chi2 = (weights * (y - f)**2).sum(axis=1)
+
+    damping = 1e-3 * np.ones(len(y))
+    active = np.isfinite(chi2)
+    converged = np.zeros(len(y), dtype=bool)
+    diag = np.arange(params.shape[1])
+    for iteration in range(0,maxIter):
+        if not active.any():
+            break
+        idx = np.flatnonzero(active)
+        par = params[idx]
+
+        # Jacobian of the model, shape [nActive,nBins,4]
+        gauss = par[:,3,np.newaxis] * 2. / np.sqrt(np.pi) * np.exp(-u[idx]**2)
+        jac = np.empty(u[idx].shape + (4,))
+        jac[...,0] = -gauss / (np.sqrt(2) * par[:,1,np.newaxis])
+        jac[...,1] = -gauss * u[idx] / par[:,1,np.newaxis]
+        jac[...,2] = np.where(x[np.newaxis,:] < par[:,2,np.newaxis], -jac[...,0], 0.)
+        jac[...,3] = erf(u[idx]) + 1.
+
+        # Damped normal equations, a small offset keeps parameters that do
+        # not enter the model (e.g. p2 below the first bin) solvable
+        jacW = jac * weights[idx][...,np.newaxis]
+        alpha = np.einsum('cbi,cbj->cij', jacW, jac)
+        beta = np.einsum('cbi,cb->ci', jacW, y[idx] - f[idx])
+        alphaDiag = alpha[:,diag,diag]
+        alpha[:,diag,diag] = (1. + damping[idx,np.newaxis]) * alphaDiag + 1e-12 * (alphaDiag.max(axis=1)[:,np.newaxis] + 1.)
+        step = np.linalg.solve(alpha, beta[...,np.newaxis])[...,0]
+
+        trial = np.clip(par + step, lower[idx], upper[idx])
+        uTrial, fTrial = evaluate(trial)
+        chi2Trial = (weights[idx] * (y[idx] - fTrial)**2).sum(axis=1)
+
+        better = chi2Trial < chi2[idx]
+        done = better & ((chi2[idx] - chi2Trial) <= tolerance * chi2[idx])
+
+        accepted = idx[better]
+        params[accepted] = trial[better]
+        u[accepted] = uTrial[better]
+        f[accepted] = fTrial[better]
+        chi2[accepted] = chi2Trial[better]
+        damping[accepted] /= 10.
+        damping[idx[~better]] *= 10.
+
+        # No step decreases chi2 anymore, the minimum is reached
+        done |= damping[idx] > 1e10
+        converged[idx[done]] = True
+        active[idx[done]] = False
+        pass
+
+    converged &= np.isfinite(chi2)
+
+    return (params, chi2, ndf, converged)
+
+def fitScanData(treeFileName, isVFAT3=False, calFileName=None, fitMode="root", probitMaxChi2NDF=None):
     """
     Helper function to fit scan data. Creates a :py:class:`ScanDataFitter`,
     loads the data and returns the results of :py:meth:`ScanDataFitter.fit`.
@@ -416,6 +1783,8 @@ def fitScanData(treeFileName, isVFAT3=False, calFileName=None):
         treeFileName (string): Path to the ``TFile`` that contains the scan data
         isVFAT3 (bool): Whether the detector uses VFAT3
         calFileName (string): Path to the file that contains calibration data
+        fitMode (string): Fitting backend, one of :py:data:`fitModes`
+        probitMaxChi2NDF (float): See :py:attr:`ScanDataFitter.probitMaxChi2NDF`
 
     .. seealso::
 
@@ -430,10 +1799,12 @@ def fitScanData(treeFileName, isVFAT3=False, calFileName=None):
         fitter = ScanDataFitter(
                 calDAC2Q_m = tuple_calInfo[0],
                 calDAC2Q_b = tuple_calInfo[1],
-                isVFAT3=isVFAT3
+                isVFAT3=isVFAT3,
+                fitMode=fitMode,
+                probitMaxChi2NDF=probitMaxChi2NDF
                 )
     else:
-        fitter = ScanDataFitter(isVFAT3=isVFAT3)
+        fitter = ScanDataFitter(isVFAT3=isVFAT3, fitMode=fitMode, probitMaxChi2NDF=probitMaxChi2NDF)
         pass
 
     # Read the output data
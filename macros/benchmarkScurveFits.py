@@ -0,0 +1,149 @@
+#!/bin/env python
+
+r"""
+``benchmarkScurveFits.py`` --- Compare the speed of the S-curve fit backends
+============================================================================
+
+Synopsis
+--------
+
+**benchmarkScurveFits.py** [*OPTIONS*]
+
+Description
+-----------
+
+This tool generates a detector worth of synthetic S-curves, with known mean
+and width, and fits them with each of the requested fitting backends of
+:py:class:`gempython.gemplotting.fitting.fitScanData.ScanDataFitter`. For each
+backend it prints the wall time of
+:py:meth:`~gempython.gemplotting.fitting.fitScanData.ScanDataFitter.fit`, the
+number of ``TH1::Fit``/``ROOT::Fit::Fitter`` calls, the number of valid fits
+and the median bias of the fitted mean and width.
+
+Arguments
+---------
+
+.. program:: benchmarkScurveFits.py
+
+.. option:: --fitModes <LIST>
+
+    Comma separated list of backends to benchmark, from
+    :py:data:`gempython.gemplotting.fitting.fitScanData.fitModes`. Default is
+    all of them.
+
+.. option:: --nEvts <NUMBER>
+
+    Number of pulses per point of the synthetic S-curves.
+
+.. option:: --nFitWorkers <NUMBER>
+
+    Number of worker processes used by the fit.
+
+.. option:: --nVFATs <NUMBER>
+
+    Number of VFATs filled with synthetic S-curves, the others are dead.
+
+.. option:: --seed <NUMBER>
+
+    Seed of the random generator used to make the synthetic S-curves.
+
+Example
+-------
+
+To compare the ROOT based backends on four VFATs:
+
+.. code-block:: bash
+
+    benchmarkScurveFits.py --fitModes=root,rootfitter --nVFATs=4
+"""
+
+def makeSyntheticScurves(fitter, nVFATs, nEvts, seed):
+    """
+    Fills the first ``nVFATs`` VFATs of a ``ScanDataFitter`` with S-curves
+    sampled from a binomial distribution, as :program:`ultraScurve.py` would
+    record them.
+
+    Args:
+        fitter (ScanDataFitter): The fitter to fill
+        nVFATs (int): Number of VFATs to fill
+        nEvts (int): Number of pulses per point
+        seed (int): Seed of the random generator
+
+    Returns: A tuple of ``numpy.ndarray`` with the true mean and width, indexed
+        as ``[vfat][channel]``
+    """
+    import numpy as np
+    from scipy.special import erf
+
+    random = np.random.RandomState(seed)
+    trueMean = np.zeros((24,128))
+    trueWidth = np.zeros((24,128))
+    for vfat in range(0,nVFATs):
+        edges = fitter.scanHistosChargeBins[vfat]
+        charge = 0.5 * (edges[:-1] + edges[1:])
+        low, high = min(edges[0], edges[-1]), max(edges[0], edges[-1])
+        trueMean[vfat] = random.uniform(low + 0.1 * (high - low), low + 0.5 * (high - low), 128)
+        trueWidth[vfat] = random.uniform(0.005, 0.02, 128) * (high - low)
+
+        occupancy = 0.5 * (1. + erf((charge[np.newaxis,:] - trueMean[vfat][:,np.newaxis]) / (np.sqrt(2) * trueWidth[vfat][:,np.newaxis])))
+        hits = random.binomial(nEvts, occupancy).astype(float)
+        fitter.scanHistosContents[vfat][:,1:-1] = hits
+        fitter.scanHistosErrors[vfat][:,1:-1] = np.sqrt(hits)
+        fitter.isDead[vfat][:] = False
+        for ch in range(0,128):
+            fitter.Nev[vfat][ch] = nEvts
+            fitter.scanCount[vfat][ch] = int(hits[ch][-1])
+            pass
+        pass
+
+    return (trueMean, trueWidth)
+
+if __name__ == '__main__':
+    import numpy as np
+    import time
+    from optparse import OptionParser
+    from gempython.gemplotting.fitting.fitScanData import fitModes, ScanDataFitter
+
+    parser = OptionParser()
+    parser.add_option("--fitModes", type="string", dest="fitModes", default=",".join(fitModes),
+                      help="Comma separated list of fitting backends to benchmark, from list: %s"%(str(fitModes)), metavar="fitModes")
+    parser.add_option("--nEvts", type="int", dest="nEvts", default=100,
+                      help="Number of pulses per point of the synthetic S-curves", metavar="nEvts")
+    parser.add_option("--nFitWorkers", type="int", dest="nFitWorkers", default=1,
+                      help="Number of worker processes used by the fit", metavar="nFitWorkers")
+    parser.add_option("--nVFATs", type="int", dest="nVFATs", default=24,
+                      help="Number of VFATs filled with synthetic S-curves", metavar="nVFATs")
+    parser.add_option("--seed", type="int", dest="seed", default=1,
+                      help="Seed of the random generator", metavar="seed")
+    (options, args) = parser.parse_args()
+
+    listOfFitModes = options.fitModes.split(",")
+    for fitMode in listOfFitModes:
+        if fitMode not in fitModes:
+            print "fitMode '%s' not supported, I was expecting one of the following: %s"%(fitMode, fitModes)
+            exit(1)
+            pass
+        pass
+
+    print "| fitMode | Fit Time (s) | Time per Channel (ms) | Fit Calls | Valid Fits | Median Mean Bias | Median Width Bias |"
+    print "| :-----: | :----------: | :-------------------: | :-------: | :--------: | :--------------: | :---------------: |"
+    for fitMode in listOfFitModes:
+        fitter = ScanDataFitter(calDAC2Q_m=0.05*np.ones(24), calDAC2Q_b=-0.8*np.ones(24), fitMode=fitMode)
+        trueMean, trueWidth = makeSyntheticScurves(fitter, options.nVFATs, options.nEvts, options.seed)
+
+        start = time.time()
+        fitter.fit(nWorkers=options.nFitWorkers)
+        fitTime = time.time() - start
+
+        fitValid = np.array(fitter.fitValid)[0:options.nVFATs]
+        meanBias = (np.array([ fitter.scanFitResults[0][vfat] for vfat in range(0,options.nVFATs) ]) - trueMean[0:options.nVFATs])[fitValid]
+        widthBias = (np.array([ fitter.scanFitResults[1][vfat] for vfat in range(0,options.nVFATs) ]) - trueWidth[0:options.nVFATs])[fitValid]
+        print "| %s | %.2f | %.3f | %i | %i | %f | %f |"%(
+                fitMode,
+                fitTime,
+                1000. * fitTime / (128 * options.nVFATs),
+                np.sum(fitter.fitNCalls),
+                np.count_nonzero(fitValid),
+                np.median(meanBias) if len(meanBias) else np.nan,
+                np.median(widthBias) if len(widthBias) else np.nan)
+        pass
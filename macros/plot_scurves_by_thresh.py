@@ -13,6 +13,8 @@ if __name__ == '__main__':
     strip = options.strip
 
     import ROOT as r
+    from gempython.gemplotting.macros.scurvePlottingUtitilities import getScurveFitter
+    fitter = getScurveFitter(filename)
     r.gStyle.SetOptStat(0)
 
     thr     = []
@@ -31,7 +33,11 @@ if __name__ == '__main__':
     for thresh in thr:
         for event in fitF.scurveFitTree:
             if (event.vthr == thresh) and (event.vfatN == vfat) and (event.ROBstr == strip):
-                Scurves.append((event.scurve_h).Clone())
+                if fitter is None:
+                    Scurves.append((event.scurve_h).Clone())
+                else:
+                    Scurves.append(fitter.getHisto(event.vfatN, event.vfatCH).Clone())
+                    pass
                 pass
             pass
         pass
@@ -3,6 +3,30 @@ scurvePlottingUtitilities
 =========================
 """
 
+def getScurveFitter(fit_filename):
+    """
+    Returns a ScanDataFitter holding the scurves and fits of fit_filename if its
+    scurveFitTree was written with the --lightFitTree option of anaUltraScurve.py,
+    otherwise None is returned and the scurve_h and scurve_fit branches should be used.
+    The TH1D and TF1 of a channel are only built when accessed through getHisto()
+    and getFunc() of the returned object.
+
+    fit_filename - TFile that holds the scurve fit data
+    """
+
+    import ROOT as r
+    from gempython.gemplotting.fitting.fitScanData import getScurveFileName, ScanDataFitter
+
+    fitFile = r.TFile(fit_filename)
+    listOfBranches = [ branch.GetName() for branch in fitFile.scurveFitTree.GetListOfBranches() ]
+    fitFile.Close()
+    if "scurve_h" in listOfBranches:
+        return None
+
+    fitter = ScanDataFitter()
+    fitter.readScurveFile(getScurveFileName(fit_filename))
+    return fitter
+
 def overlay_scurve(vfat, vfatCH, fit_filename=None, tupleTObjects=None, vfatChNotROBstr=True, debug=False):
     """
     Draws an scurve histogram and the fit to the scurve on a common canvas
@@ -31,11 +55,17 @@ def overlay_scurve(vfat, vfatCH, fit_filename=None, tupleTObjects=None, vfatChNo
 
     if fit_filename is not None:
         r.TH1.AddDirectory(False)
+        fitter = getScurveFitter(fit_filename)
         fitFile   = r.TFile(fit_filename)
         for event in fitFile.scurveFitTree:
             if (event.vfatN == vfat) and ((event.vfatCH == vfatCH and vfatChNotROBstr) or (event.ROBstr == vfatCH and not vfatChNotROBstr)):
-                scurveHisto = event.scurve_h.Clone()
-                scurveFit = event.scurve_fit.Clone()
+                if fitter is None:
+                    scurveHisto = event.scurve_h.Clone()
+                    scurveFit = event.scurve_fit.Clone()
+                else:
+                    scurveHisto = fitter.getHisto(event.vfatN, event.vfatCH).Clone()
+                    scurveFit = fitter.getFunc(event.vfatN, event.vfatCH).Clone()
+                    pass
                 pass
             pass
     elif tupleTObjects is not None:
@@ -110,6 +140,7 @@ def plot_vfat_summary(vfat, fit_filename, vfatChNotROBstr=True):
     vfatChNotROBstr - true if plotted for vfatCh; false if plotted for readout strip
     """
     import ROOT as r
+    fitter = getScurveFitter(fit_filename)
     fitF = r.TFile(fit_filename)
     Scurve = r.TH1D()
     if vfatChNotROBstr:
@@ -121,7 +152,11 @@ def plot_vfat_summary(vfat, fit_filename, vfatChNotROBstr=True):
     vSum.GetYaxis().SetTitleOffset(1.5)
     for event in fitF.scurveFitTree:
         if (event.vfatN == vfat):
-            Scurve = ((event.scurve_h).Clone())
+            if fitter is None:
+                Scurve = ((event.scurve_h).Clone())
+            else:
+                Scurve = fitter.getHisto(event.vfatN, event.vfatCH).Clone()
+                pass
             for valX in range(0, 256):
                 valY = Scurve.FindBin(valX)
                 if vfatChNotROBstr:
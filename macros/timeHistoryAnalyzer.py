@@ -105,7 +105,9 @@ General arguments
 
 .. option:: -i,--inputDir <DIRECTORY>
 
-    Input directory (=output directory of :program:`plotTimeSeries.py`)
+    Input directory (=output directory of :program:`plotTimeSeries.py`, or
+    directory holding the ``timeSeries.npz`` file written by
+    :program:`ana_scans.py` with ``--watch``)
 
 .. option:: --ranges <STRING>
 
@@ -0,0 +1,114 @@
+"""
+Tests of gempython.gemplotting.utils.anascheduler
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from gempython.gemplotting.utils.anascheduler import DAGNode, runDAG, runJobs
+
+def copyFile(inputName, outputName):
+    """Job of the tests: writes the content of inputName to outputName"""
+    with open(inputName) as inputFile:
+        content = inputFile.read()
+    with open(outputName, 'w') as outputFile:
+        outputFile.write(content)
+    return 0
+
+def failJob():
+    """Job of the tests: returns a failure status"""
+    return 1
+
+def dieJob():
+    """Job of the tests: kills its worker process"""
+    os._exit(1)
+
+class TestDAG(unittest.TestCase):
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        self.stateFileName = self.path('dagState.json')
+        self.writeFile('raw', 'data', age=3600.)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    def path(self, name):
+        return os.path.join(self.tmpDir, name)
+
+    def writeFile(self, name, content, age=0.):
+        """Writes a file modified age seconds ago"""
+        with open(self.path(name), 'w') as outFile:
+            outFile.write(content)
+        mtime = time.time() - age
+        os.utime(self.path(name), (mtime, mtime))
+
+    def makeNodes(self, fingerprint=''):
+        """A chain raw -> ana -> summary"""
+        return [
+            DAGNode('summary', copyFile, (self.path('ana'), self.path('summary')),
+                    inputs=[self.path('ana')], outputs=[self.path('summary')]),
+            DAGNode('ana', copyFile, (self.path('raw'), self.path('ana')),
+                    inputs=[self.path('raw')], outputs=[self.path('ana')], fingerprint=fingerprint)]
+
+    def runNodes(self, nodes, nWorkers=1):
+        return dict((key, status) for key, status, result, runtime, error
+                    in runDAG(nodes, nWorkers, self.stateFileName))
+
+    def test_isUpToDate(self):
+        self.writeFile('ana', 'data', age=60.)
+        node = self.makeNodes('opts')[1]
+        self.assertTrue(node.isUpToDate({'ana': 'opts'}))
+        self.assertFalse(node.isUpToDate({}))
+        self.assertFalse(node.isUpToDate({'ana': 'otherOpts'}))
+
+        # Input newer than the output
+        self.writeFile('raw', 'newData')
+        self.assertFalse(node.isUpToDate({'ana': 'opts'}))
+
+        # Without outputs
+        self.assertFalse(DAGNode('ana', copyFile, (), inputs=[self.path('raw')]).isUpToDate({'ana': ''}))
+
+    def test_rerun(self):
+        self.assertEqual(self.runNodes(self.makeNodes()), {'ana': 'done', 'summary': 'done'})
+        self.assertEqual(self.runNodes(self.makeNodes()), {'ana': 'skipped', 'summary': 'skipped'})
+
+        # A changed input reruns its job and the jobs depending on it
+        self.writeFile('raw', 'newData', age=-60.)
+        self.assertEqual(self.runNodes(self.makeNodes()), {'ana': 'done', 'summary': 'done'})
+        with open(self.path('summary')) as summaryFile:
+            self.assertEqual(summaryFile.read(), 'newData')
+
+        # A changed fingerprint reruns the job
+        results = self.runNodes(self.makeNodes('newOpts'))
+        self.assertEqual(results['ana'], 'done')
+
+    def test_failure(self):
+        for nWorkers in [1, 2]:
+            nodes = self.makeNodes()
+            nodes[1] = DAGNode('ana', failJob, (), inputs=[self.path('raw')], outputs=[self.path('ana')])
+            self.assertEqual(self.runNodes(nodes, nWorkers), {'ana': 'failed', 'summary': 'blocked'})
+            pass
+
+    def test_deadWorker(self):
+        nodes = self.makeNodes()
+        nodes[1] = DAGNode('ana', dieJob, (), inputs=[self.path('raw')], outputs=[self.path('ana')])
+        self.assertEqual(self.runNodes(nodes, 2), {'ana': 'failed', 'summary': 'blocked'})
+
+class TestRunJobs(unittest.TestCase):
+    def test_deadWorker(self):
+        results = dict((key, error) for key, result, runtime, error
+                       in runJobs(failJob, [('job%i' % idx, ()) for idx in range(3)], 2))
+        self.assertEqual(results, {'job0': None, 'job1': None, 'job2': None})
+
+        results = dict((key, error) for key, result, runtime, error
+                       in runJobs(dieJob, [('job%i' % idx, ()) for idx in range(2)], 2, maxTasksPerChild=1))
+        self.assertEqual(sorted(results.keys()), ['job0', 'job1'])
+        for error in results.values():
+            self.assertIn('died', error)
+            pass
+
+if __name__ == '__main__':
+    unittest.main()
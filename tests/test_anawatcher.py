@@ -0,0 +1,141 @@
+"""
+Tests of gempython.gemplotting.utils.anawatcher and of the time series it
+feeds in gempython.gemplotting.utils.anahistory
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import numpy as np
+
+from gempython.gemplotting.utils.anawatcher import ScanDateWatcher, isScanDate
+
+class TestScanDateWatcher(unittest.TestCase):
+    def setUp(self):
+        self.dataPath = tempfile.mkdtemp()
+        self.savedDataPath = os.environ.get('DATA_PATH')
+        os.environ['DATA_PATH'] = self.dataPath
+
+        from gempython.gemplotting.utils.anautilities import getDirByAnaType
+        self.dirPath = getDirByAnaType('scurve', 'GE11-X-S-TEST-0001')
+        self.stateFileName = os.path.join(self.dataPath, 'anaWatchState.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.dataPath)
+        if self.savedDataPath is None:
+            del os.environ['DATA_PATH']
+        else:
+            os.environ['DATA_PATH'] = self.savedDataPath
+
+    def makeScan(self, name, content='data', age=3600.):
+        """Creates a scandate directory holding a raw file modified age seconds ago"""
+        scanDir = os.path.join(self.dirPath, name)
+        if not os.path.isdir(scanDir):
+            os.makedirs(scanDir)
+        fileName = os.path.join(scanDir, 'SCurveData.root')
+        with open(fileName, 'w') as rawFile:
+            rawFile.write(content)
+        mtime = time.time() - age
+        os.utime(fileName, (mtime, mtime))
+
+    def findNew(self, watcher):
+        return watcher.findNewScanDates('scurve/GE11-X-S-TEST-0001', self.dirPath, 'SCurveData.root')
+
+    def test_isScanDate(self):
+        self.assertTrue(isScanDate('2019.01.31.23.59'))
+        self.assertFalse(isScanDate('current'))
+        self.assertFalse(isScanDate('2019.13.01.00.00'))
+        self.assertFalse(isScanDate('listOfScanDates.txt'))
+
+    def test_processedOnce(self):
+        self.makeScan('2019.01.02.00.00')
+        self.makeScan('2019.01.01.00.00')
+        self.makeScan('2019.01.03.00.00', age=0.)     # Still being written
+        self.makeScan('2019.01.04.00.00', content='') # Empty
+        self.makeScan('current')
+
+        # First pass: only the complete scans, sorted
+        watcher = ScanDateWatcher(self.stateFileName, settleTime=60., checkROOT=False)
+        newScanDates = self.findNew(watcher)
+        self.assertEqual(newScanDates, ['2019.01.01.00.00', '2019.01.02.00.00'])
+        for scandate in newScanDates:
+            watcher.markProcessed('scurve/GE11-X-S-TEST-0001/%s' % scandate, 0)
+
+        # Second pass: nothing new until the other scans are complete
+        self.assertEqual(self.findNew(watcher), [])
+        self.makeScan('2019.01.03.00.00')
+        self.makeScan('2019.01.04.00.00')
+        self.assertEqual(self.findNew(watcher), ['2019.01.03.00.00', '2019.01.04.00.00'])
+
+    def test_statePersists(self):
+        self.makeScan('2019.01.01.00.00')
+        self.makeScan('2019.01.02.00.00')
+
+        watcher = ScanDateWatcher(self.stateFileName, settleTime=60., checkROOT=False)
+        watcher.markProcessed('scurve/GE11-X-S-TEST-0001/2019.01.01.00.00', 0)
+        watcher.markProcessed('scurve/GE11-X-S-TEST-0001/2019.01.02.00.00', 2)
+
+        with open(self.stateFileName) as stateFile:
+            self.assertEqual(json.load(stateFile), {
+                'scurve/GE11-X-S-TEST-0001/2019.01.01.00.00': 0,
+                'scurve/GE11-X-S-TEST-0001/2019.01.02.00.00': 2})
+
+        # A restarted watcher does not process them again, failed ones included
+        restarted = ScanDateWatcher(self.stateFileName, settleTime=60., checkROOT=False)
+        self.assertEqual(self.findNew(restarted), [])
+        self.makeScan('2019.01.03.00.00')
+        self.assertEqual(self.findNew(restarted), ['2019.01.03.00.00'])
+
+try:
+    from root_numpy import array2root
+    HAVE_ROOT_NUMPY = True
+except ImportError:
+    HAVE_ROOT_NUMPY = False
+
+@unittest.skipUnless(HAVE_ROOT_NUMPY, 'requires ROOT and root_numpy')
+class TestAppendScanToTimeSeries(unittest.TestCase):
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    def makeFitFile(self, scandate, noise):
+        """Writes a scurveFitTree with the given noise in all channels"""
+        fitData = np.zeros(3072, dtype=[('vfatN', 'i4'), ('vfatCH', 'i4'), ('ROBstr', 'i4'),
+                                        ('mask', 'i4'), ('maskReason', 'i4'), ('noise', 'f4'),
+                                        ('threshold', 'f4'), ('ped_eff', 'f4')])
+        fitData['vfatN'] = np.repeat(np.arange(24), 128)
+        fitData['vfatCH'] = np.tile(np.arange(128), 24)
+        fitData['ROBstr'] = np.tile(np.arange(128)[::-1], 24)
+        fitData['noise'] = noise
+        fitData['threshold'] = 10 * noise + fitData['ROBstr']
+        fileName = os.path.join(self.tmpDir, '%s.root' % scandate)
+        array2root(fitData, fileName, treename='scurveFitTree', mode='recreate')
+        return fileName
+
+    def test_append(self):
+        from gempython.gemplotting.utils.anahistory import TimeSeriesData, appendScanToTimeSeries
+
+        timeSeriesFileName = os.path.join(self.tmpDir, 'timeSeries.npz')
+        # Out of order, and a scan analyzed twice
+        for scandate, noise in [('2019.01.02.00.00', 2.), ('2019.01.01.00.00', 1.),
+                                ('2019.01.03.00.00', 3.), ('2019.01.02.00.00', 4.)]:
+            appendScanToTimeSeries(timeSeriesFileName, scandate, self.makeFitFile(scandate, noise))
+
+        data = TimeSeriesData(self.tmpDir)
+        self.assertEqual(list(data.dates), ['2019.01.01.00.00', '2019.01.02.00.00', '2019.01.03.00.00'])
+        self.assertEqual(data.stripOrChanMode, 'ROBstr')
+        self.assertEqual(data.noise.shape, (24, 128, 3))
+        np.testing.assert_allclose(data.noise[5, 17], [1., 4., 3.])
+
+        # Indexed by strip
+        with np.load(timeSeriesFileName) as timeSeries:
+            np.testing.assert_allclose(timeSeries['threshold'][0, :, 0], 10. + np.arange(128))
+
+if __name__ == '__main__':
+    unittest.main()
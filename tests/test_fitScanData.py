@@ -0,0 +1,152 @@
+"""
+Tests of gempython.gemplotting.fitting.fitScanData
+"""
+
+import unittest
+
+import numpy as np
+
+from gempython.gemplotting.fitting.fitScanData import ScanDataFitter
+
+class _Event(object):
+    """An entry of the S-curve tree, as seen by ScanDataFitter.feed()"""
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+def makeScurveColumns(vfats, currentPulseVFATs=(), seed=1):
+    """
+    Returns the columns of a synthetic S-curve tree: a scan of all vcal values
+    for some channels of the given VFATs, in random order and with one
+    repeated entry. The VFATs in currentPulseVFATs are taken in current pulse
+    mode with a varying calSF.
+    """
+    rng = np.random.RandomState(seed)
+    columns = dict((name, []) for name in ['vfatN', 'vfatCH', 'vcal', 'Nhits', 'Nev', 'calSF', 'isCurrentPulse'])
+    for vfat in vfats:
+        for ch in rng.choice(128, 10, replace=False):
+            for vcal in range(0, 256):
+                columns['vfatN'].append(vfat)
+                columns['vfatCH'].append(ch)
+                columns['vcal'].append(vcal)
+                columns['Nhits'].append(rng.randint(0, 101))
+                columns['Nev'].append(100 + vfat)
+                columns['calSF'].append(ch % 4)
+                columns['isCurrentPulse'].append(int(vfat in currentPulseVFATs))
+                pass
+            pass
+        pass
+
+    columns = dict((name, np.array(values)) for name, values in columns.items())
+    order = rng.permutation(len(columns['vfatN']))
+    order = np.append(order, order[0]) # A repeated entry, the last one wins
+    return dict((name, values[order]) for name, values in columns.items())
+
+class TestFeedArrays(unittest.TestCase):
+    def assertSameFit(self, fitter, fitterArrays):
+        for vfat in range(0, 24):
+            np.testing.assert_array_equal(fitter.isDead[vfat], fitterArrays.isDead[vfat])
+            for ch in range(0, 128):
+                self.assertEqual(fitter.scanCount[vfat][ch], fitterArrays.scanCount[vfat][ch])
+                if ch in fitter.Nev[vfat].keys():
+                    self.assertEqual(fitter.Nev[vfat][ch], fitterArrays.Nev[vfat][ch])
+                else:
+                    self.assertNotIn(ch, fitterArrays.Nev[vfat].keys())
+                pass
+            pass
+        np.testing.assert_array_equal(fitter.scanHistosContents, fitterArrays.scanHistosContents)
+        np.testing.assert_array_equal(fitter.scanHistosErrors, fitterArrays.scanHistosErrors)
+
+    def compare(self, columns, isVFAT3, calDAC2Q_m, calDAC2Q_b, withCurrentPulse=True):
+        fitter = ScanDataFitter(calDAC2Q_m=calDAC2Q_m, calDAC2Q_b=calDAC2Q_b, isVFAT3=isVFAT3)
+        for idx in range(len(columns['vfatN'])):
+            fitter.feed(_Event(**dict((name, values[idx].item()) for name, values in columns.items())))
+            pass
+
+        fitterArrays = ScanDataFitter(calDAC2Q_m=calDAC2Q_m, calDAC2Q_b=calDAC2Q_b, isVFAT3=isVFAT3)
+        kwargs = {}
+        if withCurrentPulse:
+            kwargs = { 'calSF': columns['calSF'], 'isCurrentPulse': columns['isCurrentPulse'] }
+        fitterArrays.feedArrays(columns['vfatN'], columns['vfatCH'], columns['vcal'],
+                                columns['Nhits'], columns['Nev'], **kwargs)
+
+        self.assertTrue(np.count_nonzero(fitter.scanHistosContents) > 0)
+        self.assertSameFit(fitter, fitterArrays)
+
+    def test_VFAT2(self):
+        self.compare(makeScurveColumns([0, 5, 23]), False,
+                     0.03 * np.ones(24), -0.2 * np.ones(24))
+
+    def test_VFAT3(self):
+        self.compare(makeScurveColumns([0, 5, 23]), True,
+                     -0.25 * np.ones(24), 63. * np.ones(24), withCurrentPulse=False)
+
+    def test_VFAT3CurrentPulse(self):
+        self.compare(makeScurveColumns([0, 5, 23], currentPulseVFATs=[5, 23]), True,
+                     -0.25 * np.ones(24), 63. * np.ones(24))
+
+class TestBatchFits(unittest.TestCase):
+    """The batch fitting backends recover the parameters of synthetic S-curves"""
+
+    def setUp(self):
+        from scipy.special import erf
+
+        self.vfat = 3
+        self.nEvts = 1000
+        self.calDAC2Q_m = 0.03 * np.ones(24)
+        self.calDAC2Q_b = np.zeros(24)
+
+        rng = np.random.RandomState(2)
+        self.threshold = rng.uniform(2., 5., 128)
+        self.noise = rng.uniform(0.1, 0.4, 128)
+
+        vcal = np.tile(np.arange(256), 128)
+        vfatCH = np.repeat(np.arange(128), 256)
+        charge = self.calDAC2Q_m[self.vfat] * vcal + self.calDAC2Q_b[self.vfat]
+        occupancy = 0.5 * (1 + erf((charge - self.threshold[vfatCH]) / (np.sqrt(2) * self.noise[vfatCH])))
+        self.columns = {
+            'vfatN': self.vfat * np.ones(len(vcal), dtype=int),
+            'vfatCH': vfatCH,
+            'vcal': vcal,
+            'Nhits': rng.binomial(self.nEvts, occupancy),
+            'Nev': self.nEvts * np.ones(len(vcal), dtype=int)}
+
+    def makeFitter(self, fitMode):
+        fitter = ScanDataFitter(calDAC2Q_m=self.calDAC2Q_m, calDAC2Q_b=self.calDAC2Q_b, fitMode=fitMode)
+        fitter.feedArrays(**self.columns)
+        return fitter
+
+    def assertRecovered(self, fitter, needsROOTFit, thresholdTolerance, noiseTolerance):
+        fitted = np.logical_not(needsROOTFit)
+        self.assertTrue(np.count_nonzero(fitted) >= 120)
+        self.assertTrue(fitter.fitValid[self.vfat][fitted].all())
+        # feed() stores vcal v in the bin of vcal v-1, one calDAC step lower
+        threshold = self.threshold - self.calDAC2Q_m[self.vfat]
+        np.testing.assert_allclose(fitter.scanFitResults[0][self.vfat][fitted], threshold[fitted], atol=thresholdTolerance)
+        np.testing.assert_allclose(fitter.scanFitResults[1][self.vfat][fitted], self.noise[fitted], atol=noiseTolerance)
+
+    def test_fitBatch(self):
+        fitter = self.makeFitter("numpy")
+        needsROOTFit = fitter.fitBatch(self.vfat)
+        self.assertRecovered(fitter, needsROOTFit, 0.02, 0.02)
+
+        # Accepted fits stopped as the ROOT fit would, below chi2 = 50
+        fitted = np.logical_not(needsROOTFit)
+        self.assertTrue((fitter.scanFitResults[3][self.vfat][fitted] < 50).all())
+        self.assertTrue(fitter.fitStopChi2[self.vfat][fitted].all())
+
+    def test_fitProbit(self):
+        fitter = self.makeFitter("probit")
+        needsROOTFit = fitter.fitProbit(self.vfat)
+        self.assertRecovered(fitter, needsROOTFit, 0.03, 0.03)
+
+    def test_deadChannels(self):
+        # Channels without entries are left to the ROOT fit
+        kept = self.columns['vfatCH'] >= 2
+        self.columns = dict((name, values[kept]) for name, values in self.columns.items())
+        fitter = self.makeFitter("numpy")
+        needsROOTFit = fitter.fitBatch(self.vfat)
+        self.assertTrue(needsROOTFit[0] and needsROOTFit[1])
+        self.assertFalse(fitter.fitValid[self.vfat][0] or fitter.fitValid[self.vfat][1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -12,6 +12,76 @@ Documentation
 
 import numpy as _np
 
+#: Properties of the scurveFitTree kept by :py:func:`appendScanToTimeSeries`
+timeSeriesProperties = ['mask', 'maskReason', 'noise', 'threshold', 'ped_eff']
+
+def appendScanToTimeSeries(timeSeriesFileName, scandate, fitFileName, stripOrChanMode='ROBstr'):
+    """Adds the results of one scan to a time series stored in a ``.npz``
+    file, which :py:class:`TimeSeriesData` can read.
+
+    Only the new scan is read, the time series is updated without reading the
+    results of the previous scans again. A scan already in the time series is
+    replaced, and the scans are kept sorted by date.
+
+    Args:
+        timeSeriesFileName: Path to the ``.npz`` file, created if it does not
+            exist
+        scandate: Scan date, formatted as %Y.%m.%d.%H.%M
+        fitFileName: Path to a file containing the ``scurveFitTree`` TTree,
+            e.g. produced by anaUltraScurve.py
+        stripOrChanMode: Branch used as ``stripOrChan`` index, can be
+            ``ROBstr`` or ``vfatCH``
+    """
+    import os
+    import ROOT as r
+    from root_numpy import tree2array
+
+    fitFile = r.TFile(fitFileName, 'READ')
+    if fitFile.IsZombie():
+        raise IOError('Could not open %s' % fitFileName)
+    fitData = tree2array(tree=fitFile.scurveFitTree,
+                         branches=['vfatN', stripOrChanMode] + timeSeriesProperties)
+    fitFile.Close()
+
+    vfatN = fitData['vfatN'].astype(int)
+    stripOrChan = fitData[stripOrChanMode].astype(int)
+    newScan = {}
+    for prop in timeSeriesProperties:
+        newScan[prop] = _np.zeros((24, 128, 1))
+        newScan[prop][vfatN, stripOrChan, 0] = fitData[prop]
+        pass
+
+    timeSeries = {}
+    if os.path.isfile(timeSeriesFileName):
+        with _np.load(timeSeriesFileName) as timeSeriesFile:
+            timeSeries = dict((key, timeSeriesFile[key]) for key in timeSeriesFile.files)
+        if str(timeSeries['stripOrChanMode']) != stripOrChanMode:
+            raise RuntimeError('The time series in %s is indexed by %s, not %s' % (
+                timeSeriesFileName, timeSeries['stripOrChanMode'], stripOrChanMode))
+        pass
+
+    if len(timeSeries) == 0:
+        dates = _np.array([scandate])
+        for prop in timeSeriesProperties:
+            timeSeries[prop] = newScan[prop]
+            pass
+    else:
+        # Remove a previous analysis of the same scan
+        keep = timeSeries['dates'] != scandate
+        position = _np.searchsorted(timeSeries['dates'][keep], scandate)
+        dates = _np.insert(timeSeries['dates'][keep], position, scandate)
+        for prop in timeSeriesProperties:
+            timeSeries[prop] = _np.insert(timeSeries[prop][:,:,keep], [position], newScan[prop], axis=2)
+            pass
+        pass
+    timeSeries['dates'] = dates
+    timeSeries['stripOrChanMode'] = _np.array(stripOrChanMode)
+
+    # Write through a temporary file so that the previous time series survives a crash
+    tmpFileName = '%s.tmp%i.npz' % (timeSeriesFileName, os.getpid())
+    _np.savez(tmpFileName, **timeSeries)
+    os.rename(tmpFileName, timeSeriesFileName)
+
 class ChannelTimeRange(object):
     """Represents a range of scans in TimeSeriesData, for a given VFAT and
     strip/channel
@@ -280,7 +350,10 @@ class TimeSeriesData(object):
         """Creates a TimeSeriesData object by reading the files located in the
         inputDir directory.
 
-        The input directory must contain the following files:
+        If the input directory contains a ``timeSeries.npz`` file, written by
+        :py:func:`appendScanToTimeSeries` (e.g. in the watch mode of
+        ana_scans.py), it is read. Otherwise the input directory must contain
+        the following files:
 
         * gemPlotterOutput_mask_vs_scandate.root
         * gemPlotterOutput_maskReason_vs_scandate.root
@@ -291,6 +364,16 @@ class TimeSeriesData(object):
         Args:
             inputDir: The path to the input directory
         """
+        import os
+        if os.path.isfile('%s/timeSeries.npz' % inputDir):
+            with _np.load('%s/timeSeries.npz' % inputDir) as timeSeriesFile:
+                self.dates = timeSeriesFile['dates']
+                self.stripOrChanMode = str(timeSeriesFile['stripOrChanMode'])
+                self.mask = timeSeriesFile['mask']
+                self.maskReason = timeSeriesFile['maskReason']
+                self.noise = timeSeriesFile['noise']
+            return
+
         import ROOT as r
         from root_numpy import hist2array
 
@@ -0,0 +1,582 @@
+r"""
+``anascheduler`` --- Scheduling of analysis jobs on worker processes
+====================================================================
+
+.. code-block:: python
+
+    import gempython.gemplotting.utils.anascheduler
+
+Documentation
+-------------
+"""
+
+import json
+import os
+import time
+
+class DAGNode(object):
+    """
+    A job of :py:func:`runDAG`, it depends on the jobs writing its input files.
+
+    Attributes:
+        key (string): Unique name of the job
+        func (function): Function run by the job, as in :py:func:`runJobs`
+        args (tuple): Arguments of ``func``
+        inputs (list): Files read by the job
+        outputs (list): Files written by the job
+        fingerprint (string): Description of everything else the outputs
+            depend on, e.g. the options of the job
+    """
+
+    def __init__(self, key, func, args, inputs=None, outputs=None, fingerprint=""):
+        self.key = key
+        self.func = func
+        self.args = args
+        self.inputs = [ os.path.normpath(fileName) for fileName in (inputs or []) ]
+        self.outputs = [ os.path.normpath(fileName) for fileName in (outputs or []) ]
+        self.fingerprint = fingerprint
+
+        return
+
+    def isUpToDate(self, fingerprints):
+        """
+        Returns ``True`` if the job does not need to run again: all its
+        outputs exist and are newer than its inputs, and it last succeeded
+        with the same fingerprint. A job without outputs always runs.
+
+        Args:
+            fingerprints (dict): Fingerprint of the last successful run of
+                each job, indexed by job key
+        """
+        if len(self.outputs) == 0 or fingerprints.get(self.key) != self.fingerprint:
+            return False
+        for fileName in self.outputs:
+            if not os.path.isfile(fileName):
+                return False
+            pass
+
+        oldestOutput = min(os.path.getmtime(fileName) for fileName in self.outputs)
+        for fileName in self.inputs:
+            if os.path.isfile(fileName) and os.path.getmtime(fileName) > oldestOutput:
+                return False
+            pass
+
+        return True
+
+def _writeJSON(fileName, obj):
+    """
+    Writes obj to fileName as JSON, through a temporary file so that the
+    previous content survives a crash
+    """
+    tmpFileName = "%s.tmp%i"%(fileName, os.getpid())
+    with open(tmpFileName, "w") as jsonFile:
+        json.dump(obj, jsonFile, indent=1, sort_keys=True)
+    os.rename(tmpFileName, fileName)
+
+    return
+
+def getAvailableMemory():
+    """
+    Returns the memory available for new processes in MB, as reported by
+    ``MemAvailable`` in ``/proc/meminfo``, or ``None`` if it is unknown
+    """
+    try:
+        with open("/proc/meminfo", "r") as meminfo:
+            for line in meminfo:
+                if line.startswith("MemAvailable:"):
+                    return float(line.split()[1]) / 1024.
+                pass
+            pass
+    except IOError:
+        pass
+
+    return None
+
+def getNWorkers(nJobs, memPerJob=2000., maxWorkers=None):
+    """
+    Returns the number of worker processes to use for a set of jobs: one per
+    core, as long as each worker has ``memPerJob`` of available memory, and
+    never more than the number of jobs.
+
+    Args:
+        nJobs (int): Number of jobs
+        memPerJob (float): Memory used by one job, in MB
+        maxWorkers (int): If given, upper limit on the number of workers
+
+    Returns: An ``int``, at least 1
+    """
+    from multiprocessing import cpu_count
+
+    nWorkers = cpu_count()
+    availableMemory = getAvailableMemory()
+    if availableMemory is not None and memPerJob > 0:
+        nWorkers = min(nWorkers, int(availableMemory / memPerJob))
+        pass
+    if maxWorkers is not None:
+        nWorkers = min(nWorkers, maxWorkers)
+        pass
+
+    return max(1, min(nWorkers, nJobs))
+
+class RuntimeHistory(object):
+    """
+    Runtimes of previous jobs, stored in a JSON file and used to start the
+    longest jobs first.
+
+    Example:
+        Typical usage:
+
+        .. code-block:: python
+
+            history = RuntimeHistory("anaRuntimes.json")
+            for key, result, runtime, error in runJobs(func, jobs, 4, history):
+                pass
+            history.save()
+
+    Attributes:
+        fileName (string): Path to the JSON file
+        runtimes (dict): Runtime in seconds of the last successful run of each
+            job, indexed by job key
+    """
+
+    def __init__(self, fileName):
+        self.fileName = fileName
+        self.runtimes = {}
+
+        if fileName is not None and os.path.isfile(fileName):
+            try:
+                with open(fileName, "r") as historyFile:
+                    self.runtimes = dict(json.load(historyFile))
+            except ValueError:
+                print("Ignoring the unreadable runtime history %s"%(fileName))
+                pass
+            pass
+
+        return
+
+    def get(self, key, default=None):
+        """Returns the last runtime of a job, or ``default`` if it never ran"""
+        return self.runtimes.get(key, default)
+
+    def save(self):
+        """Writes the runtimes to :py:attr:`fileName`"""
+        if self.fileName is None:
+            return
+
+        _writeJSON(self.fileName, self.runtimes)
+        return
+
+    def sortLongestFirst(self, keys, historyKey=None):
+        """
+        Returns the job keys sorted by decreasing runtime. Jobs which never
+        ran may be long and come first.
+
+        Args:
+            keys (list): Keys of the jobs
+            historyKey (function): Maps a job key to the key of its runtime,
+                see :py:func:`runJobs`
+        """
+        if historyKey is None:
+            historyKey = lambda key: key
+        return sorted(keys, key=lambda key: -self.runtimes.get(historyKey(key), float("inf")))
+
+    def update(self, key, runtime):
+        """Stores the runtime of a job"""
+        self.runtimes[key] = runtime
+        return
+
+_startQueue = None
+
+def _initWorker(startQueue, initializer):
+    """
+    Initializer of the worker processes of :py:class:`WorkerPool`, stores
+    the queue in which :py:func:`_runJob` reports the jobs it starts
+    """
+    global _startQueue
+    _startQueue = startQueue
+    if initializer is not None:
+        initializer()
+
+    return
+
+def _runJob(args):
+    """
+    Runs one job of :py:func:`runJobs`, returns its key, result, runtime and
+    the formatted exception if it raised one
+    """
+    import traceback
+
+    func, key, jobArgs = args
+    if _startQueue is not None:
+        _startQueue.put((key, os.getpid()))
+        pass
+    start = time.time()
+    try:
+        return (key, func(*jobArgs), time.time() - start, None)
+    except Exception:
+        return (key, None, time.time() - start, traceback.format_exc())
+
+class WorkerPool(object):
+    """
+    A ``multiprocessing.Pool`` running :py:func:`_runJob`, which also
+    reports the jobs lost because their worker process died, e.g. in a
+    segmentation fault. The pool replaces the dead worker and runs the other
+    jobs, but never returns a result for the lost job.
+
+    Each worker reports the jobs it starts, a job is lost if its worker
+    exited and its result did not arrive within :py:attr:`gracePeriod`.
+    The workers ignore SIGINT, and waiting in :py:meth:`get` can be
+    interrupted with Ctrl-C.
+
+    Example:
+        Jobs run in the background:
+
+        .. code-block:: python
+
+            pool = WorkerPool(2)
+            for key in keys:
+                pool.submit(func, key, (key,))
+                pass
+            try:
+                for idx in range(len(keys)):
+                    key, result, runtime, error = pool.get()
+                    pass
+                pool.close()
+            except:
+                pool.terminate()
+                raise
+
+    Attributes:
+        pool (multiprocessing.Pool): The pool
+        gracePeriod (float): Time in seconds given to the result of a job to
+            arrive once its worker exited, e.g. after its last task with
+            ``maxtasksperchild``
+    """
+
+    gracePeriod = 5.
+
+    def __init__(self, nWorkers, initializer=None, maxTasksPerChild=None):
+        import Queue
+        import signal
+        from multiprocessing import Pool
+        from multiprocessing.queues import SimpleQueue
+
+        # Written without a feeder thread, the start of a job is reported even if the worker crashes right after
+        self._startQueue = SimpleQueue()
+        self._results = Queue.Queue()
+        self._running = {} # key -> [pid, start time, time its worker was found exited]
+        self._processes = {} # pid -> worker process
+        self._nLost = 0
+
+        # from: https://stackoverflow.com/questions/11312525/catch-ctrlc-sigint-and-exit-multiprocesses-gracefully-in-python
+        original_sigint_handler = signal.signal(signal.SIGINT, signal.SIG_IGN)
+        self.pool = Pool(nWorkers, _initWorker, (self._startQueue, initializer), maxTasksPerChild)
+        signal.signal(signal.SIGINT, original_sigint_handler)
+
+        return
+
+    def submit(self, func, key, args):
+        """Starts ``func(*args)`` as the job ``key``"""
+        self._keepProcesses()
+        self.pool.apply_async(_runJob, ((func, key, args),), callback=self._results.put)
+        return
+
+    def get(self):
+        """
+        Waits for a job to finish and returns ``(key, result, runtime,
+        error)`` as :py:func:`_runJob`. A lost job is returned with a
+        ``None`` result and an error describing the exit of its worker.
+        """
+        import Queue
+
+        while True:
+            # A timeout keeps KeyboardInterrupt working
+            try:
+                jobResult = self._results.get(timeout=1)
+                self._readStarts()
+                self._running.pop(jobResult[0], None)
+                return jobResult
+            except Queue.Empty:
+                pass
+
+            lostJob = self._findLostJob()
+            if lostJob is not None:
+                return lostJob
+            pass
+
+    def _readStarts(self):
+        """Stores the jobs started by the workers since the last call"""
+        while not self._startQueue.empty():
+            key, pid = self._startQueue.get()
+            self._running[key] = [pid, time.time(), None]
+            pass
+        self._keepProcesses()
+
+        return
+
+    def _keepProcesses(self):
+        """Keeps the worker processes, to get their exit code once the pool replaced them"""
+        for process in self.pool._pool:
+            self._processes[process.pid] = process
+            pass
+
+        return
+
+    def _findLostJob(self):
+        """Returns the result of a lost job as in :py:meth:`get`, or ``None``"""
+        self._readStarts()
+        alivePIDs = set(process.pid for process in self.pool._pool if process.exitcode is None)
+
+        now = time.time()
+        for key,running in self._running.items():
+            pid, start, exitTime = running
+            if pid in alivePIDs:
+                continue
+            if exitTime is None:
+                running[2] = now
+            elif now - exitTime > self.gracePeriod:
+                del self._running[key]
+                self._nLost += 1
+                error = "Worker process %i running the job died"%(pid)
+                if pid in self._processes:
+                    error += " (exit code %s)"%(self._processes[pid].exitcode)
+                    pass
+                return (key, None, now - start, error)
+            pass
+
+        return None
+
+    def close(self):
+        """Waits for the workers to exit once all jobs are done"""
+        if self._nLost > 0:
+            # The pool waits forever for the results of the lost jobs
+            self.terminate()
+            return
+
+        self.pool.close()
+        self.pool.join()
+        return
+
+    def terminate(self):
+        """Stops the workers now"""
+        self.pool.terminate()
+        self.pool.join()
+        return
+
+def runJobs(func, jobs, nWorkers=1, history=None, initializer=None, historyKey=None, maxTasksPerChild=None):
+    """
+    Runs ``func(*args)`` for each job, in a pool of worker processes, and
+    yields the results as the jobs finish. An exception raised by a job, or
+    the death of the worker process running it, is reported in its result,
+    the other jobs carry on.
+
+    The runtime of the successful jobs is stored in ``history``.
+
+    Args:
+        func (function): Function run by the jobs, it must be picklable, i.e.
+            defined at the top level of a module
+        jobs (list): Jobs as ``(key, args)`` tuples, where ``key`` is a
+            unique ``str`` identifying the job
+        nWorkers (int): Number of worker processes, if 1 and
+            ``maxTasksPerChild`` is ``None`` the jobs are run one after the
+            other in this process
+        history (RuntimeHistory): If given, the jobs are started longest first
+        initializer (function): Run once by each worker process when it starts
+        historyKey (function): Maps the key of a job to the key of its runtime
+            in ``history``, jobs sharing it are expected to take the same time
+            (default: the key of the job)
+        maxTasksPerChild (int): If given, a worker process is replaced after
+            running this number of jobs, e.g. 1 to run each job in a fresh
+            process
+
+    Returns: A generator of ``(key, result, runtime, error)`` tuples, where
+        ``error`` is ``None`` or the traceback of the exception raised by the
+        job
+    """
+    if historyKey is None:
+        historyKey = lambda key: key
+
+    dict_jobArgs = dict(jobs)
+    listOfKeys = [ key for key,args in jobs ]
+    if history is not None:
+        listOfKeys = history.sortLongestFirst(listOfKeys, historyKey)
+        pass
+    listOfTasks = [ (func, key, dict_jobArgs[key]) for key in listOfKeys ]
+
+    if nWorkers <= 1 and maxTasksPerChild is None:
+        for task in listOfTasks:
+            key, result, runtime, error = _runJob(task)
+            if history is not None and error is None:
+                history.update(historyKey(key), runtime)
+                pass
+            yield (key, result, runtime, error)
+            pass
+        return
+
+    pool = WorkerPool(nWorkers, initializer, maxTasksPerChild)
+    try:
+        for task in listOfTasks:
+            pool.submit(*task)
+            pass
+        for idx in range(len(listOfTasks)):
+            key, result, runtime, error = pool.get()
+            if history is not None and error is None:
+                history.update(historyKey(key), runtime)
+                pass
+            yield (key, result, runtime, error)
+            pass
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+
+    return
+
+def runDAG(nodes, nWorkers=1, stateFileName=None, initializer=None, history=None, historyKey=None, maxTasksPerChild=None):
+    """
+    Runs a set of :py:class:`DAGNode` jobs as make would: a job starts once
+    the jobs writing its inputs succeeded, and is skipped if it is up to date
+    (see :py:meth:`DAGNode.isUpToDate`). Independent jobs run in parallel.
+
+    A job fails if it raises an exception, its worker process dies or it
+    returns a value other than ``None`` or 0, the jobs depending on it are
+    then not run.
+
+    Args:
+        nodes (list): The :py:class:`DAGNode` jobs
+        nWorkers (int): Number of worker processes, as in :py:func:`runJobs`
+        stateFileName (string): JSON file storing the fingerprint of the last
+            successful run of each job, updated as the jobs succeed. If
+            ``None`` no job is considered up to date
+        initializer (function): Run once by each worker process when it starts
+        history (RuntimeHistory): If given, the ready jobs are started longest
+            first and the runtime of the successful jobs is stored in it
+        historyKey (function): As in :py:func:`runJobs`
+        maxTasksPerChild (int): As in :py:func:`runJobs`
+
+    Returns: A generator of ``(key, status, result, runtime, error)`` tuples,
+        in the order the jobs finish. ``status`` is one of "done", "skipped",
+        "failed" or "blocked" (not run because a job it depends on failed or,
+        for jobs in a dependency cycle, never ran). The other items are as in
+        :py:func:`runJobs`.
+    """
+    if historyKey is None:
+        historyKey = lambda key: key
+
+    fingerprints = {}
+    if stateFileName is not None and os.path.isfile(stateFileName):
+        try:
+            with open(stateFileName, "r") as stateFile:
+                fingerprints = dict(json.load(stateFile))
+        except ValueError:
+            print("Ignoring the unreadable state file %s"%(stateFileName))
+            pass
+        pass
+
+    # A job depends on the jobs writing its inputs
+    dict_nodes = dict((node.key, node) for node in nodes)
+    dict_producers = dict((fileName, node.key) for node in nodes for fileName in node.outputs)
+    dict_waitingFor = dict((node.key, set(dict_producers[fileName] for fileName in node.inputs
+                                          if fileName in dict_producers and dict_producers[fileName] != node.key))
+                           for node in nodes)
+    dict_dependents = dict((node.key, []) for node in nodes)
+    for key,dependencies in dict_waitingFor.items():
+        for dependency in dependencies:
+            dict_dependents[dependency].append(key)
+            pass
+        pass
+
+    listOfReady = [ node.key for node in nodes if len(dict_waitingFor[node.key]) == 0 ]
+    setOfFinished = set()
+    listOfResults = [] # results of the skipped jobs and of the jobs run in this process
+    nRunning = 0
+
+    pool = None
+    if nWorkers > 1 or maxTasksPerChild is not None:
+        pool = WorkerPool(nWorkers, initializer, maxTasksPerChild)
+        pass
+
+    try:
+        while len(listOfReady) > 0 or nRunning > 0:
+            # Start the ready jobs
+            if history is not None:
+                listOfReady = history.sortLongestFirst(listOfReady, historyKey)
+                pass
+            for key in listOfReady:
+                node = dict_nodes[key]
+                if node.isUpToDate(fingerprints):
+                    listOfResults.append((key, None, 0., None, True))
+                elif pool is None:
+                    listOfResults.append(_runJob((node.func, key, node.args)) + (False,))
+                else:
+                    pool.submit(node.func, key, node.args)
+                    pass
+                nRunning += 1
+                pass
+            listOfReady = []
+
+            # Wait for a job to finish
+            if len(listOfResults) > 0:
+                key, result, runtime, error, skipped = listOfResults.pop(0)
+            else:
+                key, result, runtime, error = pool.get()
+                skipped = False
+                pass
+            nRunning -= 1
+            setOfFinished.add(key)
+
+            if skipped:
+                status = "skipped"
+            elif error is None and result in (None, 0):
+                status = "done"
+                fingerprints[key] = dict_nodes[key].fingerprint
+                if stateFileName is not None:
+                    _writeJSON(stateFileName, fingerprints)
+                    pass
+                if history is not None:
+                    history.update(historyKey(key), runtime)
+                    pass
+            else:
+                status = "failed"
+                fingerprints.pop(key, None)
+                pass
+            yield (key, status, result, runtime, error)
+
+            if status == "failed":
+                # Everything depending on this job can't run
+                listOfBlocked = list(dict_dependents[key])
+                while len(listOfBlocked) > 0:
+                    blocked = listOfBlocked.pop()
+                    if blocked in setOfFinished:
+                        continue
+                    setOfFinished.add(blocked)
+                    listOfBlocked.extend(dict_dependents[blocked])
+                    yield (blocked, "blocked", None, 0., None)
+                    pass
+            else:
+                for dependent in dict_dependents[key]:
+                    dict_waitingFor[dependent].discard(key)
+                    if len(dict_waitingFor[dependent]) == 0 and dependent not in setOfFinished:
+                        listOfReady.append(dependent)
+                        pass
+                    pass
+                pass
+            pass
+
+        # Jobs in a dependency cycle never become ready
+        for node in nodes:
+            if node.key not in setOfFinished:
+                yield (node.key, "blocked", None, 0., None)
+                pass
+            pass
+
+        if pool is not None:
+            pool.close()
+            pass
+    except:
+        if pool is not None:
+            pool.terminate()
+            pass
+        raise
+
+    return
@@ -0,0 +1,145 @@
+r"""
+``anawatcher`` --- Detection of the scans landing in DATA_PATH
+==============================================================
+
+.. code-block:: python
+
+    import gempython.gemplotting.utils.anawatcher
+
+Documentation
+-------------
+"""
+
+import json
+import os
+import time
+
+def isScanDate(name):
+    """
+    Returns ``True`` if ``name`` is a scandate, i.e. a directory name in
+    ``YYYY.MM.DD.hh.mm`` format
+    """
+    try:
+        time.strptime(name, "%Y.%m.%d.%H.%M")
+    except ValueError:
+        return False
+
+    return True
+
+def isCompleteFile(fileName, settleTime=60., checkROOT=True):
+    """
+    Returns ``True`` if ``fileName`` is fully written: it exists, is not
+    empty, has not been modified for ``settleTime`` seconds and, if
+    ``checkROOT`` is ``True``, ROOT opens it without having to recover it.
+
+    Args:
+        fileName (string): Path to the file
+        settleTime (float): Time in seconds since the last modification after
+            which the DAQ is assumed to be done writing the file
+        checkROOT (bool): Also open the file with ROOT
+    """
+    try:
+        fileStat = os.stat(fileName)
+    except OSError:
+        return False
+    if fileStat.st_size == 0 or time.time() - fileStat.st_mtime < settleTime:
+        return False
+
+    if checkROOT:
+        import ROOT as r
+        rootFile = r.TFile.Open(fileName, "READ")
+        if not rootFile or rootFile.IsZombie():
+            return False
+        isComplete = not rootFile.TestBit(r.TFile.kRecovered)
+        rootFile.Close()
+        return isComplete
+
+    return True
+
+class ScanDateWatcher(object):
+    """
+    Finds the scandates of a set of directories which were not processed yet,
+    and remembers the processed ones in a JSON state file so that each
+    scandate is processed only once, also across restarts.
+
+    Example:
+        Typical usage:
+
+        .. code-block:: python
+
+            watcher = ScanDateWatcher("anaWatchState.json")
+            for scandate in watcher.findNewScanDates("scurve/GE11-X", dirPath, "SCurveData.root"):
+                status = analyze(dirPath, scandate)
+                watcher.markProcessed("scurve/GE11-X/%s"%(scandate), status)
+                pass
+
+    Attributes:
+        stateFileName (string): Path to the JSON file, if ``None`` the state
+            is not saved
+        settleTime (float): As in :py:func:`isCompleteFile`
+        checkROOT (bool): As in :py:func:`isCompleteFile`
+        processed (dict): Status of each processed scandate, indexed by key
+    """
+
+    def __init__(self, stateFileName=None, settleTime=60., checkROOT=True):
+        self.stateFileName = stateFileName
+        self.settleTime = settleTime
+        self.checkROOT = checkROOT
+        self.processed = {}
+
+        if stateFileName is not None and os.path.isfile(stateFileName):
+            try:
+                with open(stateFileName, "r") as stateFile:
+                    self.processed = dict(json.load(stateFile))
+            except ValueError:
+                print("Ignoring the unreadable state file %s"%(stateFileName))
+                pass
+            pass
+
+        return
+
+    def findNewScanDates(self, prefix, dirPath, rawFileName):
+        """
+        Returns the sorted list of scandates in ``dirPath`` whose key
+        ``prefix/scandate`` was not processed yet and which hold a complete
+        ``rawFileName``. Scandates whose file is still being written are
+        returned by a later call.
+
+        Args:
+            prefix (string): Prefix of the keys, e.g. ``anaType/chamber``
+            dirPath (string): Directory holding the scandate directories
+            rawFileName (string): Path to the raw data file inside a scandate
+                directory, e.g. from :py:data:`anaInfo.tree_names`
+        """
+        try:
+            listOfNames = os.listdir(dirPath)
+        except OSError:
+            return []
+
+        listOfScanDates = []
+        for scandate in sorted(listOfNames):
+            if not isScanDate(scandate) or "%s/%s"%(prefix, scandate) in self.processed:
+                continue
+            if isCompleteFile(os.path.join(dirPath, scandate, rawFileName), self.settleTime, self.checkROOT):
+                listOfScanDates.append(scandate)
+                pass
+            pass
+
+        return listOfScanDates
+
+    def markProcessed(self, key, status):
+        """
+        Stores the status of a processed scandate and writes the state file
+
+        Args:
+            key (string): Key of the scandate, ``prefix/scandate``
+            status: Any JSON serializable value, e.g. the exit code of the
+                analysis
+        """
+        self.processed[key] = status
+        if self.stateFileName is None:
+            return
+
+        from gempython.gemplotting.utils.anascheduler import _writeJSON
+        _writeJSON(self.stateFileName, self.processed)
+        return